@@ -12,6 +12,7 @@ fi
 if [[ $# -lt 1 ]]; then
     echo "usage: $0 [--no-heapdump] -n [namespace] [podname]"
     echo "example: $0 -n pulsar-testenv pod/pulsar-testenv-deployment-broker-0"
+    echo "each threaddump is followed by a 1 second per-thread CPU sample (top -H), which adds 1 second per round"
     exit 1
 fi
 
@@ -31,9 +32,20 @@ for i in 1 2 3; do
             echo "${java_commandline}" > $diagdir/commandline_${javapid}.txt
             cat /proc/$javapid/environ | xargs -0 -n 1 echo > $diagdir/environment_${javapid}.txt
         fi
+        # the threaddump is taken between two per-thread CPU counter snapshots, which threaddump_analyzer.py --os-cpu
+        # joins to it by native thread id (nid), so the CPU% of a round covers only the time around its threaddump
+        timestamp=$(date +%F-%H%M%S)
+        { cat /proc/uptime; cat /proc/$javapid/task/*/stat; } > $diagdir/taskstat_${javapid}_${timestamp}_1.txt 2>/dev/null
         # collect the threaddump with additional locking information
         echo "Creating threaddump..."
-        jstack -l $javapid > $diagdir/threaddump_${javapid}_$(date +%F-%H%M%S).txt
+        jstack -l $javapid > $diagdir/threaddump_${javapid}_${timestamp}.txt
+        if type -P top &>/dev/null; then
+            # top samples the CPU% over 1 second
+            top -H -b -d 1 -n 2 -p $javapid > $diagdir/topthreads_${javapid}_${timestamp}.txt 2>/dev/null
+        else
+            sleep 1
+        fi
+        { cat /proc/uptime; cat /proc/$javapid/task/*/stat; } > $diagdir/taskstat_${javapid}_${timestamp}_2.txt 2>/dev/null
         # collect a heap dump on 1. round
         if [[ $i -eq 1 && "$NO_HEAPDUMP" != "1" ]]; then
             echo "Creating heapdump..."
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""Analyze JDK unified logging GC logs (-Xlog:gc*) of G1 and ZGC collected from Pulsar pods.
+
+Reads plain, rotated (pulsar_gc_<pid>.log.0, .1, ...) and gzipped log files, directories and
+the tar.gz archives written by collect_pulsar_gc_logs_from_pod.sh. The logs of each pod are
+parsed in a separate worker process, line by line, into one compact record per GC.
+"""
+import fnmatch
+import glob
+import gzip
+import io
+import math
+import os
+import re
+import sys
+import tarfile
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+GC_LOG_PATTERN = "*gc*.log*"
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+COLLECTOR_ARCHIVE_PATTERN = re.compile(r'^pulsar_gc_logs_(.+?)_(.+)_\d{4}-\d{2}-\d{2}-\d{6}\.tar\.gz$')
+
+@dataclass(slots=True)
+class GcRecord:
+    gc_id: int
+    seconds: float = 0.0  # uptime, or epoch seconds when the log has no uptime decoration
+    timestamp: str = ""
+    pauses: List[Tuple[str, float]] = field(default_factory=list)  # (pause type, ms)
+    cause: str = ""
+    heap_before: Optional[float] = None  # MB
+    heap_after: Optional[float] = None
+    heap_capacity: Optional[float] = None
+    old_regions: Optional[Tuple[int, int]] = None
+    humongous_regions: Optional[Tuple[int, int]] = None
+    concurrent_ms: List[float] = field(default_factory=list)
+    full: bool = False
+    to_space_exhausted: bool = False
+    young: bool = False
+
+@dataclass
+class GcLogSegment:
+    """GC records of one log file of a rotated set."""
+    filename: str
+    collector: str = ""
+    region_size_mb: float = 0.0
+    records: List[GcRecord] = field(default_factory=list)
+    allocation_stalls: List[float] = field(default_factory=list)  # ZGC stalls of application threads, ms
+
+    @property
+    def first_seconds(self) -> float:
+        return self.records[0].seconds if self.records else float("inf")
+
+class GcLogParser:
+    """Line by line parser for unified logging GC output.
+
+    Only the decorations are needed for timing: uptime ([12.345s] or [12345ms]) is preferred,
+    the wall clock time ([2024-05-01T10:00:00.123+0000]) is used when the uptime is missing.
+    """
+    LINE_PATTERN = re.compile(r'^((?:\[[^\]]*\])+)\s*(.*)$')
+    GC_ID_PATTERN = re.compile(r'^GC\((\d+)\) (.*)$')
+    G1_PAUSE_PATTERN = re.compile(r'^Pause (\w+)(.*?)\s+(\d+(?:\.\d+)?)([KMG])->(\d+(?:\.\d+)?)([KMG])'
+                                  r'\((\d+(?:\.\d+)?)([KMG])\) ([\d.]+)ms$')
+    PARENTHESES_PATTERN = re.compile(r'\(((?:[^()]|\([^()]*\))*)\)')
+    # generational ZGC prefixes the phases of major collections with Y: and O:, of minor ones with y:
+    PHASE_PAUSE_PATTERN = re.compile(r'^(?:[yYO]: )?Pause ([A-Za-z ]+?)(?: \([^)]*\))? ([\d.]+)ms$')
+    CONCURRENT_CYCLE_PATTERN = re.compile(r'^Concurrent (?:Mark|Undo) Cycle ([\d.]+)ms$')
+    ZGC_COLLECTION_PATTERN = re.compile(r'^((?:Garbage|Major|Minor) Collection) \((.*?)\)'
+                                        r'(?: (\d+)M\(\d+%\)->(\d+)M\(\d+%\))?(?: ([\d.]+)s)?$')
+    REGIONS_PATTERN = re.compile(r'^(Old|Humongous) regions: (\d+)->(\d+)')
+    REGION_SIZE_PATTERN = re.compile(r'Heap [Rr]egion [Ss]ize: (\d+)([KMG])')
+    COLLECTOR_PATTERN = re.compile(r'^Using (G1|The Z Garbage Collector|Shenandoah|Parallel|Serial)')
+    ALLOCATION_STALL_PATTERN = re.compile(r'Allocation Stall \(.*\) ([\d.]+)ms')
+    UPTIME_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)(s|ms)$')
+    TIME_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T')
+    UNITS_MB = {"K": 1 / 1024, "M": 1.0, "G": 1024.0}
+
+    def __init__(self, filename: str):
+        self.segment = GcLogSegment(filename)
+        self.records: Dict[int, GcRecord] = {}
+        self.collection_starts: Dict[int, float] = {}
+
+    def _decorations(self, decorations: str) -> Tuple[Optional[float], str]:
+        uptime = None
+        timestamp = ""
+        for decoration in decorations[1:-1].split("]["):
+            decoration = decoration.strip()
+            uptime_match = self.UPTIME_PATTERN.match(decoration)
+            if uptime_match:
+                uptime = float(uptime_match.group(1)) / (1000 if uptime_match.group(2) == "ms" else 1)
+            elif self.TIME_PATTERN.match(decoration):
+                timestamp = decoration
+        return uptime, timestamp
+
+    @staticmethod
+    def _epoch_seconds(timestamp: str) -> float:
+        try:
+            return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%f%z").timestamp()
+        except ValueError:
+            return 0.0
+
+    def _record(self, gc_id: int, seconds: float, timestamp: str) -> GcRecord:
+        record = self.records.get(gc_id)
+        if record is None:
+            record = self.records[gc_id] = GcRecord(gc_id, seconds, timestamp)
+        return record
+
+    def parse(self, lines: Iterable[str]) -> GcLogSegment:
+        for line in lines:
+            match = self.LINE_PATTERN.match(line)
+            if not match:
+                continue
+            message = match.group(2).rstrip()
+            gc_match = self.GC_ID_PATTERN.match(message)
+            if gc_match is None:
+                self._parse_global(message)
+                continue
+            uptime, timestamp = self._decorations(match.group(1))
+            seconds = uptime if uptime is not None else self._epoch_seconds(timestamp)
+            self._parse_gc(self._record(int(gc_match.group(1)), seconds, timestamp), gc_match.group(2), seconds)
+        self.segment.records = sorted(self.records.values(), key=lambda record: (record.seconds, record.gc_id))
+        return self.segment
+
+    def _parse_global(self, message: str) -> None:
+        collector_match = self.COLLECTOR_PATTERN.match(message)
+        if collector_match:
+            self.segment.collector = "ZGC" if collector_match.group(1).startswith("The Z") else collector_match.group(1)
+            return
+        region_match = self.REGION_SIZE_PATTERN.search(message)
+        if region_match:
+            self.segment.region_size_mb = float(region_match.group(1)) * self.UNITS_MB[region_match.group(2)]
+            return
+        stall_match = self.ALLOCATION_STALL_PATTERN.search(message)
+        if stall_match:
+            self.segment.allocation_stalls.append(float(stall_match.group(1)))
+
+    def _parse_gc(self, record: GcRecord, message: str, seconds: float) -> None:
+        pause_match = self.G1_PAUSE_PATTERN.match(message)
+        if pause_match:
+            kind = pause_match.group(1)
+            parts = self.PARENTHESES_PATTERN.findall(pause_match.group(2))
+            label = f"{kind} ({parts[0]})" if kind == "Young" and parts else kind
+            record.pauses.append((label, float(pause_match.group(9))))
+            if kind == "Full" or len(parts) > 1:
+                record.cause = parts[-1] if parts else ""
+            record.full = record.full or kind == "Full"
+            record.young = record.young or kind == "Young"
+            units = self.UNITS_MB
+            record.heap_before = float(pause_match.group(3)) * units[pause_match.group(4)]
+            record.heap_after = float(pause_match.group(5)) * units[pause_match.group(6)]
+            record.heap_capacity = float(pause_match.group(7)) * units[pause_match.group(8)]
+            return
+        phase_match = self.PHASE_PAUSE_PATTERN.match(message)
+        if phase_match:
+            record.pauses.append((phase_match.group(1), float(phase_match.group(2))))
+            return
+        cycle_match = self.CONCURRENT_CYCLE_PATTERN.match(message)
+        if cycle_match:
+            record.concurrent_ms.append(float(cycle_match.group(1)))
+            return
+        collection_match = self.ZGC_COLLECTION_PATTERN.match(message)
+        if collection_match:
+            record.cause = collection_match.group(2)
+            record.young = collection_match.group(1) == "Minor Collection"
+            if collection_match.group(3) is None:
+                # the start line of a ZGC cycle, its summary line follows when the cycle ends
+                self.collection_starts[record.gc_id] = seconds
+                return
+            record.heap_before = float(collection_match.group(3))
+            record.heap_after = float(collection_match.group(4))
+            if collection_match.group(5):
+                record.concurrent_ms.append(float(collection_match.group(5)) * 1000)
+            elif record.gc_id in self.collection_starts:
+                record.concurrent_ms.append((seconds - self.collection_starts.pop(record.gc_id)) * 1000)
+            return
+        regions_match = self.REGIONS_PATTERN.match(message)
+        if regions_match:
+            regions = (int(regions_match.group(2)), int(regions_match.group(3)))
+            if regions_match.group(1) == "Old":
+                record.old_regions = regions
+            else:
+                record.humongous_regions = regions
+            return
+        if "To-space exhausted" in message or "Evacuation Failure" in message:
+            record.to_space_exhausted = True
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+@dataclass
+class GcLogStats:
+    """Statistics of the GC log of one JVM, merged from its rotated files."""
+    pod: str
+    log: str
+    files: int
+    collector: str
+    first_timestamp: str
+    last_timestamp: str
+    span_seconds: float
+    gc_count: int
+    pauses: Dict[str, List[float]]  # pause type -> sorted pause times in ms
+    concurrent_ms: List[float]
+    allocated_mb: float
+    allocation_seconds: float
+    max_allocation_rate: float  # MB/s between two consecutive GCs
+    promoted_mb: float
+    full_gcs: List[Tuple[int, str, float, str]]  # (gc id, timestamp, ms, cause)
+    humongous_gcs: int
+    peak_humongous_regions: int
+    to_space_exhausted: int
+    allocation_stalls: List[float]
+
+    @property
+    def all_pauses(self) -> List[float]:
+        return sorted(pause for pauses in self.pauses.values() for pause in pauses)
+
+    @property
+    def allocation_rate(self) -> float:
+        return self.allocated_mb / self.allocation_seconds if self.allocation_seconds > 0 else 0.0
+
+    @property
+    def promotion_rate(self) -> float:
+        return self.promoted_mb / self.span_seconds if self.span_seconds > 0 else 0.0
+
+    @classmethod
+    def from_segments(cls, pod: str, log: str, segments: List[GcLogSegment]) -> 'GcLogStats':
+        segments = sorted(segments, key=lambda segment: segment.first_seconds)
+        records = [record for segment in segments for record in segment.records]
+        collector = next((segment.collector for segment in segments if segment.collector), "")
+        region_size_mb = next((segment.region_size_mb for segment in segments if segment.region_size_mb), 0.0)
+        pauses: Dict[str, List[float]] = defaultdict(list)
+        concurrent_ms: List[float] = []
+        allocated_mb = allocation_seconds = max_allocation_rate = promoted_mb = 0.0
+        full_gcs = []
+        humongous_gcs = peak_humongous_regions = to_space_exhausted = 0
+        previous: Optional[GcRecord] = None
+        for record in records:
+            for label, ms in record.pauses:
+                pauses[label].append(ms)
+            concurrent_ms.extend(record.concurrent_ms)
+            if record.full:
+                full_gcs.append((record.gc_id, record.timestamp, sum(ms for _, ms in record.pauses), record.cause))
+            if "Humongous" in record.cause:
+                humongous_gcs += 1
+            if record.humongous_regions:
+                peak_humongous_regions = max(peak_humongous_regions, *record.humongous_regions)
+            if record.to_space_exhausted:
+                to_space_exhausted += 1
+            if record.young and record.old_regions and region_size_mb:
+                promoted_mb += max(0, record.old_regions[1] - record.old_regions[0]) * region_size_mb
+            if record.heap_before is None:
+                continue
+            if previous is not None and record.seconds > previous.seconds and record.heap_before >= previous.heap_after:
+                allocated = record.heap_before - previous.heap_after
+                interval = record.seconds - previous.seconds
+                allocated_mb += allocated
+                allocation_seconds += interval
+                max_allocation_rate = max(max_allocation_rate, allocated / interval)
+            previous = record
+        stalls = sorted(stall for segment in segments for stall in segment.allocation_stalls)
+        return cls(
+            pod=pod, log=log, files=len(segments), collector=collector,
+            first_timestamp=records[0].timestamp if records else "",
+            last_timestamp=records[-1].timestamp if records else "",
+            span_seconds=records[-1].seconds - records[0].seconds if records else 0.0,
+            gc_count=len(records),
+            pauses={label: sorted(values) for label, values in pauses.items()},
+            concurrent_ms=sorted(concurrent_ms),
+            allocated_mb=allocated_mb, allocation_seconds=allocation_seconds,
+            max_allocation_rate=max_allocation_rate, promoted_mb=promoted_mb,
+            full_gcs=full_gcs, humongous_gcs=humongous_gcs, peak_humongous_regions=peak_humongous_regions,
+            to_space_exhausted=to_space_exhausted, allocation_stalls=stalls,
+        )
+
+    def warnings(self) -> List[str]:
+        warnings = []
+        if self.full_gcs:
+            worst = max(self.full_gcs, key=lambda full_gc: full_gc[2])
+            warnings.append(f"{len(self.full_gcs)} Full GC(s), longest GC({worst[0]}) at {worst[1] or '?'} "
+                            f"{worst[2]:.1f}ms ({worst[3] or 'unknown cause'})")
+        if self.humongous_gcs or self.peak_humongous_regions:
+            warnings.append(f"{self.humongous_gcs} GC(s) caused by humongous allocations, "
+                            f"peak {self.peak_humongous_regions} humongous regions")
+        if self.to_space_exhausted:
+            warnings.append(f"To-space exhausted (evacuation failure) in {self.to_space_exhausted} GC(s)")
+        if self.allocation_stalls:
+            warnings.append(f"{len(self.allocation_stalls)} allocation stall(s), "
+                            f"max {self.allocation_stalls[-1]:.1f}ms")
+        return warnings
+
+    def print_report(self) -> None:
+        print(f"\n=== {self.pod}: {self.log} ({self.files} file(s)) ===")
+        print(f"Collector: {self.collector or 'unknown'}, GCs: {self.gc_count}, "
+              f"span: {self.span_seconds:.1f}s ({self.first_timestamp or '?'} .. {self.last_timestamp or '?'})")
+        all_pauses = self.all_pauses
+        total_pause = sum(all_pauses)
+        if self.span_seconds:
+            print(f"Total pause time: {total_pause / 1000:.2f}s ({total_pause / 10 / self.span_seconds:.2f}% of the span)")
+        if all_pauses:
+            print(f"\n{'Pause (ms)':<28} {'Count':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'p99.9':>9} {'Max':>9}")
+            rows = sorted(self.pauses.items(), key=lambda item: len(item[1]), reverse=True) + [("All", all_pauses)]
+            for label, values in rows:
+                print(f"{label[:28]:<28} {len(values):>7} " + " ".join(
+                    f"{percentile(values, fraction):>9.2f}" for fraction in (0.5, 0.9, 0.99, 0.999)) + f" {values[-1]:>9.2f}")
+        if self.concurrent_ms:
+            values = self.concurrent_ms
+            print(f"\nConcurrent cycles: {len(values)}, p50 {percentile(values, 0.5):.1f}ms, "
+                  f"p90 {percentile(values, 0.9):.1f}ms, max {values[-1]:.1f}ms")
+        if self.allocation_seconds:
+            print(f"Allocation rate: {self.allocation_rate:.1f} MB/s average, {self.max_allocation_rate:.1f} MB/s max")
+        if self.promoted_mb:
+            print(f"Promotion rate: {self.promotion_rate:.2f} MB/s ({self.promoted_mb:.0f} MB promoted)")
+        warnings = self.warnings()
+        if warnings:
+            print("\nWarnings:")
+            for warning in warnings:
+                print(f"  {warning}")
+
+def _open_text(name: str, fileobj) -> io.TextIOBase:
+    if name.endswith('.gz'):
+        fileobj = gzip.open(fileobj, 'rb')
+    return io.TextIOWrapper(fileobj, encoding='utf-8', errors='replace')
+
+def log_key(name: str) -> str:
+    """Name of the JVM log a file belongs to, without the rotation index and compression suffix."""
+    name = os.path.basename(name)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return re.sub(r'\.\d+$', '', name)
+
+def iter_log_files(source: str) -> Iterator[Tuple[str, io.TextIOBase]]:
+    """Yield (name, text stream) for each GC log file of a pod source: a file, a directory or an archive."""
+    if source.endswith(ARCHIVE_SUFFIXES):
+        with tarfile.open(source, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile() and fnmatch.fnmatch(os.path.basename(member.name), GC_LOG_PATTERN):
+                    # members of a streamed tar can only be read sequentially
+                    with _open_text(member.name, io.BytesIO(archive.extractfile(member).read())) as f:
+                        yield member.name, f
+    elif os.path.isdir(source):
+        for filename in sorted(glob.glob(os.path.join(source, GC_LOG_PATTERN))):
+            with _open_text(filename, open(filename, 'rb')) as f:
+                yield filename, f
+    else:
+        with _open_text(source, open(source, 'rb')) as f:
+            yield source, f
+
+def pod_label(source: str) -> str:
+    """Pod name of a source, "namespace/pod" for the archives of collect_pulsar_gc_logs_from_pod.sh."""
+    archive_match = COLLECTOR_ARCHIVE_PATTERN.match(os.path.basename(source))
+    if archive_match:
+        return f"{archive_match.group(1)}/{archive_match.group(2)}"
+    if os.path.isdir(source):
+        return os.path.normpath(source)
+    return os.path.dirname(source) or "."
+
+def analyze_pod(sources: List[str], label: str) -> List[GcLogStats]:
+    """Parse the GC logs of one pod and merge the rotated files of each JVM log."""
+    segments: Dict[str, List[GcLogSegment]] = defaultdict(list)
+    for source in sources:
+        for name, f in iter_log_files(source):
+            segments[log_key(name)].append(GcLogParser(name).parse(f))
+    return [GcLogStats.from_segments(label, log, log_segments) for log, log_segments in sorted(segments.items())]
+
+def expand_sources(paths: List[str]) -> List[Tuple[str, str]]:
+    """(source, pod label) pairs, where plain files in the same directory form one pod."""
+    sources: List[Tuple[str, str]] = []
+    for path in paths:
+        if os.path.isdir(path):
+            archives = sorted(filename for suffix in ARCHIVE_SUFFIXES
+                              for filename in glob.glob(os.path.join(path, "**", f"*{suffix}"), recursive=True))
+            directories = sorted({os.path.dirname(filename) for filename in
+                                  glob.glob(os.path.join(path, "**", GC_LOG_PATTERN), recursive=True)
+                                  if not filename.endswith(ARCHIVE_SUFFIXES)})
+            sources.extend((source, pod_label(source)) for source in archives + directories)
+        else:
+            filenames = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+            sources.extend((filename, pod_label(filename)) for filename in filenames)
+    return sources
+
+def print_summary(stats: List[GcLogStats], top: int) -> None:
+    print("\n=== GC Summary per Pod ===")
+    print(f"{'Pod / log':<60} {'GCs':>7} {'p99 ms':>9} {'Max ms':>9} {'Pause %':>8} {'Alloc MB/s':>10} "
+          f"{'Full GCs':>8} {'Humongous':>9}")
+    ranked = sorted(stats, key=lambda item: item.all_pauses[-1] if item.all_pauses else 0.0, reverse=True)
+    for item in ranked[:top]:
+        pauses = item.all_pauses
+        share = sum(pauses) / 10 / item.span_seconds if item.span_seconds else 0.0
+        print(f"{(item.pod + ': ' + item.log)[:60]:<60} {item.gc_count:>7} {percentile(pauses, 0.99):>9.2f} "
+              f"{pauses[-1] if pauses else 0.0:>9.2f} {share:>8.2f} {item.allocation_rate:>10.1f} "
+              f"{len(item.full_gcs):>8} {item.humongous_gcs:>9}")
+    if len(ranked) > top:
+        print(f"... ({len(ranked) - top} more)")
+
+def main():
+    parser = ArgumentParser(description="Analyze unified logging GC logs of G1 and ZGC from Pulsar pods")
+    parser.add_argument("paths", nargs="+", metavar="path",
+                       help="GC log files (plain, rotated or .gz), directories or collected pulsar_gc_logs_*.tar.gz archives")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                       help="Number of worker processes, each parsing the logs of one pod (default: number of CPUs)")
+    parser.add_argument("--summary", "-s", action="store_true",
+                       help="Only print the summary table")
+    parser.add_argument("--top", type=int, default=50,
+                       help="Number of logs in the summary table, ranked by max pause (default: 50)")
+    args = parser.parse_args()
+
+    sources = expand_sources(args.paths)
+    if not sources:
+        print("Error: No GC log files found")
+        sys.exit(1)
+    # the rotated files of a JVM log have to be merged, so all sources of a pod go to the same worker
+    pods: Dict[str, List[str]] = defaultdict(list)
+    for source, label in sources:
+        pods[label].append(source)
+    jobs = min(args.jobs or 1, len(pods))
+    if jobs <= 1:
+        results = [analyze_pod(pod_sources, label) for label, pod_sources in pods.items()]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(analyze_pod, pods.values(), pods.keys()))
+    stats = [item for result in results for item in result if item.gc_count]
+    if not stats:
+        print("No GC events found in the logs.")
+        sys.exit(1)
+    if not args.summary:
+        for item in stats:
+            item.print_report()
+    if len(stats) > 1 or args.summary:
+        print_summary(stats, args.top)
+
+if __name__ == "__main__":
+    main()
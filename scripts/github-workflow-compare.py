@@ -3,6 +3,7 @@
 # requires-python = ">=3.6"
 # dependencies = [
 #     "matplotlib",
+#     "numpy",
 #     "requests",
 #     "tabulate",
 # ]
@@ -10,11 +11,14 @@
 """
 GitHub Workflow Run Time Comparison
 
-This script compares the running times of build jobs between two GitHub Actions workflow runs.
+This script compares the running times of build jobs between two GitHub Actions workflow runs,
+or between two sets of runs with a significance test per job.
 It requires a GitHub Personal Access Token with appropriate permissions.
 
 Usage:
     python github_workflow_compare.py --owner OWNER --repo REPO --workflow WORKFLOW_ID --run1 RUN_ID1 --run2 RUN_ID2 [--token TOKEN]
+    python github_workflow_compare.py --owner OWNER --repo REPO --runs1 RUN_ID ... --runs2 RUN_ID ...
+    python github_workflow_compare.py --owner OWNER --repo REPO --workflow WORKFLOW_ID --branch1 BRANCH --branch2 BRANCH [--last N]
 
 Arguments:
     --owner      GitHub repository owner (username or organization)
@@ -22,31 +26,186 @@ Arguments:
     --workflow   Workflow ID or filename
     --run1       First workflow run ID to compare
     --run2       Second workflow run ID to compare
+    --runs1      First set of workflow run IDs to compare
+    --runs2      Second set of workflow run IDs to compare
+    --branch1    Use the last --last successful runs of the workflow on this branch as the first set
+    --branch2    Use the last --last successful runs of the workflow on this branch as the second set
+    --last       Number of runs per branch (default: 10)
+    --alpha      False discovery rate for reporting a job as changed (default: 0.05)
     --token      GitHub Personal Access Token (optional, can be set as GITHUB_TOKEN environment variable)
+    --workers    Number of concurrent API requests (default: 8)
+    --no-cache   Don't read or write the on-disk cache of API responses
+    --cache-dir  Directory of the API response cache
+    --cache-size Size cap of the API response cache in MB (default: 256)
 """
 
 import os
 import sys
 import argparse
+import contextlib
+import math
+import sqlite3
+import time
+import warnings
+import zlib
+import numpy as np
 import requests
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import json
-from typing import Dict, List, Any, Tuple
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Optional, Tuple
 from tabulate import tabulate
 import matplotlib.pyplot as plt
 from pathlib import Path
 
 
+class ResponseCache:
+    """On-disk cache of GitHub API responses in an SQLite database
+    
+    Entries hold the zlib-compressed JSON body and the ETag of the response, keyed by URL
+    and query parameters. Immutable entries, such as the jobs of a completed run attempt,
+    are served without a request. Other entries are revalidated with If-None-Match, and a
+    304 answer doesn't count against the rate limit. When the total size exceeds the cap,
+    the least recently used entries are evicted. A connection is opened per call so that
+    the cache can be used from the worker threads.
+    """
+    
+    DEFAULT_DIRECTORY = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                                     "pulsar-contributor-toolbox")
+    DEFAULT_MAX_SIZE_MB = 256
+    
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_size: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.path = os.path.join(directory, "github_workflow_compare_cache.sqlite")
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                               "key TEXT PRIMARY KEY, etag TEXT, immutable INTEGER NOT NULL, data BLOB NOT NULL, "
+                               "size INTEGER NOT NULL, last_access REAL NOT NULL)")
+    
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+    
+    @staticmethod
+    def cache_key(url: str, params: Dict[str, Any] = None) -> str:
+        return url + "?" + "&".join(f"{key}={value}" for key, value in sorted((params or {}).items()))
+    
+    def get(self, key: str) -> Optional[Tuple[Optional[str], bool, Any]]:
+        """Return the ETag, the immutable flag and the data of a cached response"""
+        with contextlib.closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT etag, immutable, data FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0], bool(row[1]), json.loads(zlib.decompress(row[2]))
+    
+    def put(self, key: str, etag: Optional[str], immutable: bool, data: Any) -> None:
+        compressed = zlib.compress(json.dumps(data).encode())
+        if len(compressed) > self.max_size:
+            return
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO responses (key, etag, immutable, data, size, last_access) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, etag, int(immutable), compressed, len(compressed), time.time()))
+            total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_size:
+                evicted_size = 0
+                for evict_key, size in connection.execute(
+                        "SELECT key, size FROM responses WHERE key != ? ORDER BY last_access", (key,)).fetchall():
+                    if total_size - evicted_size <= self.max_size:
+                        break
+                    connection.execute("DELETE FROM responses WHERE key = ?", (evict_key,))
+                    evicted_size += size
+    
+    def mark_immutable(self, key: str) -> None:
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute("UPDATE responses SET immutable = 1 WHERE key = ?", (key,))
+
+
+MANN_WHITNEY_EXACT_SIZE = 8  # the exact U distribution is used when a sample has at most this many values
+
+
+def mann_whitney_u_frequencies(n1: int, n2: int) -> np.ndarray:
+    """Number of orderings of two samples without ties giving each U statistic from 0 to n1 * n2
+    
+    These are the coefficients of the Gaussian binomial coefficient (n1 + n2 choose n1), the
+    product over i of (1 - q^(n2 + i)) / (1 - q^i). They are computed with Python integers,
+    which stay exact for long samples.
+    """
+    n1, n2 = min(n1, n2), max(n1, n2)
+    max_u = n1 * n2
+    frequencies = np.zeros(max_u + 1, dtype=object)
+    frequencies[0] = 1
+    for i in range(1, n1 + 1):
+        frequencies[n2 + i:] -= frequencies[:max_u + 1 - n2 - i].copy()
+        # dividing by (1 - q^i) is a running sum over the coefficients i apart
+        for start in range(i):
+            frequencies[start::i] = np.cumsum(frequencies[start::i])
+    return frequencies
+
+
+def mann_whitney_u(sample1: np.ndarray, sample2: np.ndarray) -> Tuple[float, float]:
+    """Two-sided Mann-Whitney U test
+    
+    Like scipy, the p-value comes from the exact distribution of U when a sample has at
+    most MANN_WHITNEY_EXACT_SIZE values and there are no ties, and from the tie corrected
+    normal approximation otherwise. Returns the U statistic of the first sample and the p-value.
+    """
+    n1, n2 = len(sample1), len(sample2)
+    n = n1 + n2
+    _, inverse, counts = np.unique(np.concatenate([sample1, sample2]), return_inverse=True, return_counts=True)
+    # average rank of each distinct value, tied values share the mean of their ranks
+    ranks = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.0
+    if n1 and n2 and min(n1, n2) <= MANN_WHITNEY_EXACT_SIZE and len(counts) == n:
+        frequencies = mann_whitney_u_frequencies(n1, n2)
+        # the distribution is symmetric, so twice the tail beyond the larger of U and n1 * n2 - U
+        tail = frequencies[int(max(u, n1 * n2 - u)):].sum() / frequencies.sum()
+        return u, min(1.0, 2 * float(tail))
+    tie_correction = (counts ** 3 - counts).sum() / (n * (n - 1)) if n > 1 else 0.0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - tie_correction))
+    if sigma == 0:
+        return u, 1.0
+    mean = n1 * n2 / 2.0
+    # continuity correction towards the mean
+    z = (abs(u - mean) - 0.5) / sigma
+    return u, min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """Adjust p-values for testing many jobs at once, controlling the false discovery rate"""
+    m = len(p_values)
+    if m == 0:
+        return p_values
+    order = np.argsort(p_values)
+    adjusted = p_values[order] * m / np.arange(1, m + 1)
+    adjusted = np.minimum.accumulate(adjusted[::-1])[::-1]
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
 class GitHubWorkflowComparer:
     """Class to compare GitHub workflow runs"""
     
     BASE_URL = "https://api.github.com"
+    JOBS_PER_PAGE = 100
+    REQUEST_TIMEOUT = 30
+    RERUN_DAYS = 30  # a completed run can be re-run this long after it started, which adds a run attempt
+    MIN_SAMPLES = 5  # runs per set needed for testing a job, with fewer even a complete separation isn't significant
+    PERCENTILES = (10, 90)
+    STEP_SUMMARY_SIZE = 20
     
-    def __init__(self, owner: str, repo: str, token: str = None):
+    def __init__(self, owner: str, repo: str, token: str = None, workers: int = 8,
+                 cache: Optional[ResponseCache] = None):
         """Initialize with repository information and optional token"""
         self.owner = owner
         self.repo = repo
         self.token = token or os.environ.get("GITHUB_TOKEN")
+        self.workers = workers
+        self.cache = cache
         
         if not self.token:
             raise ValueError("GitHub token must be provided via --token argument or GITHUB_TOKEN environment variable")
@@ -56,43 +215,117 @@ class GitHubWorkflowComparer:
             "Authorization": f"Bearer {self.token}",
             "X-GitHub-Api-Version": "2022-11-28"
         }
+        # one keep-alive connection per worker, shared by all requests
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
     
-    def get_workflow_run(self, run_id: int) -> Dict[str, Any]:
-        """Get workflow run details"""
-        url = f"{self.BASE_URL}/repos/{self.owner}/{self.repo}/actions/runs/{run_id}"
-        response = requests.get(url, headers=self.headers)
+    def _get(self, url: str, params: Dict[str, Any] = None, key_params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """GET a JSON response, served from the cache when it is immutable or not modified
+        
+        key_params are only added to the cache key, not sent with the request.
+        """
+        if self.cache is None:
+            response = self.session.get(url, params=params, timeout=self.REQUEST_TIMEOUT)
+            response.raise_for_status()
+            return response.json()
+        key = self.cache.cache_key(url, {**(params or {}), **(key_params or {})})
+        cached = self.cache.get(key)
+        if cached is not None and cached[1]:
+            return cached[2]
+        headers = {"If-None-Match": cached[0]} if cached is not None and cached[0] else None
+        response = self.session.get(url, params=params, headers=headers, timeout=self.REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            return cached[2]
         response.raise_for_status()
-        return response.json()
+        data = response.json()
+        self.cache.put(key, response.headers.get("ETag"), False, data)
+        return data
+    
+    def _run_url(self, run_id: int) -> str:
+        return f"{self.BASE_URL}/repos/{self.owner}/{self.repo}/actions/runs/{run_id}"
+    
+    def _jobs_page_params(self, page: int) -> Dict[str, Any]:
+        return {"page": page, "per_page": self.JOBS_PER_PAGE}
+    
+    def _rerun_window_closed(self, run: Dict[str, Any]) -> bool:
+        created_at = datetime.fromisoformat(run["created_at"].replace("Z", "+00:00"))
+        return datetime.now(timezone.utc) - created_at > timedelta(days=self.RERUN_DAYS)
+    
+    def get_workflow_run(self, run_id: int) -> Dict[str, Any]:
+        """Get workflow run details
+        
+        A re-run adds an attempt to a completed run, so a run is only cached permanently once
+        it can't be re-run anymore. Until then it is revalidated with its ETag.
+        """
+        run = self._get(self._run_url(run_id))
+        if (self.cache is not None and run.get("status") == "completed" and run.get("created_at")
+                and self._rerun_window_closed(run)):
+            self.cache.mark_immutable(self.cache.cache_key(self._run_url(run_id)))
+        return run
+    
+    def get_run_jobs_page(self, run_id: int, page: int, run_attempt: int = 1) -> Dict[str, Any]:
+        """Get one page of the jobs of a workflow run, including the total_count of jobs
+        
+        The page is cached per run attempt, since a re-run replaces the jobs of the run.
+        """
+        return self._get(f"{self._run_url(run_id)}/jobs", params=self._jobs_page_params(page),
+                         key_params={"run_attempt": run_attempt})
+    
+    def _get_run_and_first_jobs_page(self, run_id: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        run = self.get_workflow_run(run_id)
+        return run, self.get_run_jobs_page(run_id, 1, run.get("run_attempt", 1))
     
     def get_run_jobs(self, run_id: int) -> List[Dict[str, Any]]:
         """Get all jobs for a specific workflow run"""
-        url = f"{self.BASE_URL}/repos/{self.owner}/{self.repo}/actions/runs/{run_id}/jobs"
-        
-        all_jobs = []
+        return self.fetch_runs([run_id])[run_id][1]
+    
+    def fetch_runs(self, run_ids: List[int]) -> Dict[int, Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Get the details and all jobs of several workflow runs concurrently
+        
+        The details of every run are requested at once, each followed by the first jobs page
+        of its run attempt. The total_count of the first page gives the number of remaining
+        pages, which are then all requested in parallel, so fetching takes about three round
+        trips however many runs and jobs there are.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            first_pages = {run_id: executor.submit(self._get_run_and_first_jobs_page, run_id) for run_id in run_ids}
+            page_futures = {}
+            for run_id, future in first_pages.items():
+                run, first_page = future.result()
+                pages = math.ceil(first_page.get("total_count", 0) / self.JOBS_PER_PAGE)
+                page_futures[run_id] = [executor.submit(self.get_run_jobs_page, run_id, page, run.get("run_attempt", 1))
+                                        for page in range(2, pages + 1)]
+            results = {}
+            for run_id in run_ids:
+                run, first_page = first_pages[run_id].result()
+                jobs = list(first_page.get("jobs", []))
+                for future in page_futures[run_id]:
+                    jobs.extend(future.result().get("jobs", []))
+                results[run_id] = (run, jobs)
+                # the pages were requested after the run, only a finished attempt makes them final
+                if (self.cache is not None and run.get("status") == "completed"
+                        and all(job.get("status") == "completed" for job in jobs)):
+                    for page in range(1, len(page_futures[run_id]) + 2):
+                        self.cache.mark_immutable(self.cache.cache_key(
+                            f"{self._run_url(run_id)}/jobs",
+                            {**self._jobs_page_params(page), "run_attempt": run.get("run_attempt", 1)}))
+        return results
+    
+    def list_successful_runs(self, branch: str, count: int, workflow: str) -> List[int]:
+        """Get the IDs of the last successful runs of a workflow on a branch, newest first"""
+        url = f"{self.BASE_URL}/repos/{self.owner}/{self.repo}/actions/workflows/{workflow}/runs"
+        per_page = min(count, 100)
+        run_ids = []
         page = 1
-        per_page = 100
-        
-        while True:
-            response = requests.get(
-                url, 
-                headers=self.headers,
-                params={"page": page, "per_page": per_page}
-            )
-            response.raise_for_status()
-            data = response.json()
-            jobs = data.get("jobs", [])
-            
-            if not jobs:
+        while len(run_ids) < count:
+            data = self._get(url, params={"branch": branch, "status": "success", "per_page": per_page, "page": page})
+            runs = data.get("workflow_runs", [])
+            run_ids.extend(run["id"] for run in runs)
+            if len(runs) < per_page:
                 break
-                
-            all_jobs.extend(jobs)
-            
-            if len(jobs) < per_page:
-                break
-                
             page += 1
-            
-        return all_jobs
+        return run_ids[:count]
     
     def parse_job_duration(self, job: Dict[str, Any]) -> float:
         """Calculate job duration in seconds"""
@@ -104,6 +337,67 @@ class GitHubWorkflowComparer:
         
         return (end_time - start_time).total_seconds()
     
+    def parse_step_durations(self, job: Dict[str, Any]) -> Dict[str, float]:
+        """Calculate the duration of each completed step in seconds, keyed by step name
+        
+        Repeated step names in a job get a "#2", "#3"... suffix so that they still line up
+        between runs.
+        """
+        durations = {}
+        for step in job.get("steps") or []:
+            if step.get("status") != "completed" or not step.get("started_at") or not step.get("completed_at"):
+                continue
+            name = step["name"]
+            occurrence = 2
+            while name in durations:
+                name = f"{step['name']} #{occurrence}"
+                occurrence += 1
+            start_time = datetime.fromisoformat(step["started_at"].replace("Z", "+00:00"))
+            end_time = datetime.fromisoformat(step["completed_at"].replace("Z", "+00:00"))
+            durations[name] = (end_time - start_time).total_seconds()
+        return durations
+    
+    def compare_steps(self, steps1: Dict[str, float], steps2: Dict[str, float]) -> List[Dict[str, Any]]:
+        """Align the steps of a job in two runs by name, biggest difference first"""
+        step_comparisons = []
+        for step_name in list(steps1) + [name for name in steps2 if name not in steps1]:
+            duration1 = steps1.get(step_name, 0)
+            duration2 = steps2.get(step_name, 0)
+            step_comparisons.append({
+                "step_name": step_name,
+                "run1_duration": duration1,
+                "run2_duration": duration2,
+                "difference_seconds": duration2 - duration1,
+                "in_run1": step_name in steps1,
+                "in_run2": step_name in steps2
+            })
+        step_comparisons.sort(key=lambda x: abs(x["difference_seconds"]), reverse=True)
+        return step_comparisons
+    
+    def summarize_steps(self, job_comparisons: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Aggregate the step differences of all jobs found in both runs by step name"""
+        summary: Dict[str, Dict[str, Any]] = {}
+        for job in job_comparisons:
+            for step in job["step_comparisons"]:
+                entry = summary.setdefault(step["step_name"], {
+                    "step_name": step["step_name"],
+                    "jobs": 0,
+                    "run1_duration": 0,
+                    "run2_duration": 0,
+                    "difference_seconds": 0,
+                    "slower_jobs": 0,
+                    "faster_jobs": 0
+                })
+                entry["jobs"] += 1
+                entry["run1_duration"] += step["run1_duration"]
+                entry["run2_duration"] += step["run2_duration"]
+                entry["difference_seconds"] += step["difference_seconds"]
+                if step["difference_seconds"] > 0:
+                    entry["slower_jobs"] += 1
+                elif step["difference_seconds"] < 0:
+                    entry["faster_jobs"] += 1
+        return sorted(summary.values(), key=lambda x: abs(x["difference_seconds"]), reverse=True)
+    
     def format_duration(self, seconds: float) -> str:
         """Format seconds into readable duration string"""
         minutes, seconds = divmod(int(seconds), 60)
@@ -118,13 +412,10 @@ class GitHubWorkflowComparer:
     
     def compare_runs(self, run_id1: int, run_id2: int) -> Dict[str, Any]:
         """Compare two workflow runs and their jobs"""
-        # Get run details
-        run1 = self.get_workflow_run(run_id1)
-        run2 = self.get_workflow_run(run_id2)
-        
-        # Get jobs for each run
-        jobs1 = self.get_run_jobs(run_id1)
-        jobs2 = self.get_run_jobs(run_id2)
+        # Get run details and jobs for both runs
+        runs = self.fetch_runs([run_id1, run_id2])
+        run1, jobs1 = runs[run_id1]
+        run2, jobs2 = runs[run_id2]
         
         # Process job data
         run1_data = {
@@ -163,7 +454,8 @@ class GitHubWorkflowComparer:
                 "conclusion": job["conclusion"],
                 "duration": duration,
                 "duration_formatted": self.format_duration(duration),
-                "url": job["html_url"]
+                "url": job["html_url"],
+                "steps": self.parse_step_durations(job)
             }
             if job["status"] == "completed" and job["conclusion"] == "success":
                 run1_data["total_duration"] += duration
@@ -178,7 +470,8 @@ class GitHubWorkflowComparer:
                 "conclusion": job["conclusion"],
                 "duration": duration,
                 "duration_formatted": self.format_duration(duration),
-                "url": job["html_url"]
+                "url": job["html_url"],
+                "steps": self.parse_step_durations(job)
             }
             if job["status"] == "completed" and job["conclusion"] == "success":
                 run2_data["total_duration"] += duration
@@ -213,6 +506,10 @@ class GitHubWorkflowComparer:
                     (duration_diff / job1["duration"]) * 100
                     if job1["duration"] > 0 else 0
                 )
+                step_comparisons = self.compare_steps(job1["steps"], job2["steps"])
+                # the step that moved the most in the same direction as the whole job
+                top_step = next((step for step in step_comparisons
+                                 if step["difference_seconds"] * duration_diff > 0), None)
                 
                 comparison["job_comparisons"].append({
                     "job_name": job_name,
@@ -223,7 +520,9 @@ class GitHubWorkflowComparer:
                     "difference": self.format_duration(abs(duration_diff)),
                     "difference_seconds": abs(duration_diff),
                     "percent_change": round(percent_change, 2),
-                    "faster_in": "run1" if duration_diff > 0 else "run2" if duration_diff < 0 else "same"
+                    "faster_in": "run1" if duration_diff > 0 else "run2" if duration_diff < 0 else "same",
+                    "step_comparisons": step_comparisons,
+                    "top_step": top_step
                 })
             elif job1:
                 comparison["job_comparisons"].append({
@@ -235,7 +534,9 @@ class GitHubWorkflowComparer:
                     "difference": job1["duration_formatted"],
                     "difference_seconds": job1["duration"],
                     "percent_change": -100,
-                    "faster_in": "missing_in_run2"
+                    "faster_in": "missing_in_run2",
+                    "step_comparisons": [],
+                    "top_step": None
                 })
             elif job2:
                 comparison["job_comparisons"].append({
@@ -247,14 +548,101 @@ class GitHubWorkflowComparer:
                     "difference": job2["duration_formatted"],
                     "difference_seconds": job2["duration"],
                     "percent_change": float('inf'),
-                    "faster_in": "missing_in_run1"
+                    "faster_in": "missing_in_run1",
+                    "step_comparisons": [],
+                    "top_step": None
                 })
         
         # Sort job comparisons by absolute difference (biggest first)
         comparison["job_comparisons"].sort(key=lambda x: x["difference_seconds"], reverse=True)
+        comparison["step_summary"] = self.summarize_steps(comparison["job_comparisons"])
         
         return comparison
     
+    def job_duration_matrix(self, run_ids: List[int], runs: Dict[int, Tuple[Dict[str, Any], List[Dict[str, Any]]]]
+                            ) -> Tuple[List[str], np.ndarray]:
+        """Durations of the successful jobs as a runs x jobs array, NaN where a run has no successful job"""
+        columns: Dict[str, int] = {}
+        rows = []
+        for run_id in run_ids:
+            row = {}
+            for job in runs[run_id][1]:
+                if job["status"] == "completed" and job["conclusion"] == "success":
+                    row[columns.setdefault(job["name"], len(columns))] = self.parse_job_duration(job)
+            rows.append(row)
+        matrix = np.full((len(run_ids), len(columns)), np.nan)
+        for index, row in enumerate(rows):
+            if row:
+                matrix[index, list(row.keys())] = list(row.values())
+        return list(columns), matrix
+    
+    def compare_run_sets(self, run_ids1: List[int], run_ids2: List[int], alpha: float = 0.05) -> Dict[str, Any]:
+        """Compare per-job durations of two sets of workflow runs
+        
+        Each job is tested with a Mann-Whitney U test, which makes no assumption about the
+        shape of the duration distributions. The p-values are adjusted for the number of
+        jobs tested, and a job counts as changed when its adjusted p-value is below alpha.
+        """
+        runs = self.fetch_runs(list(dict.fromkeys(run_ids1 + run_ids2)))
+        job_names, matrix = self.job_duration_matrix(run_ids1 + run_ids2, runs)
+        set1, set2 = matrix[:len(run_ids1)], matrix[len(run_ids1):]
+        counts1 = np.count_nonzero(~np.isnan(set1), axis=0)
+        counts2 = np.count_nonzero(~np.isnan(set2), axis=0)
+        with warnings.catch_warnings():
+            # jobs missing from every run of a set have all-NaN columns
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            medians1 = np.nanmedian(set1, axis=0)
+            medians2 = np.nanmedian(set2, axis=0)
+            percentiles1 = np.nanpercentile(set1, self.PERCENTILES, axis=0)
+            percentiles2 = np.nanpercentile(set2, self.PERCENTILES, axis=0)
+        tested = np.flatnonzero((counts1 >= self.MIN_SAMPLES) & (counts2 >= self.MIN_SAMPLES))
+        p_values = np.full(len(job_names), np.nan)
+        for column in tested:
+            sample1 = set1[:, column]
+            sample2 = set2[:, column]
+            p_values[column] = mann_whitney_u(sample1[~np.isnan(sample1)], sample2[~np.isnan(sample2)])[1]
+        adjusted = np.full(len(job_names), np.nan)
+        adjusted[tested] = benjamini_hochberg(p_values[tested])
+        
+        jobs = []
+        for column, job_name in enumerate(job_names):
+            difference = medians2[column] - medians1[column]
+            jobs.append({
+                "job_name": job_name,
+                "runs1": int(counts1[column]),
+                "runs2": int(counts2[column]),
+                "median1": None if np.isnan(medians1[column]) else float(medians1[column]),
+                "median2": None if np.isnan(medians2[column]) else float(medians2[column]),
+                "percentiles1": {f"p{p}": None if np.isnan(value) else float(value)
+                                 for p, value in zip(self.PERCENTILES, percentiles1[:, column])},
+                "percentiles2": {f"p{p}": None if np.isnan(value) else float(value)
+                                 for p, value in zip(self.PERCENTILES, percentiles2[:, column])},
+                "difference_seconds": None if np.isnan(difference) else float(difference),
+                "percent_change": round(float(difference / medians1[column] * 100), 2)
+                                  if not np.isnan(difference) and medians1[column] > 0 else None,
+                "p_value": None if np.isnan(p_values[column]) else float(p_values[column]),
+                "adjusted_p_value": None if np.isnan(adjusted[column]) else float(adjusted[column]),
+                "significant": bool(adjusted[column] < alpha) if not np.isnan(adjusted[column]) else False,
+            })
+        jobs.sort(key=lambda job: abs(job["difference_seconds"] or 0), reverse=True)
+        
+        totals1 = np.nansum(set1, axis=1)
+        totals2 = np.nansum(set2, axis=1)
+        _, total_p_value = mann_whitney_u(totals1, totals2) if len(totals1) and len(totals2) else (0, 1.0)
+        return {
+            "runs1": run_ids1,
+            "runs2": run_ids2,
+            "alpha": alpha,
+            "jobs": jobs,
+            "summary": {
+                "median_total1": float(np.median(totals1)) if len(totals1) else 0.0,
+                "median_total2": float(np.median(totals2)) if len(totals2) else 0.0,
+                "total_p_value": float(total_p_value),
+                "jobs_tested": int(len(tested)),
+                "jobs_changed": sum(1 for job in jobs if job["significant"]),
+            }
+        }
+    
     def generate_charts(self, comparison: Dict[str, Any], output_dir: str = ".") -> List[str]:
         """Generate comparison charts and save to files"""
         output_path = Path(output_dir)
@@ -390,7 +778,7 @@ class GitHubWorkflowComparer:
         
         # Prepare table data
         table_data = []
-        headers = ["Job Name", f"Run {run1['run_id']}", f"Run {run2['run_id']}", "Diff", "Change", "Faster In"]
+        headers = ["Job Name", f"Run {run1['run_id']}", f"Run {run2['run_id']}", "Diff", "Change", "Faster In", "Top Step"]
         
         for job in comparison["job_comparisons"]:
             faster_in = ""
@@ -410,6 +798,10 @@ class GitHubWorkflowComparer:
                 change = "N/A"
             else:
                 change = f"{sign}{job['percent_change']}%"
+            
+            top_step = job["top_step"]
+            if top_step:
+                top_step = f"{top_step['step_name']} ({self.format_signed_duration(top_step['difference_seconds'])})"
                 
             table_data.append([
                 job["job_name"],
@@ -417,7 +809,8 @@ class GitHubWorkflowComparer:
                 job["run2_duration_formatted"],
                 job["difference"],
                 change,
-                faster_in
+                faster_in,
+                top_step or ""
             ])
         
         print(tabulate(table_data, headers=headers, tablefmt="grid"))
@@ -435,6 +828,77 @@ class GitHubWorkflowComparer:
             print(f"\nJobs only in Run {run1['run_id']} (not in Run {run2['run_id']}):")
             for job in missing_in_run2:
                 print(f"  - {job['job_name']}: {job['run1_duration_formatted']}")
+        
+        step_summary = [step for step in comparison["step_summary"] if step["difference_seconds"]]
+        if step_summary:
+            print(f"\nStep Changes Across Jobs (top {self.STEP_SUMMARY_SIZE}, sorted by biggest total difference):")
+            table_data = []
+            headers = ["Step Name", "Jobs", f"Run {run1['run_id']}", f"Run {run2['run_id']}", "Diff", "Per Job",
+                       "Slower/Faster Jobs"]
+            for step in step_summary[:self.STEP_SUMMARY_SIZE]:
+                table_data.append([
+                    step["step_name"],
+                    step["jobs"],
+                    self.format_duration(step["run1_duration"]),
+                    self.format_duration(step["run2_duration"]),
+                    self.format_signed_duration(step["difference_seconds"]),
+                    self.format_signed_duration(step["difference_seconds"] / step["jobs"]),
+                    f"{step['slower_jobs']}/{step['faster_jobs']}"
+                ])
+            print(tabulate(table_data, headers=headers, tablefmt="grid"))
+    
+    def format_signed_duration(self, seconds: float) -> str:
+        """Format a duration difference with its sign"""
+        return ("-" if seconds < 0 else "+") + self.format_duration(abs(seconds))
+    
+    def print_run_set_report(self, comparison: Dict[str, Any], all_jobs: bool = False) -> None:
+        """Print the jobs whose durations changed significantly between two sets of runs"""
+        summary = comparison["summary"]
+        
+        print("\n" + "="*80)
+        print(f"GitHub Workflow Run Set Comparison: {len(comparison['runs1'])} runs vs {len(comparison['runs2'])} runs")
+        print("="*80)
+        
+        print(f"\nSet 1 runs: {', '.join(str(run_id) for run_id in comparison['runs1'])}")
+        print(f"Set 2 runs: {', '.join(str(run_id) for run_id in comparison['runs2'])}")
+        
+        print("\nSummary:")
+        print(f"  Set 1 median total duration: {self.format_duration(summary['median_total1'])}")
+        print(f"  Set 2 median total duration: {self.format_duration(summary['median_total2'])}")
+        difference = summary["median_total2"] - summary["median_total1"]
+        percent = f" ({difference / summary['median_total1'] * 100:+.2f}%)" if summary["median_total1"] > 0 else ""
+        print(f"  Difference: {self.format_signed_duration(difference)}{percent}, p={summary['total_p_value']:.2g}")
+        print(f"  {summary['jobs_changed']} of {summary['jobs_tested']} tested jobs changed significantly "
+              f"(false discovery rate {comparison['alpha']}, jobs need {self.MIN_SAMPLES}+ successful runs per set)")
+        
+        jobs = comparison["jobs"] if all_jobs else [job for job in comparison["jobs"] if job["significant"]]
+        if not jobs:
+            return
+        print(f"\n{'All jobs' if all_jobs else 'Jobs with a significant change'} (sorted by biggest median difference):")
+        
+        def duration(value: Optional[float]) -> str:
+            return "N/A" if value is None else self.format_duration(value)
+        
+        def percentile_range(percentiles: Dict[str, Optional[float]]) -> str:
+            return " - ".join(duration(value) for value in percentiles.values())
+        
+        table_data = []
+        headers = ["Job Name", "Runs", "Median 1", "Median 2", "Diff", "Change",
+                   "P10 - P90 1", "P10 - P90 2", "Adjusted p"]
+        for job in jobs:
+            table_data.append([
+                job["job_name"],
+                f"{job['runs1']}/{job['runs2']}",
+                duration(job["median1"]),
+                duration(job["median2"]),
+                "N/A" if job["difference_seconds"] is None else self.format_signed_duration(job["difference_seconds"]),
+                "N/A" if job["percent_change"] is None else f"{job['percent_change']:+}%",
+                percentile_range(job["percentiles1"]),
+                percentile_range(job["percentiles2"]),
+                "N/A" if job["adjusted_p_value"] is None else f"{job['adjusted_p_value']:.2g}",
+            ])
+        
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
     
     def save_json_report(self, comparison: Dict[str, Any], output_file: str) -> None:
         """Save the comparison data as a JSON file"""
@@ -449,17 +913,57 @@ def main():
     parser.add_argument("--owner", required=True, help="GitHub repository owner")
     parser.add_argument("--repo", required=True, help="GitHub repository name")
     parser.add_argument("--workflow", required=False, help="Workflow ID or name (optional)")
-    parser.add_argument("--run1", required=True, type=int, help="First workflow run ID to compare")
-    parser.add_argument("--run2", required=True, type=int, help="Second workflow run ID to compare")
+    parser.add_argument("--run1", type=int, help="First workflow run ID to compare")
+    parser.add_argument("--run2", type=int, help="Second workflow run ID to compare")
+    parser.add_argument("--runs1", type=int, nargs="+", metavar="RUN_ID", help="First set of workflow run IDs to compare")
+    parser.add_argument("--runs2", type=int, nargs="+", metavar="RUN_ID", help="Second set of workflow run IDs to compare")
+    parser.add_argument("--branch1", help="Compare the last --last successful runs of --workflow on this branch")
+    parser.add_argument("--branch2", help="Compare against the last --last successful runs of --workflow on this branch")
+    parser.add_argument("--last", type=int, default=10, help="Number of runs per branch (default: 10)")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="False discovery rate for reporting a job as changed between run sets (default: 0.05)")
+    parser.add_argument("--all-jobs", action="store_true",
+                        help="List all jobs in a run set comparison, not only the significantly changed ones")
     parser.add_argument("--token", help="GitHub Personal Access Token (can also use GITHUB_TOKEN env var)")
     parser.add_argument("--output-dir", default=".", help="Directory to save charts and reports")
     parser.add_argument("--json", help="Save detailed report to the specified JSON file")
     parser.add_argument("--no-charts", action="store_true", help="Skip generating charts")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent API requests (default: 8)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Don't read or write the on-disk cache of API responses")
+    parser.add_argument("--cache-dir", default=ResponseCache.DEFAULT_DIRECTORY,
+                        help=f"Directory of the API response cache (default: {ResponseCache.DEFAULT_DIRECTORY})")
+    parser.add_argument("--cache-size", type=int, default=ResponseCache.DEFAULT_MAX_SIZE_MB, metavar="MB",
+                        help=f"Size cap of the API response cache (default: {ResponseCache.DEFAULT_MAX_SIZE_MB} MB)")
     
     args = parser.parse_args()
+    run_sets = any([args.runs1, args.runs2, args.branch1, args.branch2])
+    if run_sets:
+        if bool(args.runs1) == bool(args.branch1) or bool(args.runs2) == bool(args.branch2):
+            parser.error("each run set needs either --runs1/--runs2 or --branch1/--branch2")
+        if (args.branch1 or args.branch2) and not args.workflow:
+            parser.error("--branch1 and --branch2 require --workflow")
+    elif args.run1 is None or args.run2 is None:
+        parser.error("--run1 and --run2 are required unless run sets are given with --runs1/--branch1 and --runs2/--branch2")
     
     try:
-        comparer = GitHubWorkflowComparer(args.owner, args.repo, args.token)
+        cache = None if args.no_cache else ResponseCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        comparer = GitHubWorkflowComparer(args.owner, args.repo, args.token, args.workers, cache)
+        
+        if run_sets:
+            run_ids1 = args.runs1 or comparer.list_successful_runs(args.branch1, args.last, args.workflow)
+            run_ids2 = args.runs2 or comparer.list_successful_runs(args.branch2, args.last, args.workflow)
+            for run_ids, branch in ((run_ids1, args.branch1), (run_ids2, args.branch2)):
+                if not run_ids:
+                    print(f"Error: No successful runs of workflow {args.workflow} found on branch {branch}",
+                          file=sys.stderr)
+                    return 1
+            comparison = comparer.compare_run_sets(run_ids1, run_ids2, args.alpha)
+            comparer.print_run_set_report(comparison, args.all_jobs)
+            if args.json:
+                comparer.save_json_report(comparison, args.json)
+            return 0
+        
         comparison = comparer.compare_runs(args.run1, args.run2)
         
         comparer.print_comparison_report(comparison)
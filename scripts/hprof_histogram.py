@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""Class histogram of HPROF heap dumps, such as the heapdump_<pid>_<ts>.hprof files of collect_jvm_diagnostics_from_pod.sh.
+
+The dump is memory-mapped and its records are walked in place. Only the location of every
+UTF8 symbol record and the counters of every class are kept, so memory use depends on the
+number of symbols and classes, not on the size of the heap. Shallow sizes are estimated
+from the field and array data with an uncompressed object header and 8 byte alignment,
+which overestimates them for JVMs running with compressed oops but keeps them comparable.
+"""
+import mmap
+import re
+import struct
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+# HPROF top level record tags
+TAG_UTF8 = 0x01
+TAG_LOAD_CLASS = 0x02
+TAG_STACK_TRACE = 0x05
+TAG_HEAP_DUMP = 0x0C
+TAG_HEAP_DUMP_SEGMENT = 0x1C
+TAG_HEAP_DUMP_END = 0x2C
+
+# heap dump sub-record tags
+SUB_CLASS_DUMP = 0x20
+SUB_INSTANCE_DUMP = 0x21
+SUB_OBJECT_ARRAY_DUMP = 0x22
+SUB_PRIMITIVE_ARRAY_DUMP = 0x23
+
+OBJECT_TYPE = 2
+# basic type -> (size in bytes, java name), the size of OBJECT_TYPE is the identifier size
+BASIC_TYPES = {
+    OBJECT_TYPE: (0, "Object"),
+    4: (1, "boolean"), 5: (2, "char"), 6: (4, "float"), 7: (8, "double"),
+    8: (1, "byte"), 9: (2, "short"), 10: (4, "int"), 11: (8, "long"),
+}
+
+@dataclass(slots=True)
+class ClassInfo:
+    name: str
+    super_id: int = 0
+
+@dataclass
+class HistogramEntry:
+    name: str
+    instances: int = 0
+    shallow_size: int = 0
+
+# (label, regex of the class name, match subclasses through the super class chain)
+PULSAR_CLASSES = [
+    ("ManagedLedgerImpl", r'\.mledger\.impl\.ManagedLedgerImpl$', True),
+    ("ManagedCursorImpl", r'\.mledger\.impl\.ManagedCursorImpl$', True),
+    ("PersistentTopic", r'\.broker\.service\.persistent\.PersistentTopic$', False),
+    ("ServerCnx", r'\.broker\.service\.ServerCnx$', False),
+    ("PendingAcksMap", r'\.broker\.service\.PendingAcksMap$', False),
+    ("EntryImpl", r'\.mledger\.impl\.EntryImpl$', False),
+    ("OpAddEntry", r'\.mledger\.impl\.OpAddEntry$', False),
+    ("ByteBuf subclasses", r'(^|\.)io\.netty\.buffer\.ByteBuf$', True),
+]
+
+class HprofHistogram:
+    """Walks the records of an HPROF file and counts instances and shallow sizes per class."""
+    HEADER_PREFIX = b"JAVA PROFILE "
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.id_size = 0
+        self.timestamp_ms = 0
+        self.classes: Dict[int, ClassInfo] = {}
+        self.instances: Dict[int, List[int]] = {}  # class id -> [count, shallow size]
+        self.object_arrays: Dict[int, List[int]] = {}  # array class id -> [count, shallow size]
+        self.primitive_arrays: Dict[int, List[int]] = {}  # basic type -> [count, shallow size]
+
+    def _object_size(self, data_size: int) -> int:
+        header = 2 * self.id_size
+        return (header + data_size + 7) & ~7
+
+    def _array_size(self, data_size: int) -> int:
+        return (2 * self.id_size + 4 + data_size + 7) & ~7
+
+    def parse(self) -> 'HprofHistogram':
+        with open(self.filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if not data[:len(self.HEADER_PREFIX)] == self.HEADER_PREFIX:
+                raise ValueError(f"{self.filename} is not an HPROF file")
+            position = data.find(b"\0") + 1
+            self.id_size, high, low = struct.unpack_from(">III", data, position)
+            self.timestamp_ms = (high << 32) | low
+            position += 12
+            id_format = "Q" if self.id_size == 8 else "I"
+            utf8_offsets: Dict[int, Tuple[int, int]] = {}
+            class_names: Dict[int, int] = {}  # class id -> name string id
+            record_header = struct.Struct(">BII")
+            identifier = struct.Struct(">" + id_format)
+            load_class = struct.Struct(f">I{id_format}I{id_format}")
+            size = len(data)
+            while position + record_header.size <= size:
+                tag, _, length = record_header.unpack_from(data, position)
+                body = position + record_header.size
+                if tag == TAG_UTF8:
+                    # keep only the location, names are decoded for classes only
+                    utf8_offsets[identifier.unpack_from(data, body)[0]] = (body + self.id_size, length - self.id_size)
+                elif tag == TAG_LOAD_CLASS:
+                    _, class_id, _, name_id = load_class.unpack_from(data, body)
+                    class_names[class_id] = name_id
+                elif tag in (TAG_HEAP_DUMP, TAG_HEAP_DUMP_SEGMENT):
+                    self._parse_heap_dump(data, body, body + length, id_format)
+                position = body + length
+            for class_id, name_id in class_names.items():
+                start, length = utf8_offsets.get(name_id, (0, 0))
+                name = data[start:start + length].decode('utf-8', errors='replace') if length else f"<class 0x{class_id:x}>"
+                info = self.classes.setdefault(class_id, ClassInfo(name))
+                info.name = name.replace("/", ".")
+        return self
+
+    def _parse_heap_dump(self, data: mmap.mmap, position: int, end: int, id_format: str) -> None:
+        id_size = self.id_size
+        root_sizes = {0xFF: id_size, 0x01: 2 * id_size, 0x02: id_size + 8, 0x03: id_size + 8, 0x04: id_size + 4,
+                      0x05: id_size, 0x06: id_size + 4, 0x07: id_size, 0x08: id_size + 8}
+        instance = struct.Struct(f">{id_format}I{id_format}I")
+        array = struct.Struct(f">{id_format}II{id_format}")
+        primitive_array = struct.Struct(f">{id_format}IIB")
+        instances = self.instances
+        object_size = self._object_size
+        array_size = self._array_size
+        while position < end:
+            tag = data[position]
+            position += 1
+            if tag == SUB_INSTANCE_DUMP:
+                _, _, class_id, length = instance.unpack_from(data, position)
+                position += instance.size + length
+                entry = instances.get(class_id)
+                if entry is None:
+                    entry = instances[class_id] = [0, 0]
+                entry[0] += 1
+                entry[1] += object_size(length)
+            elif tag == SUB_OBJECT_ARRAY_DUMP:
+                _, _, count, class_id = array.unpack_from(data, position)
+                position += array.size + count * id_size
+                entry = self.object_arrays.setdefault(class_id, [0, 0])
+                entry[0] += 1
+                entry[1] += array_size(count * id_size)
+            elif tag == SUB_PRIMITIVE_ARRAY_DUMP:
+                _, _, count, basic_type = primitive_array.unpack_from(data, position)
+                length = count * BASIC_TYPES[basic_type][0]
+                position += primitive_array.size + length
+                entry = self.primitive_arrays.setdefault(basic_type, [0, 0])
+                entry[0] += 1
+                entry[1] += array_size(length)
+            elif tag == SUB_CLASS_DUMP:
+                position = self._parse_class_dump(data, position, id_format)
+            elif tag in root_sizes:
+                position += root_sizes[tag]
+            else:
+                raise ValueError(f"Unknown heap dump sub-record tag 0x{tag:02x} at offset {position - 1}")
+
+    def _value_size(self, basic_type: int) -> int:
+        return self.id_size if basic_type == OBJECT_TYPE else BASIC_TYPES[basic_type][0]
+
+    def _parse_class_dump(self, data: mmap.mmap, position: int, id_format: str) -> int:
+        id_size = self.id_size
+        class_id, _, super_id = struct.unpack_from(f">{id_format}I{id_format}", data, position)
+        self.classes.setdefault(class_id, ClassInfo("")).super_id = super_id
+        # class, stack serial, super, loader, signers, protection domain, 2 reserved ids and the instance size
+        position += 7 * id_size + 8
+        constant_pool_size = struct.unpack_from(">H", data, position)[0]
+        position += 2
+        for _ in range(constant_pool_size):
+            position += 2
+            position += 1 + self._value_size(data[position])
+        static_fields = struct.unpack_from(">H", data, position)[0]
+        position += 2
+        for _ in range(static_fields):
+            position += id_size
+            position += 1 + self._value_size(data[position])
+        instance_fields = struct.unpack_from(">H", data, position)[0]
+        return position + 2 + instance_fields * (id_size + 1)
+
+    def class_name(self, class_id: int) -> str:
+        info = self.classes.get(class_id)
+        return info.name if info and info.name else f"<class 0x{class_id:x}>"
+
+    @staticmethod
+    def _java_array_name(name: str) -> str:
+        """Turn a JVM array descriptor such as [Ljava.lang.Object; into java.lang.Object[]."""
+        dimensions = len(name) - len(name.lstrip("["))
+        if not dimensions:
+            return name
+        element = name[dimensions:]
+        if element.startswith("L") and element.endswith(";"):
+            element = element[1:-1]
+        else:
+            element = {"Z": "boolean", "C": "char", "F": "float", "D": "double", "B": "byte", "S": "short",
+                       "I": "int", "J": "long"}.get(element, element)
+        return element + "[]" * dimensions
+
+    def histogram(self) -> Dict[str, HistogramEntry]:
+        """Entries by class name, arrays included."""
+        entries: Dict[str, HistogramEntry] = {}
+
+        def add(name: str, counts: List[int]) -> None:
+            entry = entries.setdefault(name, HistogramEntry(name))
+            entry.instances += counts[0]
+            entry.shallow_size += counts[1]
+        for class_id, counts in self.instances.items():
+            add(self.class_name(class_id), counts)
+        for class_id, counts in self.object_arrays.items():
+            add(self._java_array_name(self.class_name(class_id)), counts)
+        for basic_type, counts in self.primitive_arrays.items():
+            add(BASIC_TYPES[basic_type][1] + "[]", counts)
+        return entries
+
+    def is_subclass(self, class_id: int, pattern: re.Pattern) -> bool:
+        seen = set()
+        while class_id and class_id not in seen:
+            seen.add(class_id)
+            info = self.classes.get(class_id)
+            if info is None:
+                return False
+            if pattern.search(info.name):
+                return True
+            class_id = info.super_id
+        return False
+
+    def pulsar_counts(self) -> List[Tuple[str, int, int]]:
+        """(label, instances, shallow size) of the Pulsar and Netty classes worth watching."""
+        counts = []
+        for label, pattern, subclasses in PULSAR_CLASSES:
+            regex = re.compile(pattern)
+            instances = size = 0
+            for class_id, (count, shallow_size) in self.instances.items():
+                if (self.is_subclass(class_id, regex) if subclasses
+                        else regex.search(self.class_name(class_id))):
+                    instances += count
+                    size += shallow_size
+            counts.append((label, instances, size))
+        return counts
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+def print_histogram(histogram: HprofHistogram, top: int) -> None:
+    entries = sorted(histogram.histogram().values(), key=lambda entry: entry.shallow_size, reverse=True)
+    print(f"\n=== Class Histogram: {histogram.filename} ===")
+    print(f"{sum(entry.instances for entry in entries)} objects, "
+          f"{format_size(sum(entry.shallow_size for entry in entries))} shallow, {len(entries)} classes")
+    print(f"\n{'Instances':>12} {'Shallow size':>14}  Class")
+    for entry in entries[:top]:
+        print(f"{entry.instances:>12} {format_size(entry.shallow_size):>14}  {entry.name}")
+    print("\n=== Pulsar Objects ===")
+    for label, instances, size in histogram.pulsar_counts():
+        print(f"{instances:>12} {format_size(size):>14}  {label}")
+
+def print_diff(before: HprofHistogram, after: HprofHistogram, top: int) -> None:
+    before_entries = before.histogram()
+    after_entries = after.histogram()
+    rows = []
+    for name in before_entries.keys() | after_entries.keys():
+        old = before_entries.get(name, HistogramEntry(name))
+        new = after_entries.get(name, HistogramEntry(name))
+        if old.instances != new.instances or old.shallow_size != new.shallow_size:
+            rows.append((name, new.instances - old.instances, new.shallow_size - old.shallow_size, new.instances))
+    rows.sort(key=lambda row: abs(row[2]), reverse=True)
+    print(f"\n=== Class Histogram Diff: {before.filename} -> {after.filename} ===")
+    print(f"{'Instances':>12} {'Shallow size':>14} {'Now':>12}  Class")
+    for name, instances, size, now in rows[:top]:
+        print(f"{instances:>+12} {('+' if size >= 0 else '-') + format_size(abs(size)):>14} {now:>12}  {name}")
+    print("\n=== Pulsar Objects Diff ===")
+    for (label, old_instances, old_size), (_, new_instances, new_size) in zip(before.pulsar_counts(),
+                                                                              after.pulsar_counts()):
+        print(f"{new_instances - old_instances:>+12} {('+' if new_size >= old_size else '-') + format_size(abs(new_size - old_size)):>14}"
+              f" {new_instances:>12}  {label}")
+
+class HprofWriter:
+    """Writes small HPROF files for testing the histogram."""
+
+    def __init__(self, out: BinaryIO, id_size: int = 8):
+        self.out = out
+        self.id_size = id_size
+        self.id_format = "Q" if id_size == 8 else "I"
+        self.next_id = 0x1000
+        self.strings: Dict[str, int] = {}
+        self.class_ids: Dict[str, int] = {}
+        self.heap = bytearray()
+        self.boundaries: List[int] = []
+        out.write(b"JAVA PROFILE 1.0.2\0" + struct.pack(">III", id_size, 0, 0))
+
+    def _id(self) -> int:
+        self.next_id += 0x10
+        return self.next_id
+
+    def _pack_id(self, value: int) -> bytes:
+        return struct.pack(">" + self.id_format, value)
+
+    def _record(self, tag: int, body: bytes) -> None:
+        self.out.write(struct.pack(">BII", tag, 0, len(body)) + body)
+
+    def string(self, text: str) -> int:
+        if text not in self.strings:
+            self.strings[text] = self._id()
+            self._record(TAG_UTF8, self._pack_id(self.strings[text]) + text.encode("utf-8"))
+        return self.strings[text]
+
+    def define_class(self, name: str, super_name: Optional[str] = None,
+                     fields: Optional[List[Tuple[str, int]]] = None) -> int:
+        class_id = self._id()
+        self.class_ids[name] = class_id
+        self._record(TAG_LOAD_CLASS, struct.pack(">I", len(self.class_ids)) + self._pack_id(class_id)
+                     + struct.pack(">I", 0) + self._pack_id(self.string(name)))
+        fields = fields or []
+        instance_size = sum(self.id_size if basic_type == OBJECT_TYPE else BASIC_TYPES[basic_type][0]
+                            for _, basic_type in fields)
+        body = self._pack_id(class_id) + struct.pack(">I", 0) + self._pack_id(self.class_ids.get(super_name, 0))
+        body += self._pack_id(0) * 5 + struct.pack(">I", instance_size)
+        # one constant pool entry and one static int field exercise the variable length parts
+        body += struct.pack(">HHBi", 1, 0, 10, 42)
+        body += struct.pack(">H", 1) + self._pack_id(self.string("SERIAL")) + struct.pack(">Bi", 10, 1)
+        body += struct.pack(">H", len(fields))
+        for field_name, basic_type in fields:
+            body += self._pack_id(self.string(field_name)) + struct.pack(">B", basic_type)
+        self.heap += bytes([SUB_CLASS_DUMP]) + body
+        return class_id
+
+    def instance(self, class_name: str, data_size: int) -> int:
+        object_id = self._id()
+        self.heap += bytes([SUB_INSTANCE_DUMP]) + self._pack_id(object_id) + struct.pack(">I", 0)
+        self.heap += self._pack_id(self.class_ids[class_name]) + struct.pack(">I", data_size) + bytes(data_size)
+        return object_id
+
+    def object_array(self, class_name: str, elements: List[int]) -> None:
+        self.heap += bytes([SUB_OBJECT_ARRAY_DUMP]) + self._pack_id(self._id()) + struct.pack(">II", 0, len(elements))
+        self.heap += self._pack_id(self.class_ids[class_name]) + b"".join(self._pack_id(element) for element in elements)
+
+    def primitive_array(self, basic_type: int, count: int) -> None:
+        self.heap += bytes([SUB_PRIMITIVE_ARRAY_DUMP]) + self._pack_id(self._id()) + struct.pack(">IIB", 0, count, basic_type)
+        self.heap += bytes(count * BASIC_TYPES[basic_type][0])
+
+    def root(self, object_id: int) -> None:
+        self.heap += bytes([0xFF]) + self._pack_id(object_id)
+
+    def close(self) -> None:
+        # a stack trace record between the class records and the heap exercises skipping unknown records
+        self._record(TAG_STACK_TRACE, struct.pack(">III", 1, 1, 0))
+        half = len(self.heap) // 2
+        # split into two segments at a sub-record boundary, as the JVM does for large heaps
+        boundary = self._segment_boundary(half)
+        self._record(TAG_HEAP_DUMP_SEGMENT, bytes(self.heap[:boundary]))
+        self._record(TAG_HEAP_DUMP_SEGMENT, bytes(self.heap[boundary:]))
+        self._record(TAG_HEAP_DUMP_END, b"")
+
+    def _segment_boundary(self, target: int) -> int:
+        return max((boundary for boundary in self.boundaries if boundary <= target), default=0)
+
+    def mark(self) -> None:
+        """Remember the current end of the heap data as a possible segment boundary."""
+        self.boundaries.append(len(self.heap))
+
+def write_sample(filename: str, id_size: int = 8, scale: int = 1) -> None:
+    """Write a small heap dump with Netty buffers, managed ledgers and arrays."""
+    with open(filename, "wb") as out:
+        writer = HprofWriter(out, id_size)
+        writer.define_class("java/lang/Object")
+        writer.define_class("java/lang/String", "java/lang/Object", [("value", OBJECT_TYPE), ("hash", 10)])
+        writer.define_class("[Ljava/lang/Object;", "java/lang/Object")
+        writer.define_class("io/netty/buffer/ByteBuf", "java/lang/Object")
+        writer.define_class("io/netty/buffer/AbstractByteBuf", "io/netty/buffer/ByteBuf",
+                            [("readerIndex", 10), ("writerIndex", 10)])
+        writer.define_class("io/netty/buffer/PooledUnsafeDirectByteBuf", "io/netty/buffer/AbstractByteBuf",
+                            [("memoryAddress", 11)])
+        writer.define_class("org/apache/bookkeeper/mledger/impl/ManagedLedgerImpl", "java/lang/Object",
+                            [("name", OBJECT_TYPE), ("state", OBJECT_TYPE)])
+        writer.define_class("org/apache/pulsar/broker/service/PendingAcksMap", "java/lang/Object",
+                            [("pendingAcks", OBJECT_TYPE)])
+        writer.mark()
+        for _ in range(100 * scale):
+            writer.root(writer.instance("java/lang/String", id_size + 4))
+            writer.primitive_array(8, 16)
+            writer.mark()
+        buffers = [writer.instance("io/netty/buffer/PooledUnsafeDirectByteBuf", 16) for _ in range(50 * scale)]
+        writer.mark()
+        writer.object_array("[Ljava/lang/Object;", buffers)
+        writer.mark()
+        for _ in range(3 * scale):
+            writer.instance("org/apache/bookkeeper/mledger/impl/ManagedLedgerImpl", 2 * id_size)
+            writer.instance("org/apache/pulsar/broker/service/PendingAcksMap", id_size)
+            writer.mark()
+        writer.primitive_array(11, 1000)
+        writer.mark()
+        writer.close()
+
+def main():
+    parser = ArgumentParser(description="Class histogram of HPROF heap dumps with Pulsar object counts")
+    parser.add_argument("filenames", nargs="+", metavar="filename",
+                       help="HPROF heap dump file(s)")
+    parser.add_argument("--diff", action="store_true",
+                       help="Compare two heap dumps and show the classes that grew the most")
+    parser.add_argument("--top", type=int, default=30,
+                       help="Number of classes to show (default: 30)")
+    parser.add_argument("--write-sample", action="store_true",
+                       help="Write a small generated heap dump to the given filename instead of reading it")
+    parser.add_argument("--id-size", type=int, choices=(4, 8), default=8,
+                       help="Identifier size of the --write-sample dump (default: 8)")
+    parser.add_argument("--scale", type=int, default=1,
+                       help="Multiplier for the object counts of the --write-sample dump (default: 1)")
+    args = parser.parse_args()
+
+    if args.write_sample:
+        for filename in args.filenames:
+            write_sample(filename, args.id_size, args.scale)
+        return
+    if args.diff and len(args.filenames) != 2:
+        parser.error("--diff requires exactly two heap dumps")
+    histograms = []
+    for filename in args.filenames:
+        try:
+            histograms.append(HprofHistogram(filename).parse())
+        except FileNotFoundError:
+            print(f"Error: Could not find file {filename}")
+            sys.exit(1)
+        except (ValueError, struct.error) as e:
+            print(f"Error reading heap dump {filename}: {str(e)}")
+            sys.exit(1)
+    if args.diff:
+        print_diff(histograms[0], histograms[1], args.top)
+        return
+    for histogram in histograms:
+        print_histogram(histogram, args.top)
+
+if __name__ == "__main__":
+    main()
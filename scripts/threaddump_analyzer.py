@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
+import contextlib
+import fnmatch
+import glob
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import pickle
 import re
+import shutil
+import sqlite3
+import subprocess
 import sys
+import tarfile
+import time
+import zipfile
+import zlib
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import List, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple, Union
 from argparse import ArgumentParser
 
 @dataclass
@@ -12,7 +32,42 @@ class DeadlockInfo:
     description: str
     waiting_threads: Dict[str, Dict[str, str]]  # thread name -> {waiting_for, holding}
 
-@dataclass
+class StackTable:
+    """Interns frames and stacks so that identical stacks are stored only once.
+
+    Frames are stored once in a shared table and a stack is a tuple of frame IDs.
+    Each unique stack tuple gets a stack ID, which is what a ThreadInfo refers to.
+    """
+
+    def __init__(self):
+        self.frames: List[str] = []
+        self.frame_index: Dict[str, int] = {}
+        self.stacks: List[Tuple[int, ...]] = []
+        self.stack_index: Dict[Tuple[int, ...], int] = {}
+
+    def intern_frame(self, frame: str) -> int:
+        frame_id = self.frame_index.get(frame)
+        if frame_id is None:
+            frame_id = self.frame_index[frame] = len(self.frames)
+            self.frames.append(frame)
+        return frame_id
+
+    def intern_stack(self, frames: List[str]) -> int:
+        """Return the stack ID of the given frames, adding the stack if it hasn't been seen before."""
+        frame_index = self.frame_index
+        frame_ids = tuple([frame_index[frame] if frame in frame_index else self.intern_frame(frame)
+                           for frame in frames])
+        stack_id = self.stack_index.get(frame_ids)
+        if stack_id is None:
+            stack_id = self.stack_index[frame_ids] = len(self.stacks)
+            self.stacks.append(frame_ids)
+        return stack_id
+
+    def resolve(self, stack_id: int) -> List[str]:
+        frames = self.frames
+        return [frames[frame_id] for frame_id in self.stacks[stack_id]]
+
+@dataclass(slots=True)
 class ThreadInfo:
     name: str
     tid: str = ""
@@ -20,141 +75,1117 @@ class ThreadInfo:
     state: str = ""
     cpu_time: str = ""
     elapsed_time: str = ""
-    stack_trace: List[str] = None
+    stack_id: int = 0
     waiting_on: str = ""
-    locked_sync: List[str] = None
-    locked_ownable: List[str] = None
+    parking_on: str = ""
+    object_wait: str = ""  # monitor released by Object.wait()
+    locked_sync: List[str] = field(default_factory=list)
+    locked_ownable: List[str] = field(default_factory=list)
+    virtual: bool = False
+    carrier: str = ""  # tid of the carrier thread a virtual thread is mounted on
+    container: str = ""  # thread container of JSON thread dumps
+    stack_table: Optional[StackTable] = field(default=None, repr=False, compare=False)
+
+    @property
+    def stack_trace(self) -> List[str]:
+        return self.stack_table.resolve(self.stack_id) if self.stack_table else []
+
+    @property
+    def stack_depth(self) -> int:
+        return len(self.stack_table.stacks[self.stack_id]) if self.stack_table else 0
+
+@dataclass
+class LockInfo:
+    address: str
+    class_name: str
+    owner: Optional[int] = None  # index of the owning thread
+    waiters: List[int] = field(default_factory=list)  # indexes of the threads blocked on the lock
+
+class LockGraph:
+    """Wait-for graph between the threads of a dump.
+
+    Edges go from a thread that is blocked on a monitor or parked on a j.u.c lock to the
+    thread owning that lock. Ownership comes from the "- locked" entries and the
+    "Locked ownable synchronizers" section of jstack -l output.
+    """
+
+    def __init__(self, threads: List[ThreadInfo]):
+        self.threads = threads
+        self.locks: Dict[str, LockInfo] = {}
+        self.edges: List[List[int]] = [[] for _ in threads]
+        self._build()
+
+    @staticmethod
+    def _split_lock(entry: str) -> Tuple[str, str]:
+        """Split an "0x... (a class)" or "0x... (class)" entry into address and class name."""
+        address, _, class_name = entry.partition(" ")
+        class_name = class_name.strip("()")
+        if class_name.startswith("a "):
+            class_name = class_name[2:]
+        return address, class_name
+
+    def _lock(self, entry: str) -> LockInfo:
+        address, class_name = self._split_lock(entry)
+        lock = self.locks.get(address)
+        if lock is None:
+            lock = self.locks[address] = LockInfo(address=address, class_name=class_name)
+        return lock
+
+    def _build(self) -> None:
+        threads = self.threads
+        for index, thread in enumerate(threads):
+            # a monitor released by Object.wait() is still reported as "- locked" by the frame that
+            # entered it, also while the thread is waiting to re-lock it, so no thread owns a lock it waits for
+            released = {entry.partition(" ")[0] for entry in (thread.object_wait, thread.waiting_on, thread.parking_on)}
+            for entry in thread.locked_sync + thread.locked_ownable:
+                lock = self._lock(entry)
+                if lock.address in released:
+                    continue
+                if lock.owner is None or (thread.state == "RUNNABLE" and threads[lock.owner].state != "RUNNABLE"):
+                    lock.owner = index
+        for index, thread in enumerate(self.threads):
+            for entry in (thread.waiting_on, thread.parking_on):
+                if not entry:
+                    continue
+                lock = self._lock(entry)
+                if lock.owner == index:
+                    continue
+                lock.waiters.append(index)
+                if lock.owner is not None:
+                    self.edges[index].append(lock.owner)
+
+    def strongly_connected_components(self) -> List[List[int]]:
+        """Tarjan's algorithm, iterative so that long wait chains don't hit the recursion limit.
+
+        Components are returned in reverse topological order: a component is emitted
+        after every component it waits for.
+        """
+        node_count = len(self.threads)
+        indexes = [-1] * node_count
+        lowlinks = [0] * node_count
+        on_stack = [False] * node_count
+        stack: List[int] = []
+        components: List[List[int]] = []
+        counter = 0
+
+        for root in range(node_count):
+            if indexes[root] != -1:
+                continue
+            indexes[root] = lowlinks[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            call_stack = [(root, iter(self.edges[root]))]
+            while call_stack:
+                node, successors = call_stack[-1]
+                for successor in successors:
+                    if indexes[successor] == -1:
+                        indexes[successor] = lowlinks[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack[successor] = True
+                        call_stack.append((successor, iter(self.edges[successor])))
+                        break
+                    if on_stack[successor]:
+                        lowlinks[node] = min(lowlinks[node], indexes[successor])
+                else:
+                    call_stack.pop()
+                    if call_stack:
+                        parent = call_stack[-1][0]
+                        lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+                    if lowlinks[node] == indexes[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = False
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+        return components
+
+    def find_cycles(self) -> List[List[int]]:
+        """Return the groups of threads that wait for each other, including cycles on j.u.c locks."""
+        return [component for component in self.strongly_connected_components() if len(component) > 1]
+
+    def blocked_counts(self) -> List[int]:
+        """Number of threads transitively blocked behind each thread.
+
+        A thread waits for at most one lock and a lock has at most one owner, so the
+        condensed graph is a forest and the counts can be summed in topological order.
+        """
+        components = self.strongly_connected_components()
+        component_of = [0] * len(self.threads)
+        for component_index, component in enumerate(components):
+            for member in component:
+                component_of[member] = component_index
+        component_blocked = [0] * len(components)
+        # waiters come after their owners in Tarjan's output, so walk it backwards
+        for component_index in range(len(components) - 1, -1, -1):
+            component = components[component_index]
+            for member in component:
+                for successor in self.edges[member]:
+                    successor_component = component_of[successor]
+                    if successor_component != component_index:
+                        component_blocked[successor_component] += len(component) + component_blocked[component_index]
+        return [component_blocked[component_of[index]] + len(components[component_of[index]]) - 1
+                for index in range(len(self.threads))]
+
+    def top_blockers(self, top: int = 10) -> List[Tuple[LockInfo, int]]:
+        """Rank owned locks with waiters by the number of threads transitively blocked behind their owner."""
+        blocked = self.blocked_counts()
+        contended = [(lock, blocked[lock.owner]) for lock in self.locks.values()
+                     if lock.owner is not None and lock.waiters]
+        contended.sort(key=lambda item: (item[1], len(item[0].waiters)), reverse=True)
+        return contended[:top]
+
+class JsonStreamReader:
+    """Minimal pull parser for JSON documents too large to load at once.
+
+    Objects and arrays are walked incrementally with iter_object/iter_array, while the
+    values the caller reads are decoded with json.JSONDecoder.raw_decode from a buffer
+    that is refilled from the file as needed.
+    """
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, f, initial: str = ""):
+        self.f = f
+        self.buffer = initial
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it, '' at the end of input."""
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' in JSON input, found '{self.peek()}'")
+        self.pos += 1
+
+    def read_value(self):
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number could continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def skip_value(self) -> None:
+        """Skip the next value without decoding large containers in one piece."""
+        char = self.peek()
+        if char == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        elif char == "[":
+            for _ in self.iter_array():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield the keys of the next object. The caller must consume each value before continuing."""
+        self._expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("}")
+            return
+
+    def iter_array(self) -> Iterator[int]:
+        """Yield the indexes of the next array. The caller must consume each element before continuing."""
+        self._expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("]")
+            return
+
+class ThreadPoolNormalizer:
+    """Maps thread names to thread pool names with configurable rules.
 
-    def __post_init__(self):
-        if self.stack_trace is None:
-            self.stack_trace = []
-        if self.locked_sync is None:
-            self.locked_sync = []
-        if self.locked_ownable is None:
-            self.locked_ownable = []
+    A rule is a pool name and a regex matched against the thread name. The pool name
+    may refer to groups of the regex, e.g. "\\1". User rules are tried before the default
+    rule, which strips the pool and thread index suffixes such as "-4-12" or "#3".
+    """
+    DEFAULT_RULES = [
+        # separators are only optional before the first number, so a digit run can't be split in many ways
+        (r"\1", r"^(.*?)[-_#. ]?\d+(?:[-_#. ]\d+)*$"),
+    ]
+
+    def __init__(self, rules: Optional[List[Tuple[str, str]]] = None):
+        self.rules = [(pool, re.compile(pattern)) for pool, pattern in (rules or []) + self.DEFAULT_RULES]
+        self._pools: Dict[str, str] = {}
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'ThreadPoolNormalizer':
+        """Read rules from a file with one "pool-name regex" rule per line, '#' starts a comment."""
+        rules = []
+        with open(filename, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                pool, _, pattern = line.partition(" ")
+                rules.append((pool, pattern.strip()))
+        return cls(rules)
+
+    def pool_of(self, thread_name: str) -> str:
+        pool = self._pools.get(thread_name)
+        if pool is None:
+            pool = thread_name
+            for pool_template, pattern in self.rules:
+                match = pattern.search(thread_name)
+                if match:
+                    pool = match.expand(pool_template) or thread_name
+                    break
+            self._pools[thread_name] = pool
+        return pool
+
+@dataclass
+class PoolStats:
+    pool: str
+    threads: int = 0
+    states: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    cpu_time: float = 0.0
+    cpu_rate: float = 0.0
+    top_frames: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    @property
+    def dominant_top_frame(self) -> Tuple[str, int]:
+        if not self.top_frames:
+            return ("", 0)
+        return max(self.top_frames.items(), key=lambda item: item[1])
+
+class ThreadPoolSummary:
+    """Per-pool table of thread states, CPU usage and the dominant top frame."""
+    STATES = ('RUNNABLE', 'BLOCKED', 'WAITING', 'TIMED_WAITING')
+
+    def __init__(self, threads: List[ThreadInfo], normalizer: Optional[ThreadPoolNormalizer] = None,
+                 cpu_deltas: Optional[List['ThreadCpuDelta']] = None):
+        self.normalizer = normalizer or ThreadPoolNormalizer()
+        self.has_cpu_rate = cpu_deltas is not None
+        pools: Dict[str, PoolStats] = {}
+        for thread in threads:
+            pool = self.normalizer.pool_of(thread.name)
+            stats = pools.get(pool)
+            if stats is None:
+                stats = pools[pool] = PoolStats(pool=pool)
+            stats.threads += 1
+            stats.states[thread.state] += 1
+            if thread.cpu_time:
+                stats.cpu_time += float(thread.cpu_time)
+            if thread.stack_depth:
+                stats.top_frames[thread.stack_table.frames[thread.stack_table.stacks[thread.stack_id][0]]] += 1
+        for delta in cpu_deltas or []:
+            # pools whose threads all exited before the last dump aren't listed
+            stats = pools.get(self.normalizer.pool_of(delta.thread.name))
+            if stats is not None:
+                stats.cpu_rate += delta.cpu_rate
+        self.pools = sorted(pools.values(), key=lambda stats: (stats.threads, stats.cpu_time), reverse=True)
+
+    def saturated_pools(self) -> List[Tuple[PoolStats, str]]:
+        """Pools with more than one thread where every thread is RUNNABLE or BLOCKED."""
+        return [(stats, state) for stats in self.pools for state in ('RUNNABLE', 'BLOCKED')
+                if stats.threads > 1 and stats.states.get(state) == stats.threads]
+
+    def print_report(self) -> None:
+        print("\n=== Thread Pools ===")
+        header = f"{'Pool':<45} {'Threads':>7} " + " ".join(f"{state:>13}" for state in self.STATES)
+        header += f" {'CPU ms':>10}" + (f" {'CPU ms/s':>9}" if self.has_cpu_rate else "") + "  Top frame"
+        print(header)
+        for stats in self.pools:
+            frame, count = stats.dominant_top_frame
+            row = f"{stats.pool[:45]:<45} {stats.threads:>7} "
+            row += " ".join(f"{stats.states.get(state, 0):>13}" for state in self.STATES)
+            row += f" {stats.cpu_time:>10.0f}" + (f" {stats.cpu_rate:>9.1f}" if self.has_cpu_rate else "")
+            if frame:
+                row += f"  {frame} ({count}/{stats.threads})"
+            print(row)
+        saturated = self.saturated_pools()
+        if saturated:
+            print("\nSaturated pools:")
+            for stats, state in saturated:
+                print(f"  {stats.pool}: all {stats.threads} threads {state}")
+
+@dataclass
+class ClassifierRule:
+    tag: str
+    frame_pattern: str  # regex searched in each frame of the stack
+    thread_pattern: str = ""  # optional regex searched in the thread name
+    state_pattern: str = ""  # optional regex matched against the whole thread state
+
+class ThreadClassifier:
+    """Tags threads by matching their frames against a library of Pulsar hot-path signatures.
+
+    The frame patterns of all rules are compiled into one regex of optional lookaheads,
+    so a single match call returns every rule that matches a frame. It runs once per
+    unique frame of the stack table and the tags of a stack are cached by stack ID, so
+    thousands of threads sharing stacks are classified without re-running the regex.
+    """
+    IO_THREAD_PATTERN = r"(?:^|-)io-\d|EventLoop"
+    FRAME_START = r"^(?:[\w.]+/)?"  # frames of JSON thread dumps start with the module, e.g. java.base/
+    DEFAULT_RULES = [
+        ClassifierRule("zookeeper-sync-call", FRAME_START + r"org\.apache\.zookeeper\.ClientCnxn\.submitRequest\("),
+        ClassifierRule("metadata-store-wait", FRAME_START + r"org\.apache\.pulsar\.metadata\.",
+                       state_pattern="WAITING|TIMED_WAITING|BLOCKED"),
+        ClassifierRule("managed-ledger-lock", FRAME_START + r"org\.apache\.bookkeeper\.mledger\.impl\.Managed(?:Ledger|Cursor)Impl\.",
+                       state_pattern="BLOCKED"),
+        ClassifierRule("bookkeeper-client-wait",
+                       FRAME_START + r"org\.apache\.bookkeeper\.client\.(?:SyncCallbackUtils\.waitForResult|"
+                       r"LedgerHandle\.(?:addEntry|readEntries|close)\()",
+                       state_pattern="WAITING|TIMED_WAITING"),
+        ClassifierRule("future-join-on-event-loop", FRAME_START + r"java\.util\.concurrent\.CompletableFuture\.(?:join|get)\(",
+                       thread_pattern=IO_THREAD_PATTERN),
+        ClassifierRule("sync-io-on-event-loop",
+                       FRAME_START + r"(?:java\.io\.(?:FileInputStream|FileOutputStream|RandomAccessFile)\.|sun\.nio\.ch\.FileChannelImpl\.|"
+                       r"java\.net\.InetAddress\.getAllByName)",
+                       thread_pattern=IO_THREAD_PATTERN),
+        ClassifierRule("lock-wait-on-event-loop", FRAME_START + r"java\.util\.concurrent\.locks\.LockSupport\.park",
+                       thread_pattern=IO_THREAD_PATTERN),
+    ]
+
+    def __init__(self, rules: Optional[List[ClassifierRule]] = None):
+        self.rules = self.DEFAULT_RULES + (rules or [])
+        self.frame_matcher = re.compile("".join(f"(?:(?=.*?(?P<r{i}>{rule.frame_pattern})))?"
+                                                for i, rule in enumerate(self.rules)))
+        self.thread_patterns = [re.compile(rule.thread_pattern) if rule.thread_pattern else None
+                                for rule in self.rules]
+        self.state_patterns = [re.compile(rule.state_pattern) if rule.state_pattern else None
+                               for rule in self.rules]
+        self._stack_table: Optional[StackTable] = None
+        self._frame_rules: Dict[int, Tuple[int, ...]] = {}
+        self._stack_rules: Dict[int, Tuple[int, ...]] = {}
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'ThreadClassifier':
+        """Read extra rules, one "tag frame-regex [thread=regex] [state=regex]" rule per line."""
+        rules = []
+        with open(filename, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                tag, frame_pattern, *options = line.split()
+                conditions = dict(option.split("=", 1) for option in options)
+                rules.append(ClassifierRule(tag, frame_pattern, conditions.get("thread", ""),
+                                            conditions.get("state", "")))
+        return cls(rules)
+
+    def _rules_for_frame(self, frame_id: int, frame: str) -> Tuple[int, ...]:
+        rule_indexes = self._frame_rules.get(frame_id)
+        if rule_indexes is None:
+            match = self.frame_matcher.match(frame)
+            rule_indexes = self._frame_rules[frame_id] = tuple(
+                int(name[1:]) for name, value in match.groupdict().items() if value is not None)
+        return rule_indexes
+
+    def _rules_for_stack(self, stack_table: StackTable, stack_id: int) -> Tuple[int, ...]:
+        if stack_table is not self._stack_table:
+            self._stack_table = stack_table
+            self._frame_rules = {}
+            self._stack_rules = {}
+        rule_indexes = self._stack_rules.get(stack_id)
+        if rule_indexes is None:
+            matched = set()
+            for frame_id in stack_table.stacks[stack_id]:
+                matched.update(self._rules_for_frame(frame_id, stack_table.frames[frame_id]))
+            rule_indexes = self._stack_rules[stack_id] = tuple(sorted(matched))
+        return rule_indexes
+
+    def classify(self, thread: ThreadInfo) -> List[str]:
+        """Return the tags of all rules matching the thread."""
+        if thread.stack_table is None:
+            return []
+        tags = []
+        for rule_index in self._rules_for_stack(thread.stack_table, thread.stack_id):
+            thread_pattern = self.thread_patterns[rule_index]
+            if thread_pattern is not None and not thread_pattern.search(thread.name):
+                continue
+            state_pattern = self.state_patterns[rule_index]
+            if state_pattern is not None and not state_pattern.fullmatch(thread.state):
+                continue
+            if self.rules[rule_index].tag not in tags:
+                tags.append(self.rules[rule_index].tag)
+        return tags
+
+    def print_report(self, threads: List[ThreadInfo], full_stack: bool = False) -> None:
+        """Print the number of threads per tag with a sample stack for each tag."""
+        tagged: Dict[str, List[ThreadInfo]] = defaultdict(list)
+        for thread in threads:
+            for tag in self.classify(thread):
+                tagged[tag].append(thread)
+        if not tagged:
+            return
+        print("\n=== Thread Classification ===")
+        for tag, tag_threads in sorted(tagged.items(), key=lambda item: len(item[1]), reverse=True):
+            sample = tag_threads[0]
+            print(f"\n{tag}: {len(tag_threads)} thread(s)")
+            print(f"Sample thread: {sample.name} ({sample.state})")
+            stack_trace = sample.stack_trace
+            if stack_trace:
+                print("Stack trace:")
+                frames = stack_trace if full_stack else stack_trace[:5]
+                for frame in frames:
+                    print(f"  {frame}")
+                if not full_stack and len(stack_trace) > 5:
+                    print(f"  ... ({len(stack_trace) - 5} more lines)")
+
+class ThreadIndex:
+    """Hash indexes over the threads of a dump for answering queries without rescanning the threads.
+
+    Threads are indexed by state, name, pool and the address of every lock they hold or wait
+    on. Frame queries run over the interned frames of the stack table, which are far fewer
+    than the frames of all threads, and map matching frames to threads via their stacks.
+    Query results are sets of thread indexes.
+    """
+    FIELDS = ("state", "name", "pool", "lock", "frame")
+
+    def __init__(self, threads: List[ThreadInfo], stack_table: StackTable,
+                 normalizer: Optional[ThreadPoolNormalizer] = None):
+        self.threads = threads
+        self.stack_table = stack_table
+        self.normalizer = normalizer or ThreadPoolNormalizer()
+        self.by_state: Dict[str, List[int]] = defaultdict(list)
+        self.by_name: Dict[str, List[int]] = defaultdict(list)
+        self.by_pool: Dict[str, List[int]] = defaultdict(list)
+        self.by_lock: Dict[str, List[int]] = defaultdict(list)
+        self.by_stack: Dict[int, List[int]] = defaultdict(list)
+        self.lock_classes: Dict[str, str] = {}
+        self._frame_stacks: Optional[Dict[int, List[int]]] = None
+        self._frame_queries: Dict[str, FrozenSet[int]] = {}
+        for index, thread in enumerate(threads):
+            self.by_state[thread.state].append(index)
+            self.by_name[thread.name].append(index)
+            self.by_pool[self.normalizer.pool_of(thread.name)].append(index)
+            self.by_stack[thread.stack_id].append(index)
+            for entry in (thread.waiting_on, thread.parking_on, thread.object_wait,
+                          *thread.locked_sync, *thread.locked_ownable):
+                if entry:
+                    address, class_name = LockGraph._split_lock(entry)
+                    self.lock_classes[address] = class_name
+                    if not self.by_lock[address] or self.by_lock[address][-1] != index:
+                        self.by_lock[address].append(index)
+
+    def _frame_index(self) -> Dict[int, List[int]]:
+        """Map each frame id to the ids of the stacks of this dump containing it, built on first use."""
+        if self._frame_stacks is None:
+            self._frame_stacks = defaultdict(list)
+            stacks = self.stack_table.stacks
+            for stack_id in self.by_stack:
+                for frame_id in set(stacks[stack_id]):
+                    self._frame_stacks[frame_id].append(stack_id)
+        return self._frame_stacks
+
+    def _frame_matches(self, pattern: str) -> FrozenSet[int]:
+        result = self._frame_queries.get(pattern)
+        if result is None:
+            regex = re.compile(pattern)
+            frames = self.stack_table.frames
+            stack_ids = {stack_id for frame_id, stack_ids in self._frame_index().items()
+                         if regex.search(frames[frame_id]) for stack_id in stack_ids}
+            result = self._frame_queries[pattern] = frozenset(
+                index for stack_id in stack_ids for index in self.by_stack[stack_id])
+        return result
+
+    def match(self, field_name: str, operator: str, value: str) -> FrozenSet[int]:
+        """Indexes of the threads whose field equals ('=') or contains a match of the regex ('~') value."""
+        if field_name == "frame":
+            if operator == "=":
+                frame_id = self.stack_table.frame_index.get(value)
+                stack_ids = self._frame_index().get(frame_id, []) if frame_id is not None else []
+                return frozenset(index for stack_id in stack_ids for index in self.by_stack[stack_id])
+            return self._frame_matches(value)
+        if field_name == "lock":
+            keys = {address: f"{address} {class_name}" for address, class_name in self.lock_classes.items()}
+            index = self.by_lock
+        else:
+            index = {"state": self.by_state, "name": self.by_name, "pool": self.by_pool}[field_name]
+            keys = {key: key for key in index}
+        if operator == "=":
+            return frozenset(index.get(value, []))
+        regex = re.compile(value)
+        return frozenset(thread for key, text in keys.items() if regex.search(text) for thread in index[key])
+
+    def query(self, expression: Union[str, 'ThreadFilter']) -> List[ThreadInfo]:
+        """Threads matching a filter expression, in dump order."""
+        thread_filter = expression if isinstance(expression, ThreadFilter) else ThreadFilter(expression)
+        return [self.threads[index] for index in sorted(thread_filter.evaluate(self))]
+
+class ThreadFilter:
+    """Filter expression over thread fields, evaluated against a ThreadIndex.
+
+    Terms are field=value for an exact match, field!=value for its negation and field~regex
+    for a regex search, with the fields state, name, pool, lock and frame. Terms combine
+    with 'and', 'or', 'not' and parentheses, values containing spaces or parentheses are
+    quoted with double quotes, e.g.
+
+        state=BLOCKED and frame~ManagedLedgerImpl and (pool=pulsar-io or not lock~Semaphore)
+    """
+    TOKEN_PATTERN = re.compile(r'\s*(?:(\(|\))|(\w+)(!=|=|~)("[^"]*"|[^\s()]*)|(\S+))')
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+        self.tree = self._parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.position][1]}' in filter expression")
+
+    def _tokenize(self, expression: str) -> List[Tuple[str, object]]:
+        tokens = []
+        for match in self.TOKEN_PATTERN.finditer(expression.strip()):
+            paren, field_name, operator, value, word = match.groups()
+            if paren:
+                tokens.append((paren, paren))
+            elif field_name:
+                if field_name not in ThreadIndex.FIELDS:
+                    raise ValueError(f"Unknown field '{field_name}' in filter expression, "
+                                     f"expected one of {', '.join(ThreadIndex.FIELDS)}")
+                if value.startswith('"'):
+                    value = value[1:-1]
+                if operator == "~":
+                    try:
+                        re.compile(value)
+                    except re.error as e:
+                        raise ValueError(f"Invalid regex '{value}' in filter expression: {e}") from None
+                tokens.append(("term", (field_name, operator, value)))
+            elif word in ("and", "or", "not"):
+                tokens.append((word, word))
+            elif word:
+                raise ValueError(f"Expected a field=value term instead of '{word}' in filter expression")
+        return tokens
+
+    def _peek(self) -> str:
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else ""
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._peek() == "or":
+            self.position += 1
+            node = ("or", node, self._parse_and())
+        return node
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._peek() == "and":
+            self.position += 1
+            node = ("and", node, self._parse_not())
+        return node
+
+    def _parse_not(self):
+        kind = self._peek()
+        if kind == "not":
+            self.position += 1
+            return ("not", self._parse_not())
+        if kind == "(":
+            self.position += 1
+            node = self._parse_or()
+            if self._peek() != ")":
+                raise ValueError("Missing ')' in filter expression")
+            self.position += 1
+            return node
+        if kind == "term":
+            term = self.tokens[self.position][1]
+            self.position += 1
+            return ("term", term)
+        raise ValueError(f"Incomplete filter expression '{self.expression}'")
+
+    def evaluate(self, index: ThreadIndex, node=None) -> FrozenSet[int]:
+        node = node if node is not None else self.tree
+        kind = node[0]
+        if kind == "term":
+            field_name, operator, value = node[1]
+            if operator == "!=":
+                return frozenset(range(len(index.threads))) - index.match(field_name, "=", value)
+            return index.match(field_name, operator, value)
+        if kind == "not":
+            return frozenset(range(len(index.threads))) - self.evaluate(index, node[1])
+        left = self.evaluate(index, node[1])
+        right = self.evaluate(index, node[2])
+        return left & right if kind == "and" else left | right
 
 class ThreadDumpAnalyzer:
     THREAD_START_PATTERN = re.compile(r'^"([^"]+)"\s+#\d+.*tid=(0x[0-9a-f]+)\s+nid=(0x[0-9a-f]+)\s+.*\[(0x[0-9a-f]+)\]?.*')
     THREAD_STATE_PATTERN = re.compile(r'^\s+java.lang.Thread.State: ([A-Z_]+)(?:\s+\((.*)\))?')
     STACK_TRACE_PATTERN = re.compile(r'^\s+at (.+)')
     LOCKED_SYNC_PATTERN = re.compile(r'^\s+- locked <(0x[0-9a-f]+)> \(a ([^)]+)\)')
-    LOCKED_OWNABLE_PATTERN = re.compile(r'^\s+- locked <(0x[0-9a-f]+)> \(([^)]+)\)')
-    WAITING_ON_PATTERN = re.compile(r'^\s+- waiting to lock <(0x[0-9a-f]+)> \(([^)]+)\)')
+    LOCKED_OWNABLE_PATTERN = re.compile(r'^\s+- <(0x[0-9a-f]+)> \(a ([^)]+)\)')
+    WAITING_ON_PATTERN = re.compile(r'^\s+- waiting to (?:lock|re-lock in wait\(\)) <(0x[0-9a-f]+)> \(([^)]+)\)')
+    PARKING_ON_PATTERN = re.compile(r'^\s+- parking to wait for\s+<(0x[0-9a-f]+)> \(a ([^)]+)\)')
+    OBJECT_WAIT_PATTERN = re.compile(r'^\s+- waiting on <(0x[0-9a-f]+)> \(a ([^)]+)\)')
+    DEADLOCK_MONITOR_PATTERN = re.compile(r'waiting to lock monitor 0x[0-9a-f]+ \(object (0x[0-9a-f]+), a ([^)]+)\)')
+    DEADLOCK_SYNCHRONIZER_PATTERN = re.compile(r'waiting for ownable synchronizer (0x[0-9a-f]+), \(a ([^)]+)\)')
+    DEADLOCK_HELD_BY_PATTERN = re.compile(r'which is held by "([^"]+)"')
     DEADLOCK_START_PATTERN = re.compile(r'^Found (\d+) Java-level deadlock')
     CPU_TIME_PATTERN = re.compile(r'cpu=([\d.]+)ms\s+elapsed=([\d.]+)s')
+    DUMP_TIMESTAMP_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})$')
+    PARSERS = ("fast", "regex")
+    READ_CHUNK_SIZE = 4 * 1024 * 1024
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, stack_table: Optional[StackTable] = None):
         self.filename = filename
+        # share a stack table between dumps of the same JVM so their stack IDs are comparable
+        self.stack_table = stack_table if stack_table is not None else StackTable()
+        self.timestamp: Optional[datetime] = None
         self.threads: List[ThreadInfo] = []
         self.deadlocks: List[DeadlockInfo] = []
+        self._index: Optional[ThreadIndex] = None
+
+    def index(self, normalizer: Optional[ThreadPoolNormalizer] = None) -> ThreadIndex:
+        """Index of the threads, built on first use and rebuilt for a different pool normalizer."""
+        if self._index is None or (normalizer is not None and self._index.normalizer is not normalizer):
+            self._index = ThreadIndex(self.threads, self.stack_table, normalizer)
+        return self._index
 
-    def parse_thread_dump(self) -> None:
+    def filtered(self, thread_filter: ThreadFilter, normalizer: Optional[ThreadPoolNormalizer] = None
+                 ) -> 'ThreadDumpAnalyzer':
+        """Copy of this dump holding only the threads matching the filter, for feeding the reports."""
+        dump = ThreadDumpAnalyzer(self.filename, self.stack_table)
+        dump.timestamp = self.timestamp
+        dump.threads = self.index(normalizer).query(thread_filter)
+        names = {thread.name for thread in dump.threads}
+        dump.deadlocks = [deadlock for deadlock in self.deadlocks if names.intersection(deadlock.waiting_threads)]
+        return dump
+
+    def parse_thread_dump(self, parser: str = "fast") -> None:
+        """Parse the dump file with the selected parser backend."""
+        try:
+            with open_dump_text(self.filename) as f:
+                self.parse_stream(f, parser)
+        except FileNotFoundError:
+            print(f"Error: Could not find file {self.filename}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error reading thread dump file: {str(e)}")
+            sys.exit(1)
+
+    def parse_stream(self, f, parser: str = "fast") -> None:
+        """Parse a text stream holding a jstack dump or a JSON dump of jcmd Thread.dump_to_file -format=json."""
+        head = f.read(self.READ_CHUNK_SIZE)
+        if head.lstrip().startswith("{"):
+            self._parse_json(JsonStreamReader(f, head))
+        else:
+            self.parse_lines(self._read_lines(f, head), parser)
+
+    def parse_lines(self, lines, parser: str = "fast") -> None:
+        """Parse a dump from an iterable of lines, e.g. one dump split out of a stream."""
+        if parser == "regex":
+            self._parse_lines_regex(lines)
+        else:
+            self._parse_lines_fast(lines)
+
+    def _parse_lines_regex(self, lines) -> None:
+        """Reference parser that matches every line against the line patterns."""
         current_thread = None
+        frames: List[str] = []
         in_deadlock_section = False
         deadlock_buffer = []
         current_deadlock = None
         in_stack_info = False
         
+        for line in lines:
+            line = line.rstrip()
+
+            # jstack prints the dump timestamp on the first line
+            if self.timestamp is None and not self.threads:
+                timestamp_match = self.DUMP_TIMESTAMP_PATTERN.match(line)
+                if timestamp_match:
+                    self.timestamp = datetime.strptime(timestamp_match.group(1), '%Y-%m-%d %H:%M:%S')
+                    continue
+            
+            # Check for deadlock section
+            if "Found" in line and "Java-level deadlock" in line:
+                # the stack information that follows the section repeats the threads, don't attribute it to the last one
+                if current_thread:
+                    self._finish_thread(current_thread, frames)
+                    current_thread = None
+                    frames = []
+                in_deadlock_section = True
+                deadlock_buffer = [line]
+                current_deadlock = DeadlockInfo(
+                    threads=[],
+                    description="",
+                    waiting_threads={}
+                )
+                continue
+
+            if in_deadlock_section:
+                if line.strip():
+                    deadlock_buffer.append(line)
+                    self._parse_deadlock_line(current_deadlock, line)
+                elif deadlock_buffer:  # Empty line marks end of section
+                    current_deadlock.description = "\n".join(deadlock_buffer)
+                    self._finish_deadlock(current_deadlock)
+                    self.deadlocks.append(current_deadlock)
+                    in_deadlock_section = False
+                    in_stack_info = False
+                    deadlock_buffer = []
+                continue
+            
+            # Parse thread information
+            thread_match = self.THREAD_START_PATTERN.match(line)
+            if thread_match:
+                if current_thread:
+                    self._finish_thread(current_thread, frames)
+                    frames = []
+                current_thread = ThreadInfo(
+                    name=thread_match.group(1),
+                    tid=thread_match.group(2),
+                    nid=thread_match.group(3)
+                )
+                # Extract CPU time if present
+                cpu_match = self.CPU_TIME_PATTERN.search(line)
+                if cpu_match:
+                    current_thread.cpu_time = cpu_match.group(1)
+                    current_thread.elapsed_time = cpu_match.group(2)
+                self.threads.append(current_thread)
+                continue
+
+            if current_thread:
+                state_match = self.THREAD_STATE_PATTERN.match(line)
+                if state_match:
+                    current_thread.state = state_match.group(1)
+                    continue
+
+                stack_match = self.STACK_TRACE_PATTERN.match(line)
+                if stack_match:
+                    frames.append(stack_match.group(1))
+                    continue
+
+                locked_sync_match = self.LOCKED_SYNC_PATTERN.match(line)
+                if locked_sync_match:
+                    current_thread.locked_sync.append(
+                        f"{locked_sync_match.group(1)} ({locked_sync_match.group(2)})"
+                    )
+                    if self.deadlocks and current_thread.name in self.deadlocks[-1].waiting_threads:
+                        self.deadlocks[-1].waiting_threads[current_thread.name]['holding'] = locked_sync_match.group(1)
+                    continue
+
+                waiting_match = self.WAITING_ON_PATTERN.match(line)
+                if waiting_match:
+                    current_thread.waiting_on = f"{waiting_match.group(1)} ({waiting_match.group(2)})"
+                    continue
+
+                parking_match = self.PARKING_ON_PATTERN.match(line)
+                if parking_match:
+                    current_thread.parking_on = f"{parking_match.group(1)} ({parking_match.group(2)})"
+                    continue
+
+                object_wait_match = self.OBJECT_WAIT_PATTERN.match(line)
+                if object_wait_match:
+                    current_thread.object_wait = f"{object_wait_match.group(1)} ({object_wait_match.group(2)})"
+                    continue
+
+                locked_ownable_match = self.LOCKED_OWNABLE_PATTERN.match(line)
+                if locked_ownable_match:
+                    current_thread.locked_ownable.append(
+                        f"{locked_ownable_match.group(1)} ({locked_ownable_match.group(2)})"
+                    )
+                    continue
+
+        if current_thread:
+            self._finish_thread(current_thread, frames)
+
+    def _finish_thread(self, thread: ThreadInfo, frames: List[str]) -> None:
+        """Intern the collected frames of a thread once its section of the dump has ended."""
+        thread.stack_table = self.stack_table
+        thread.stack_id = self.stack_table.intern_stack(frames)
+
+    def _parse_deadlock_line(self, deadlock: DeadlockInfo, line: str) -> None:
+        """Capture thread names and waiting relationships from a line of a jstack deadlock section."""
+        if line.startswith('"'):
+            thread_name = line.split('"')[1]
+            if thread_name not in deadlock.threads:
+                deadlock.threads.append(thread_name)
+            return
+        if not deadlock.threads:
+            return
+        waiting_info = deadlock.waiting_threads.setdefault(deadlock.threads[-1], {})
+        waiting_match = (self.WAITING_ON_PATTERN.match(line)
+                         or self.DEADLOCK_MONITOR_PATTERN.search(line)
+                         or self.DEADLOCK_SYNCHRONIZER_PATTERN.search(line))
+        if waiting_match:
+            waiting_info['waiting_for'] = waiting_match.group(1)
+            return
+        held_by_match = self.DEADLOCK_HELD_BY_PATTERN.search(line)
+        if held_by_match:
+            waiting_info['held_by'] = held_by_match.group(1)
+
+    @staticmethod
+    def _finish_deadlock(deadlock: DeadlockInfo) -> None:
+        """Derive the lock each deadlocked thread holds from the locks the other threads are waiting for."""
+        for waiting_info in list(deadlock.waiting_threads.values()):
+            if 'held_by' in waiting_info and 'waiting_for' in waiting_info:
+                holder_info = deadlock.waiting_threads.setdefault(waiting_info['held_by'], {})
+                holder_info['holding'] = waiting_info['waiting_for']
+
+    def move_to_stack_table(self, stack_table: StackTable) -> None:
+        """Re-intern the stacks of this dump into another table, e.g. after parsing in a worker process."""
+        if stack_table is self.stack_table:
+            return
+        stack_ids: Dict[int, int] = {}
+        for thread in self.threads:
+            stack_id = stack_ids.get(thread.stack_id)
+            if stack_id is None:
+                stack_id = stack_ids[thread.stack_id] = stack_table.intern_stack(thread.stack_trace)
+            thread.stack_id = stack_id
+            thread.stack_table = stack_table
+        self.stack_table = stack_table
+
+    def _parse_json(self, reader: JsonStreamReader) -> None:
+        """Parse a JSON thread dump, streaming one thread object at a time."""
+        for key in reader.iter_object():
+            if key != "threadDump":
+                reader.skip_value()
+                continue
+            for key in reader.iter_object():
+                if key == "time":
+                    self.timestamp = self._parse_json_time(reader.read_value())
+                elif key == "threadContainers":
+                    for _ in reader.iter_array():
+                        container = ""
+                        for key in reader.iter_object():
+                            if key == "container":
+                                container = reader.read_value() or ""
+                            elif key == "threads":
+                                for _ in reader.iter_array():
+                                    self._add_json_thread(reader.read_value(), container)
+                            else:
+                                reader.skip_value()
+                else:
+                    reader.skip_value()
+
+    @staticmethod
+    def _parse_json_time(value: str) -> Optional[datetime]:
+        # fromisoformat accepts at most microseconds
+        value = re.sub(r'(\.\d{6})\d+', r'\1', value.replace("Z", "+00:00"))
         try:
-            with open(self.filename, 'r') as f:
-                for line in f:
-                    line = line.rstrip()
-                    
-                    # Check for deadlock section
-                    if "Found" in line and "Java-level deadlock" in line:
-                        in_deadlock_section = True
-                        deadlock_buffer = [line]
-                        current_deadlock = DeadlockInfo(
-                            threads=[],
-                            description="",
-                            waiting_threads={}
-                        )
-                        continue
-
-                    if in_deadlock_section:
-                        if line.strip():
-                            deadlock_buffer.append(line)
-                            # Capture thread names in deadlock
-                            if line.startswith('"'):
-                                thread_name = line.split('"')[1]
-                                if thread_name not in current_deadlock.threads:
-                                    current_deadlock.threads.append(thread_name)
-                            # Parse waiting relationships
-                            waiting_match = self.WAITING_ON_PATTERN.match(line)
-                            if waiting_match and current_deadlock.threads:
-                                thread_name = current_deadlock.threads[-1]
-                                if thread_name not in current_deadlock.waiting_threads:
-                                    current_deadlock.waiting_threads[thread_name] = {}
-                                current_deadlock.waiting_threads[thread_name]['waiting_for'] = waiting_match.group(1)
-                        elif deadlock_buffer:  # Empty line marks end of section
-                            current_deadlock.description = "\n".join(deadlock_buffer)
-                            self.deadlocks.append(current_deadlock)
-                            in_deadlock_section = False
-                            in_stack_info = False
-                            deadlock_buffer = []
-                        continue
-                    
-                    # Parse thread information
-                    thread_match = self.THREAD_START_PATTERN.match(line)
-                    if thread_match:
-                        current_thread = ThreadInfo(
-                            name=thread_match.group(1),
-                            tid=thread_match.group(2),
-                            nid=thread_match.group(3)
-                        )
-                        # Extract CPU time if present
-                        cpu_match = self.CPU_TIME_PATTERN.search(line)
-                        if cpu_match:
-                            current_thread.cpu_time = cpu_match.group(1)
-                            current_thread.elapsed_time = cpu_match.group(2)
-                        self.threads.append(current_thread)
-                        continue
-
-                    if current_thread:
-                        state_match = self.THREAD_STATE_PATTERN.match(line)
-                        if state_match:
-                            current_thread.state = state_match.group(1)
-                            continue
-
-                        stack_match = self.STACK_TRACE_PATTERN.match(line)
-                        if stack_match:
-                            current_thread.stack_trace.append(stack_match.group(1))
-                            continue
-
-                        locked_sync_match = self.LOCKED_SYNC_PATTERN.match(line)
-                        if locked_sync_match:
-                            current_thread.locked_sync.append(
-                                f"{locked_sync_match.group(1)} ({locked_sync_match.group(2)})"
-                            )
-                            if self.deadlocks and current_thread.name in self.deadlocks[-1].waiting_threads:
-                                self.deadlocks[-1].waiting_threads[current_thread.name]['holding'] = locked_sync_match.group(1)
-                            continue
-
-                        waiting_match = self.WAITING_ON_PATTERN.match(line)
-                        if waiting_match:
-                            current_thread.waiting_on = f"{waiting_match.group(1)} ({waiting_match.group(2)})"
-                            continue
+            return datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            return None
 
-        except FileNotFoundError:
-            print(f"Error: Could not find file {self.filename}")
-            sys.exit(1)
-        except Exception as e:
-            print(f"Error reading thread dump file: {str(e)}")
-            sys.exit(1)
+    def _add_json_thread(self, data: Dict, container: str) -> None:
+        frames = data.get("stack") or []
+        tid = str(data.get("tid", ""))
+        virtual = bool(data.get("virtual")) or bool(frames and "java.lang.VirtualThread.run" in frames[-1])
+        name = data.get("name") or (f"virtual-{tid}" if virtual else f"thread-{tid}")
+        thread = ThreadInfo(
+            name=name,
+            tid=tid,
+            state=data.get("state", ""),
+            virtual=virtual,
+            carrier=str(data.get("carrier") or ""),
+            container=container
+        )
+        self.threads.append(thread)
+        self._finish_thread(thread, frames)
+
+    @classmethod
+    def _read_lines(cls, f, head: str = ""):
+        """Yield lines from large chunk reads, which is much cheaper than iterating the file object."""
+        remainder = head
+        while True:
+            chunk = f.read(cls.READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split("\n")
+            remainder = lines.pop()
+            yield from lines
+        if remainder:
+            yield from remainder.split("\n")
+
+    def _parse_lines_fast(self, lines) -> None:
+        """Parser that dispatches on the line prefix and only runs a regex on the few lines that need one.
+
+        Produces the same model as _parse_lines_regex. Stack frame lines, which make up most of
+        a dump, are handled with plain string operations.
+        """
+        threads = self.threads
+        current_thread = None
+        frames: List[str] = []
+        in_deadlock_section = False
+        deadlock_buffer = []
+        current_deadlock = None
+
+        for line in lines:
+            line = line.rstrip()
+            if not line:
+                if in_deadlock_section:  # Empty line marks end of section
+                    current_deadlock.description = "\n".join(deadlock_buffer)
+                    self._finish_deadlock(current_deadlock)
+                    self.deadlocks.append(current_deadlock)
+                    in_deadlock_section = False
+                    deadlock_buffer = []
+                continue
+
+            first = line[0]
+            if first == 'F' and line.startswith("Found") and "Java-level deadlock" in line:
+                if current_thread is not None:
+                    self._finish_thread(current_thread, frames)
+                    current_thread = None
+                    frames = []
+                in_deadlock_section = True
+                deadlock_buffer = [line]
+                current_deadlock = DeadlockInfo(
+                    threads=[],
+                    description="",
+                    waiting_threads={}
+                )
+                continue
 
-    def analyze(self, runnable_only: bool = False, full_stack: bool = False) -> None:
+            if in_deadlock_section:
+                deadlock_buffer.append(line)
+                self._parse_deadlock_line(current_deadlock, line)
+                continue
+
+            if first == '"':
+                thread_match = self.THREAD_START_PATTERN.match(line)
+                if thread_match:
+                    if current_thread is not None:
+                        self._finish_thread(current_thread, frames)
+                        frames = []
+                    current_thread = ThreadInfo(
+                        name=thread_match.group(1),
+                        tid=thread_match.group(2),
+                        nid=thread_match.group(3)
+                    )
+                    cpu_match = self.CPU_TIME_PATTERN.search(line)
+                    if cpu_match:
+                        current_thread.cpu_time = cpu_match.group(1)
+                        current_thread.elapsed_time = cpu_match.group(2)
+                    threads.append(current_thread)
+                continue
+
+            if first != '\t' and first != ' ':
+                if self.timestamp is None and not threads:
+                    timestamp_match = self.DUMP_TIMESTAMP_PATTERN.match(line)
+                    if timestamp_match:
+                        self.timestamp = datetime.strptime(timestamp_match.group(1), '%Y-%m-%d %H:%M:%S')
+                continue
+            if current_thread is None:
+                continue
+
+            body = line.lstrip()
+            if body.startswith("at "):
+                frames.append(body[3:])
+            elif body.startswith("- locked <"):
+                locked_sync_match = self.LOCKED_SYNC_PATTERN.match(line)
+                if locked_sync_match:
+                    current_thread.locked_sync.append(
+                        f"{locked_sync_match.group(1)} ({locked_sync_match.group(2)})"
+                    )
+                    if self.deadlocks and current_thread.name in self.deadlocks[-1].waiting_threads:
+                        self.deadlocks[-1].waiting_threads[current_thread.name]['holding'] = locked_sync_match.group(1)
+            elif body.startswith("- waiting to "):
+                waiting_match = self.WAITING_ON_PATTERN.match(line)
+                if waiting_match:
+                    current_thread.waiting_on = f"{waiting_match.group(1)} ({waiting_match.group(2)})"
+            elif body.startswith("- parking to wait for"):
+                parking_match = self.PARKING_ON_PATTERN.match(line)
+                if parking_match:
+                    current_thread.parking_on = f"{parking_match.group(1)} ({parking_match.group(2)})"
+            elif body.startswith("- waiting on <"):
+                object_wait_match = self.OBJECT_WAIT_PATTERN.match(line)
+                if object_wait_match:
+                    current_thread.object_wait = f"{object_wait_match.group(1)} ({object_wait_match.group(2)})"
+            elif body.startswith("- <"):
+                locked_ownable_match = self.LOCKED_OWNABLE_PATTERN.match(line)
+                if locked_ownable_match:
+                    current_thread.locked_ownable.append(
+                        f"{locked_ownable_match.group(1)} ({locked_ownable_match.group(2)})"
+                    )
+            elif body.startswith("java.lang.Thread.State: "):
+                state_match = self.THREAD_STATE_PATTERN.match(line)
+                if state_match:
+                    current_thread.state = state_match.group(1)
+
+        if current_thread is not None:
+            self._finish_thread(current_thread, frames)
+
+    @classmethod
+    def compare_parsers(cls, filename: str) -> bool:
+        """Parse a file with every parser backend, print the throughput and check that the results are equal."""
+        size_mb = os.path.getsize(filename) / (1024 * 1024)
+        results = {}
+        stack_table = StackTable()
+        print(f"\n=== Parser Comparison: {filename} ({size_mb:.1f} MB) ===")
+        for parser in cls.PARSERS:
+            analyzer = cls(filename, stack_table)
+            start = time.perf_counter()
+            analyzer.parse_thread_dump(parser)
+            duration = time.perf_counter() - start
+            results[parser] = analyzer
+            print(f"{parser}: {duration:.3f}s, {size_mb / duration if duration else 0:.1f} MB/s, "
+                  f"{len(analyzer.threads) / duration if duration else 0:.0f} threads/s")
+        reference = results[cls.PARSERS[-1]]
+        equal = True
+        for parser, analyzer in results.items():
+            if (analyzer.threads, analyzer.deadlocks, analyzer.timestamp) != \
+                    (reference.threads, reference.deadlocks, reference.timestamp):
+                equal = False
+                print(f"Output of the {parser} parser differs from the {cls.PARSERS[-1]} parser")
+        if equal:
+            print(f"Output is equal: {len(reference.threads)} threads, {len(reference.deadlocks)} deadlocks")
+        return equal
+
+    def analyze(self, runnable_only: bool = False, full_stack: bool = False,
+                pool_normalizer: Optional[ThreadPoolNormalizer] = None,
+                classifier: Optional[ThreadClassifier] = None) -> None:
         """Analyze the thread dump and print results."""
         if not self.threads:
             print("No threads found in the dump file.")
             return
 
         self._print_thread_state_summary()
+        ThreadPoolSummary(self.threads, pool_normalizer).print_report()
         
         if runnable_only:
             self._print_runnable_threads(full_stack)
         else:
             self._print_deadlock_analysis(full_stack)
+            self._print_lock_analysis(full_stack)
+            (classifier or ThreadClassifier()).print_report(self.threads, full_stack)
             self._print_cpu_analysis(full_stack)
+            self._print_stack_groups(full_stack)
+            self._print_virtual_threads()
             self._print_blocked_threads(full_stack)
             self._print_waiting_threads(full_stack)
 
@@ -185,27 +1216,59 @@ class ThreadDumpAnalyzer:
                     if 'holding' in waiting_info:
                         print(f"    - Holding lock: <{waiting_info['holding']}>")
                     # Find matching thread to print its stack trace
-                    for t in self.threads:
-                        if t.name == thread:
-                            frames = t.stack_trace if full_stack else t.stack_trace[:3]
-                            if frames:
-                                print("    Stack trace:")
-                                for frame in frames:
-                                    print(f"      {frame}")
-                                if not full_stack and len(t.stack_trace) > 3:
-                                    print(f"      ... ({len(t.stack_trace) - 3} more lines)")
-                                break
+                    for index in self.index().by_name.get(thread, []):
+                        t = self.threads[index]
+                        frames = t.stack_trace if full_stack else t.stack_trace[:3]
+                        if frames:
+                            print("    Stack trace:")
+                            for frame in frames:
+                                print(f"      {frame}")
+                            if not full_stack and len(t.stack_trace) > 3:
+                                print(f"      ... ({len(t.stack_trace) - 3} more lines)")
+                            break
                 print("\nFull deadlock description:")
                 print(deadlock.description)
                 print("----------------------------------------")
 
+    def _print_lock_analysis(self, full_stack: bool = False) -> None:
+        """Print lock cycles and the locks with the most threads blocked behind their owner."""
+        graph = LockGraph(self.threads)
+        cycles = graph.find_cycles()
+        if cycles:
+            print("\n=== Lock Cycles ===")
+            for i, cycle in enumerate(cycles, 1):
+                print(f"\nCycle #{i}: {len(cycle)} thread(s)")
+                for index in reversed(cycle):
+                    thread = self.threads[index]
+                    address, class_name = LockGraph._split_lock(thread.waiting_on or thread.parking_on)
+                    owner = self.threads[graph.edges[index][0]].name
+                    print(f"  {thread.name} ({thread.state}) waits for <{address}> ({class_name}) held by {owner}")
+            print("----------------------------------------")
+
+        top_blockers = graph.top_blockers()
+        if top_blockers:
+            print("\n=== Lock Contention Hotspots ===")
+            for lock, blocked in top_blockers:
+                owner = self.threads[lock.owner]
+                print(f"\nLock: <{lock.address}> ({lock.class_name})")
+                print(f"Owner: {owner.name} ({owner.state})")
+                print(f"Direct waiters: {len(lock.waiters)}, threads blocked behind owner: {blocked}")
+                stack_trace = owner.stack_trace
+                if stack_trace:
+                    print("Owner stack trace:")
+                    frames = stack_trace if full_stack else stack_trace[:3]
+                    for frame in frames:
+                        print(f"  {frame}")
+                    if not full_stack and len(stack_trace) > 3:
+                        print(f"  ... ({len(stack_trace) - 3} more lines)")
+
     def _print_runnable_threads(self, full_stack: bool = False) -> None:
         """Print information about RUNNABLE threads."""
-        runnable_threads = [t for t in self.threads if t.state == 'RUNNABLE']
+        runnable_threads = [self.threads[index] for index in self.index().by_state.get('RUNNABLE', [])]
         
         if runnable_threads:
             # Sort threads by stack trace length in descending order
-            runnable_threads.sort(key=lambda t: len(t.stack_trace), reverse=True)
+            runnable_threads.sort(key=lambda t: t.stack_depth, reverse=True)
             
             print("\n=== RUNNABLE Threads ===")
             for thread in runnable_threads:
@@ -234,19 +1297,76 @@ class ThreadDumpAnalyzer:
                     if not full_stack and len(thread.stack_trace) > 3:
                         print(f"  ... ({len(thread.stack_trace) - 3} more lines)")
 
+    def _print_virtual_threads(self) -> None:
+        """Print virtual thread counts grouped by thread container and by carrier thread."""
+        virtual_threads = [t for t in self.threads if t.virtual]
+        if not virtual_threads:
+            return
+        by_container: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        by_carrier: Dict[str, int] = defaultdict(int)
+        for thread in virtual_threads:
+            by_container[thread.container][thread.state] += 1
+            by_carrier[thread.carrier] += 1
+
+        print("\n=== Virtual Threads ===")
+        print(f"Total Virtual Threads: {len(virtual_threads)}")
+        print("\nBy container:")
+        for container, state_count in sorted(by_container.items(), key=lambda item: sum(item[1].values()), reverse=True):
+            states = ", ".join(f"{state}: {count}" for state, count in sorted(state_count.items()) if state)
+            print(f"  {container or '<unknown>'}: {sum(state_count.values())}{' (' + states + ')' if states else ''}")
+        carrier_names = {t.tid: t.name for t in self.threads if not t.virtual}
+        mounted = {carrier: count for carrier, count in by_carrier.items() if carrier}
+        if mounted:
+            print("\nBy carrier thread:")
+            for carrier, count in sorted(mounted.items(), key=lambda item: item[1], reverse=True):
+                print(f"  {carrier_names.get(carrier, '#' + carrier)}: {count}")
+        if by_carrier.get(""):
+            print(f"\nUnmounted: {by_carrier['']}")
+
+    def _print_stack_groups(self, full_stack: bool = False) -> None:
+        """Print each unique stack once with the number of threads and their states."""
+        groups: Dict[int, List[ThreadInfo]] = defaultdict(list)
+        for thread in self.threads:
+            groups[thread.stack_id].append(thread)
+
+        print("\n=== Stack Groups ===")
+        print(f"{len(groups)} unique stack(s) in {len(self.threads)} thread(s)")
+        for stack_id, threads in sorted(groups.items(), key=lambda item: len(item[1]), reverse=True):
+            state_count: Dict[str, int] = defaultdict(int)
+            for thread in threads:
+                state_count[thread.state] += 1
+            states = ", ".join(f"{state or 'UNKNOWN'}: {count}" for state, count in sorted(state_count.items()))
+            print(f"\n{len(threads)} thread(s) ({states})")
+            names = [thread.name for thread in threads[:3]]
+            print(f"Threads: {', '.join(names)}{', ...' if len(threads) > 3 else ''}")
+            stack_trace = self.stack_table.resolve(stack_id)
+            if stack_trace:
+                print("Stack trace:")
+                frames = stack_trace if full_stack else stack_trace[:3]
+                for frame in frames:
+                    print(f"  {frame}")
+                if not full_stack and len(stack_trace) > 3:
+                    print(f"  ... ({len(stack_trace) - 3} more lines)")
+            else:
+                print("No Java frames")
+
     def _print_waiting_threads(self, full_stack: bool = False) -> None:
         """Print information about WAITING/TIMED_WAITING threads."""
-        waiting_threads = [t for t in self.threads if t.state in ('WAITING', 'TIMED_WAITING')]
+        # parked virtual threads can number in the hundreds of thousands, they are covered by the stack groups
+        waiting_threads = [t for t in self.threads if t.state in ('WAITING', 'TIMED_WAITING') and not t.virtual]
+        virtual_count = sum(1 for t in self.threads if t.state in ('WAITING', 'TIMED_WAITING') and t.virtual)
         
-        if waiting_threads:
+        if waiting_threads or virtual_count:
             print("\n=== Waiting Threads ===")
             for thread in waiting_threads:
                 self._print_thread_details(thread, full_stack)
                 print("----------------------------------------")
+            if virtual_count:
+                print(f"{virtual_count} waiting virtual thread(s) not listed, see Stack Groups")
 
     def _print_blocked_threads(self, full_stack: bool = False) -> None:
         """Print information about BLOCKED threads."""
-        blocked_threads = [t for t in self.threads if t.state == 'BLOCKED']
+        blocked_threads = [self.threads[index] for index in self.index().by_state.get('BLOCKED', [])]
         
         if blocked_threads:
             print("\n=== Blocked Threads ===")
@@ -262,6 +1382,8 @@ class ThreadDumpAnalyzer:
             print(f"CPU Time: {thread.cpu_time}ms")
         if thread.waiting_on:
             print(f"Waiting on: {thread.waiting_on}")
+        if thread.parking_on:
+            print(f"Parking on: {thread.parking_on}")
         if thread.locked_sync:
             print("Locked synchronizers:")
             for lock in thread.locked_sync:
@@ -278,20 +1400,1653 @@ class ThreadDumpAnalyzer:
             if not full_stack and len(thread.stack_trace) > 3:
                 print(f"  ... ({len(thread.stack_trace) - 3} more lines)")
 
+class ThreadDumpRecords:
+    """Structured form of the per-dump report, written by --format json and ndjson.
+
+    Every record is a dict with the record "type" ("summary", "deadlock", "cpu" or "thread")
+    and the dump "file" first. All fields are always present, null or empty when the dump
+    doesn't have them, and stack traces are never truncated. The same records make up both
+    formats: ndjson writes one per line, streaming the thread records, while json nests them
+    per dump. SCHEMA_VERSION is bumped when an existing field changes meaning, adding fields
+    doesn't bump it.
+    """
+    SCHEMA_VERSION = 1
+    CPU_RANKING_SIZE = 10
+
+    def __init__(self, dump: ThreadDumpAnalyzer, normalizer: Optional[ThreadPoolNormalizer] = None):
+        self.dump = dump
+        self.normalizer = normalizer or ThreadPoolNormalizer()
+
+    @staticmethod
+    def _lock(entry: str) -> Optional[Dict[str, str]]:
+        if not entry:
+            return None
+        address, class_name = LockGraph._split_lock(entry)
+        return {"address": address, "class": class_name}
+
+    @staticmethod
+    def _number(value: str) -> Optional[float]:
+        return float(value) if value else None
+
+    def summary(self) -> Dict:
+        dump = self.dump
+        states: Dict[str, int] = defaultdict(int)
+        for thread in dump.threads:
+            states[thread.state or "UNKNOWN"] += 1
+        pools = []
+        for stats in ThreadPoolSummary(dump.threads, self.normalizer).pools:
+            frame, count = stats.dominant_top_frame
+            pools.append({
+                "pool": stats.pool,
+                "threads": stats.threads,
+                "states": {state or "UNKNOWN": count for state, count in sorted(stats.states.items())},
+                "cpu_ms": stats.cpu_time,
+                "top_frame": frame or None,
+                "top_frame_threads": count,
+            })
+        return {
+            "type": "summary",
+            "file": dump.filename,
+            "schema_version": self.SCHEMA_VERSION,
+            "timestamp": dump.timestamp.isoformat() if dump.timestamp else None,
+            "threads": len(dump.threads),
+            "virtual_threads": sum(1 for thread in dump.threads if thread.virtual),
+            "unique_stacks": len({thread.stack_id for thread in dump.threads}),
+            "states": dict(sorted(states.items())),
+            "deadlocks": len(dump.deadlocks),
+            "pools": pools,
+        }
+
+    def deadlocks(self) -> Iterator[Dict]:
+        for number, deadlock in enumerate(self.dump.deadlocks, 1):
+            yield {
+                "type": "deadlock",
+                "file": self.dump.filename,
+                "deadlock": number,
+                "threads": [{"name": name, "waiting_for": info.get("waiting_for"), "holding": info.get("holding")}
+                            for name, info in deadlock.waiting_threads.items()],
+                "description": deadlock.description,
+            }
+
+    def cpu_ranking(self) -> Iterator[Dict]:
+        ranked = sorted((thread for thread in self.dump.threads if thread.cpu_time),
+                        key=lambda thread: float(thread.cpu_time), reverse=True)[:self.CPU_RANKING_SIZE]
+        for rank, thread in enumerate(ranked, 1):
+            yield {
+                "type": "cpu",
+                "file": self.dump.filename,
+                "rank": rank,
+                "name": thread.name,
+                "tid": thread.tid or None,
+                "nid": thread.nid or None,
+                "state": thread.state or None,
+                "cpu_ms": float(thread.cpu_time),
+                "top_frame": thread.stack_table.frames[thread.stack_table.stacks[thread.stack_id][0]]
+                             if thread.stack_depth else None,
+            }
+
+    def threads(self) -> Iterator[Dict]:
+        for thread in self.dump.threads:
+            yield {
+                "type": "thread",
+                "file": self.dump.filename,
+                "name": thread.name,
+                "tid": thread.tid or None,
+                "nid": thread.nid or None,
+                "state": thread.state or None,
+                "pool": self.normalizer.pool_of(thread.name),
+                "cpu_ms": self._number(thread.cpu_time),
+                "elapsed_s": self._number(thread.elapsed_time),
+                "virtual": thread.virtual,
+                "carrier": thread.carrier or None,
+                "container": thread.container or None,
+                "waiting_on": self._lock(thread.waiting_on),
+                "parking_on": self._lock(thread.parking_on),
+                "object_wait": self._lock(thread.object_wait),
+                "locked": [self._lock(entry) for entry in thread.locked_sync],
+                "locked_ownable": [self._lock(entry) for entry in thread.locked_ownable],
+                "stack": thread.stack_trace,
+            }
+
+    def records(self) -> Iterator[Dict]:
+        yield self.summary()
+        yield from self.deadlocks()
+        yield from self.cpu_ranking()
+        yield from self.threads()
+
+    def document(self) -> Dict:
+        return {
+            "file": self.dump.filename,
+            "summary": self.summary(),
+            "deadlocks": list(self.deadlocks()),
+            "cpu_ranking": list(self.cpu_ranking()),
+            "threads": list(self.threads()),
+        }
+
+def write_records(dumps: List[ThreadDumpAnalyzer], output_format: str, out,
+                  normalizer: Optional[ThreadPoolNormalizer] = None) -> None:
+    """Write the structured report of each dump as one JSON document or as NDJSON records."""
+    if output_format == "ndjson":
+        for dump in dumps:
+            for record in ThreadDumpRecords(dump, normalizer).records():
+                out.write(json.dumps(record, separators=(",", ":")))
+                out.write("\n")
+    else:
+        json.dump({"schema_version": ThreadDumpRecords.SCHEMA_VERSION,
+                   "dumps": [ThreadDumpRecords(dump, normalizer).document() for dump in dumps]}, out, indent=2)
+        out.write("\n")
+
+@dataclass
+class ThreadCpuDelta:
+    thread: ThreadInfo  # thread as seen in the last dump
+    first_cpu_time: float
+    last_cpu_time: float
+    interval: float  # seconds between the first and last sighting of the thread
+
+    @property
+    def cpu_rate(self) -> float:
+        """CPU milliseconds consumed per second of elapsed time."""
+        return (self.last_cpu_time - self.first_cpu_time) / self.interval if self.interval > 0 else 0.0
+
+class CpuDeltaAnalyzer:
+    """Ranks threads by CPU consumed between a series of dumps taken from the same JVM."""
+    THREAD_DUMP_FILENAME_PATTERN = re.compile(r'threaddump_(\d+)_')
+
+    def __init__(self, dumps: List[ThreadDumpAnalyzer]):
+        # jstack timestamps have second resolution, so fall back to the given order when they tie or are missing
+        if all(dump.timestamp for dump in dumps):
+            dumps = sorted(dumps, key=lambda dump: dump.timestamp)
+        self.dumps = dumps
+
+    @classmethod
+    def group_by_pid(cls, filenames: List[str]) -> Dict[Tuple[str, str], List[str]]:
+        """Group dump files by (directory, pid) using the threaddump_<pid>_<timestamp>.txt naming."""
+        groups: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        for filename in filenames:
+            pid_match = cls.THREAD_DUMP_FILENAME_PATTERN.search(os.path.basename(filename))
+            pid = pid_match.group(1) if pid_match else ""
+            groups[(os.path.dirname(filename), pid)].append(filename)
+        # natural order, so that e.g. the line_<n> dumps of a log file sort by line number
+        return {key: sorted(files, key=lambda name: [int(part) if part.isdigit() else part
+                                                     for part in re.split(r'(\d+)', name)])
+                for key, files in groups.items()}
+
+    @staticmethod
+    def _thread_key(thread: ThreadInfo) -> Tuple[str, str]:
+        return (thread.tid, thread.nid)
+
+    def _dump_interval(self, first: ThreadDumpAnalyzer, last: ThreadDumpAnalyzer) -> float:
+        if first.timestamp and last.timestamp:
+            return (last.timestamp - first.timestamp).total_seconds()
+        return 0.0
+
+    def compute(self) -> List[ThreadCpuDelta]:
+        """Match threads across dumps by tid/nid and compute their CPU rate between first and last sighting."""
+        first_seen: Dict[Tuple[str, str], Tuple[ThreadDumpAnalyzer, ThreadInfo]] = {}
+        last_seen: Dict[Tuple[str, str], Tuple[ThreadDumpAnalyzer, ThreadInfo]] = {}
+        for dump in self.dumps:
+            for thread in dump.threads:
+                if not thread.cpu_time:
+                    continue
+                key = self._thread_key(thread)
+                first_seen.setdefault(key, (dump, thread))
+                last_seen[key] = (dump, thread)
+
+        deltas = []
+        for key, (last_dump, last_thread) in last_seen.items():
+            first_dump, first_thread = first_seen[key]
+            if first_dump is last_dump:
+                continue
+            # the per-thread elapsed= counter has millisecond resolution, prefer it over the dump timestamps
+            if first_thread.elapsed_time and last_thread.elapsed_time:
+                interval = float(last_thread.elapsed_time) - float(first_thread.elapsed_time)
+            else:
+                interval = self._dump_interval(first_dump, last_dump)
+            deltas.append(ThreadCpuDelta(
+                thread=last_thread,
+                first_cpu_time=float(first_thread.cpu_time),
+                last_cpu_time=float(last_thread.cpu_time),
+                interval=interval
+            ))
+        deltas.sort(key=lambda delta: delta.cpu_rate, reverse=True)
+        return deltas
+
+    def print_report(self, full_stack: bool = False, top: int = 10) -> None:
+        """Print the top CPU consuming threads between the dumps."""
+        if len(self.dumps) < 2:
+            print("\nCPU delta analysis requires at least 2 thread dumps of the same process.")
+            return
+        deltas = self.compute()
+        interval = self._dump_interval(self.dumps[0], self.dumps[-1])
+        print(f"\n=== Top {top} CPU Consuming Threads Between Dumps ===")
+        print(f"Dumps: {len(self.dumps)} ({self.dumps[0].filename} .. {self.dumps[-1].filename})")
+        if interval:
+            print(f"Interval: {interval:.1f}s")
+        if not deltas:
+            print("No threads with cpu= information found in more than one dump.")
+            return
+        for delta in deltas[:top]:
+            thread = delta.thread
+            print(f"\nThread: {thread.name}")
+            print(f"CPU Rate: {delta.cpu_rate:.1f}ms/s ({delta.cpu_rate / 10:.1f}% of a core)")
+            print(f"CPU Time: {delta.first_cpu_time:.2f}ms -> {delta.last_cpu_time:.2f}ms over {delta.interval:.2f}s")
+            print(f"State: {thread.state}")
+            if thread.stack_trace:
+                print("Stack trace:")
+                frames = thread.stack_trace if full_stack else thread.stack_trace[:3]
+                for frame in frames:
+                    print(f"  {frame}")
+                if not full_stack and len(thread.stack_trace) > 3:
+                    print(f"  ... ({len(thread.stack_trace) - 3} more lines)")
+
+@dataclass
+class ThreadDiff:
+    before: ThreadDumpAnalyzer
+    after: ThreadDumpAnalyzer
+    appeared: List[ThreadInfo]
+    disappeared: List[ThreadInfo]
+    changed: List[Tuple[ThreadInfo, ThreadInfo]]  # (before, after) pairs with a new state or top frame
+
+class ThreadDumpDiff:
+    """Compares a series of dumps of the same JVM to find leaking pools and threads that changed.
+
+    Threads are matched by nid, which the JVM keeps for the lifetime of a thread. Since the
+    OS reuses native thread ids, a nid match only counts when the normalized (pool) name
+    also matches. Threads without a nid, such as virtual threads, are matched by name.
+    """
+
+    def __init__(self, dumps: List[ThreadDumpAnalyzer], normalizer: Optional[ThreadPoolNormalizer] = None):
+        self.dumps = CpuDeltaAnalyzer(dumps).dumps
+        self.normalizer = normalizer or ThreadPoolNormalizer()
+
+    @staticmethod
+    def _top_frame(thread: ThreadInfo) -> str:
+        return thread.stack_table.frames[thread.stack_table.stacks[thread.stack_id][0]] if thread.stack_depth else ""
+
+    def _match(self, thread: ThreadInfo, by_nid: Dict[str, ThreadInfo],
+               by_name: Dict[str, List[ThreadInfo]]) -> Optional[ThreadInfo]:
+        if thread.nid:
+            match = by_nid.pop(thread.nid, None)
+            if match is not None and self.normalizer.pool_of(match.name) == self.normalizer.pool_of(thread.name):
+                return match
+            return None
+        candidates = by_name.get(thread.name)
+        return candidates.pop() if candidates else None
+
+    def diff(self, before: ThreadDumpAnalyzer, after: ThreadDumpAnalyzer) -> ThreadDiff:
+        by_nid: Dict[str, ThreadInfo] = {}
+        by_name: Dict[str, List[ThreadInfo]] = defaultdict(list)
+        for thread in before.threads:
+            if thread.nid:
+                by_nid[thread.nid] = thread
+            else:
+                by_name[thread.name].append(thread)
+        matched = set()
+        appeared = []
+        changed = []
+        for thread in after.threads:
+            previous = self._match(thread, by_nid, by_name)
+            if previous is None:
+                appeared.append(thread)
+                continue
+            matched.add(id(previous))
+            if previous.state != thread.state or self._top_frame(previous) != self._top_frame(thread):
+                changed.append((previous, thread))
+        disappeared = [thread for thread in before.threads if id(thread) not in matched]
+        return ThreadDiff(before, after, appeared, disappeared, changed)
+
+    def pool_counts(self) -> List[Tuple[str, List[int]]]:
+        """Thread count of each pool in every dump, for the pools whose count changed."""
+        counts: Dict[str, List[int]] = defaultdict(lambda: [0] * len(self.dumps))
+        for index, dump in enumerate(self.dumps):
+            for thread in dump.threads:
+                counts[self.normalizer.pool_of(thread.name)][index] += 1
+        rows = [(pool, series) for pool, series in counts.items() if min(series) != max(series)]
+        rows.sort(key=lambda row: row[1][-1] - row[1][0], reverse=True)
+        return rows
+
+    def print_report(self, full_stack: bool = False, top: int = 20) -> None:
+        if len(self.dumps) < 2:
+            print("\nThread dump diff requires at least 2 thread dumps of the same process.")
+            return
+        print("\n=== Thread Count per Dump ===")
+        for dump in self.dumps:
+            print(f"{len(dump.threads):>7}  {dump.filename}")
+        self._print_pool_growth()
+        for before, after in zip(self.dumps, self.dumps[1:]):
+            self._print_diff(self.diff(before, after), full_stack, top)
+
+    def _print_pool_growth(self) -> None:
+        rows = self.pool_counts()
+        print("\n=== Thread Pool Growth ===")
+        if not rows:
+            print("No pool changed its thread count.")
+            return
+        print(f"{'Pool':<45} {'Change':>7}  Threads per dump")
+        for pool, series in rows:
+            growing = all(later >= earlier for earlier, later in zip(series, series[1:]))
+            marker = "  (growing in every dump)" if growing and len(series) > 2 and series[-1] > series[0] else ""
+            print(f"{pool[:45]:<45} {series[-1] - series[0]:>+7}  {' -> '.join(str(count) for count in series)}{marker}")
+
+    def _print_threads_by_pool(self, title: str, threads: List[ThreadInfo], top: int) -> None:
+        if not threads:
+            return
+        by_pool: Dict[str, List[ThreadInfo]] = defaultdict(list)
+        for thread in threads:
+            by_pool[self.normalizer.pool_of(thread.name)].append(thread)
+        print(f"\n{title}: {len(threads)} thread(s)")
+        for pool, pool_threads in sorted(by_pool.items(), key=lambda item: len(item[1]), reverse=True)[:top]:
+            names = ", ".join(thread.name for thread in pool_threads[:3])
+            more = f", ... ({len(pool_threads) - 3} more)" if len(pool_threads) > 3 else ""
+            print(f"  {pool} ({len(pool_threads)}): {names}{more}")
+
+    def _print_diff(self, diff: ThreadDiff, full_stack: bool, top: int) -> None:
+        print(f"\n=== Diff {diff.before.filename} -> {diff.after.filename} ===")
+        if not (diff.appeared or diff.disappeared or diff.changed):
+            print("No changes.")
+            return
+        self._print_threads_by_pool("Appeared", diff.appeared, top)
+        self._print_threads_by_pool("Disappeared", diff.disappeared, top)
+        if not diff.changed:
+            return
+        print(f"\nChanged state or top frame: {len(diff.changed)} thread(s)")
+        for previous, thread in diff.changed[:top]:
+            print(f"\nThread: {thread.name}")
+            if previous.state != thread.state:
+                print(f"State: {previous.state} -> {thread.state}")
+            else:
+                print(f"State: {thread.state}")
+            if self._top_frame(previous) != self._top_frame(thread):
+                print(f"Top frame: {self._top_frame(previous) or '(none)'} -> {self._top_frame(thread) or '(none)'}")
+            if full_stack and thread.stack_trace:
+                print("Stack trace:")
+                for frame in thread.stack_trace:
+                    print(f"  {frame}")
+        if len(diff.changed) > top:
+            print(f"\n... ({len(diff.changed) - top} more changed threads)")
+
+@dataclass
+class OsThreadSample:
+    tid: int
+    name: str  # OS thread name, truncated to 15 characters by Linux
+    state: str
+    cpu_ticks: int = 0  # utime + stime from /proc/<pid>/task/<tid>/stat
+    cpu_percent: Optional[float] = None  # %CPU column of top -H
+
+@dataclass
+class OsThreadSnapshot:
+    """Per-thread CPU counters of a process from /proc/<pid>/task/*/stat or from top -H."""
+    filename: str
+    uptime: Optional[float] = None  # seconds since boot from /proc/uptime, only in task stat snapshots
+    threads: Dict[int, OsThreadSample] = field(default_factory=dict)  # by tid, which is the nid of jstack
+
+    @classmethod
+    def parse(cls, filename: str) -> 'OsThreadSnapshot':
+        """Parse a task stat snapshot (/proc/uptime followed by the task stat lines) or top -H -b output."""
+        snapshot = cls(filename)
+        with open_dump_text(filename) as f:
+            lines = f.read().splitlines()
+        if lines and re.match(r'^[\d.]+ [\d.]+$', lines[0]):
+            snapshot.uptime = float(lines[0].split()[0])
+            for line in lines[1:]:
+                snapshot._parse_stat_line(line)
+        else:
+            snapshot._parse_top(lines)
+        return snapshot
+
+    def _parse_stat_line(self, line: str) -> None:
+        # the name in parentheses can contain spaces and parentheses, so split around the last ')'
+        head, _, rest = line.rpartition(")")
+        tid, _, name = head.partition(" (")
+        fields = rest.split()
+        if not tid.strip().isdigit() or len(fields) < 13:
+            return
+        # fields after the name start at field 3 (state), utime and stime are fields 14 and 15
+        self.threads[int(tid)] = OsThreadSample(tid=int(tid), name=name, state=fields[0],
+                                                cpu_ticks=int(fields[11]) + int(fields[12]))
+
+    def _parse_top(self, lines: List[str]) -> None:
+        # with -n 2 or more only the last iteration is used, the first one averages since thread start
+        columns: List[str] = []
+        for line in lines:
+            fields = line.split(None, len(columns) - 1) if columns else line.split()
+            if not fields:
+                continue
+            if fields[0] == "PID" and "%CPU" in fields:
+                columns = fields
+                self.threads.clear()
+            elif columns and fields[0].isdigit() and len(fields) == len(columns):
+                row = dict(zip(columns, fields))
+                tid = int(row["PID"])
+                self.threads[tid] = OsThreadSample(tid=tid, name=row.get("COMMAND", ""), state=row.get("S", ""),
+                                                   cpu_percent=float(row["%CPU"].replace(",", ".")))
+
+class OsCpuAnalyzer:
+    """Joins OS-level per-thread CPU samples to the threads of a dump by native thread id.
+
+    With two or more task stat snapshots the CPU% is the tick delta between the first and
+    last snapshot. top -H snapshots carry a %CPU column, which is averaged. Threads that
+    jstack doesn't list with a Java stack, such as GC and compiler threads, are included
+    under their OS thread name.
+    """
+    SNAPSHOT_PATTERNS = ("taskstat_{pid}_{stamp}*.txt*", "topthreads_{pid}_{stamp}*.txt*")
+    DUMP_STAMP_PATTERN = re.compile(r'threaddump_(\d+)_([^.]+)\.')
+
+    def __init__(self, snapshots: List[OsThreadSnapshot], dump: ThreadDumpAnalyzer):
+        self.snapshots = snapshots
+        self.dump = dump
+        self.threads_by_nid: Dict[int, ThreadInfo] = {}
+        for thread in dump.threads:
+            try:
+                self.threads_by_nid[int(thread.nid, 0)] = thread
+            except ValueError:
+                continue
+
+    @classmethod
+    def _glob_snapshots(cls, directory: str, pid: str, stamp: str) -> List[str]:
+        return sorted(filename for pattern in cls.SNAPSHOT_PATTERNS
+                      for filename in glob.glob(os.path.join(directory, pattern.format(pid=pid, stamp=stamp))))
+
+    @classmethod
+    def find_snapshots(cls, dump_filename: str) -> List[str]:
+        """Snapshot files of the dump in the directory of the dump.
+
+        The collect scripts name the snapshots taken around a dump with the timestamp of the
+        dump, so that other rounds, such as the one with the jmap pause, don't widen the CPU%
+        window. Collections without such snapshots fall back to all snapshots of the PID.
+        """
+        basename = os.path.basename(dump_filename)
+        pid_match = CpuDeltaAnalyzer.THREAD_DUMP_FILENAME_PATTERN.search(basename)
+        if not pid_match:
+            return []
+        directory = os.path.dirname(dump_filename)
+        stamp_match = cls.DUMP_STAMP_PATTERN.search(basename)
+        if stamp_match:
+            snapshots = cls._glob_snapshots(directory, pid_match.group(1), glob.escape(stamp_match.group(2)))
+            if snapshots:
+                return snapshots
+        return cls._glob_snapshots(directory, pid_match.group(1), "")
+
+    @staticmethod
+    def clock_ticks() -> int:
+        try:
+            return os.sysconf('SC_CLK_TCK')
+        except (AttributeError, ValueError, OSError):
+            return 100
+
+    def cpu_percent(self) -> Dict[int, Tuple[float, OsThreadSample]]:
+        """CPU% and latest sample of each OS thread."""
+        stat_snapshots = sorted((snapshot for snapshot in self.snapshots if snapshot.uptime is not None),
+                                key=lambda snapshot: snapshot.uptime)
+        result: Dict[int, Tuple[float, OsThreadSample]] = {}
+        if len(stat_snapshots) > 1:
+            first, last = stat_snapshots[0], stat_snapshots[-1]
+            interval = last.uptime - first.uptime
+            ticks = self.clock_ticks()
+            for tid, sample in last.threads.items():
+                previous = first.threads.get(tid)
+                # a thread started between the snapshots used all its ticks within the interval
+                delta = sample.cpu_ticks - (previous.cpu_ticks if previous else 0)
+                result[tid] = (100.0 * delta / ticks / interval if interval > 0 else 0.0, sample)
+        top_samples: Dict[int, List[OsThreadSample]] = defaultdict(list)
+        for snapshot in self.snapshots:
+            if snapshot.uptime is None:
+                for tid, sample in snapshot.threads.items():
+                    top_samples[tid].append(sample)
+        for tid, samples in top_samples.items():
+            if tid not in result:
+                result[tid] = (sum(sample.cpu_percent for sample in samples) / len(samples), samples[-1])
+        return result
+
+    def print_report(self, full_stack: bool = False, top: int = 10) -> None:
+        usage = self.cpu_percent()
+        print("\n=== OS Thread CPU ===")
+        if not usage:
+            print("CPU% requires at least 2 task stat snapshots or a top -H snapshot.")
+            return
+        ranking = sorted(usage.items(), key=lambda item: item[1][0], reverse=True)
+        native = sum(1 for tid in usage if tid not in self.threads_by_nid)
+        print(f"Snapshots: {len(self.snapshots)}, OS threads: {len(usage)} ({native} without a Java stack), "
+              f"total CPU: {sum(percent for percent, _ in usage.values()):.1f}%")
+        for tid, (percent, sample) in ranking[:top]:
+            thread = self.threads_by_nid.get(tid)
+            print(f"\nThread: {thread.name if thread else sample.name} (nid={hex(tid)})")
+            print(f"CPU: {percent:.1f}%")
+            if thread is None:
+                print(f"OS state: {sample.state}, no Java stack")
+                continue
+            print(f"State: {thread.state} (OS state: {sample.state})")
+            stack_trace = thread.stack_trace
+            if stack_trace:
+                print("Stack trace:")
+                frames = stack_trace if full_stack else stack_trace[:3]
+                for frame in frames:
+                    print(f"  {frame}")
+                if not full_stack and len(stack_trace) > 3:
+                    print(f"  ... ({len(stack_trace) - 3} more lines)")
+
+def print_os_cpu_report(dump: ThreadDumpAnalyzer, snapshot_files: List[str], full_stack: bool = False) -> None:
+    """Print the OS thread CPU report for a dump from the given snapshots or the ones found next to the dump."""
+    snapshot_files = snapshot_files or OsCpuAnalyzer.find_snapshots(dump.filename)
+    if not snapshot_files:
+        print(f"\nNo taskstat_<pid>_*.txt or topthreads_<pid>_*.txt snapshots found for {dump.filename}")
+        return
+    OsCpuAnalyzer([OsThreadSnapshot.parse(filename) for filename in snapshot_files], dump).print_report(full_stack)
+
+class CollectionAnalyzer:
+    """Aggregated report over the dumps of a diagnostics collection with several pods and PIDs."""
+
+    def __init__(self, dumps: List[ThreadDumpAnalyzer]):
+        dumps_by_filename = {dump.filename: dump for dump in dumps}
+        self.groups: Dict[Tuple[str, str], List[ThreadDumpAnalyzer]] = {
+            key: CpuDeltaAnalyzer([dumps_by_filename[filename] for filename in filenames]).dumps
+            for key, filenames in sorted(CpuDeltaAnalyzer.group_by_pid(list(dumps_by_filename)).items())
+        }
+
+    @staticmethod
+    def group_label(directory: str, pid: str) -> str:
+        return f"{directory or '.'}{' PID ' + pid if pid else ''}"
+
+    def print_report(self, full_stack: bool = False, top: int = 10) -> None:
+        print("\n=== Collection Summary ===")
+        print(f"{sum(len(dumps) for dumps in self.groups.values())} dump(s) of {len(self.groups)} process(es)")
+        self._print_state_summary()
+        self._print_top_cpu_threads(full_stack, top)
+        self._print_blocked_processes()
+
+    def _print_state_summary(self) -> None:
+        """Print the thread states of the latest dump of each pod and PID."""
+        states = ('RUNNABLE', 'BLOCKED', 'WAITING', 'TIMED_WAITING')
+        print("\n=== Thread State Summary per Pod ===")
+        print(f"{'Pod / PID':<50} {'Dumps':>5} {'Threads':>7} " + " ".join(f"{state:>13}" for state in states))
+        for (directory, pid), dumps in self.groups.items():
+            latest = dumps[-1]
+            state_count: Dict[str, int] = defaultdict(int)
+            for thread in latest.threads:
+                state_count[thread.state] += 1
+            print(f"{self.group_label(directory, pid):<50} {len(dumps):>5} {len(latest.threads):>7} "
+                  + " ".join(f"{state_count[state]:>13}" for state in states))
+
+    def _print_top_cpu_threads(self, full_stack: bool, top: int) -> None:
+        """Rank threads cluster-wide by CPU rate between dumps, or by total CPU time with single dumps."""
+        with_delta = any(len(dumps) > 1 for dumps in self.groups.values())
+        ranking = []
+        for (directory, pid), dumps in self.groups.items():
+            label = self.group_label(directory, pid)
+            if with_delta:
+                ranking.extend((delta.cpu_rate, label, delta.thread, f"{delta.cpu_rate:.1f}ms/s")
+                               for delta in CpuDeltaAnalyzer(dumps).compute())
+            else:
+                ranking.extend((float(thread.cpu_time), label, thread, f"{thread.cpu_time}ms")
+                               for thread in dumps[-1].threads if thread.cpu_time)
+        if not ranking:
+            return
+        ranking.sort(key=lambda item: item[0], reverse=True)
+        print(f"\n=== Top {top} CPU Consuming Threads {'Between Dumps ' if with_delta else ''}Across All Pods ===")
+        for _, label, thread, cpu in ranking[:top]:
+            print(f"\nThread: {thread.name}")
+            print(f"Pod: {label}")
+            print(f"{'CPU Rate' if with_delta else 'CPU Time'}: {cpu}")
+            print(f"State: {thread.state}")
+            stack_trace = thread.stack_trace
+            if stack_trace:
+                print("Stack trace:")
+                frames = stack_trace if full_stack else stack_trace[:3]
+                for frame in frames:
+                    print(f"  {frame}")
+                if not full_stack and len(stack_trace) > 3:
+                    print(f"  ... ({len(stack_trace) - 3} more lines)")
+
+    def _print_blocked_processes(self) -> None:
+        """Print the pods that have BLOCKED threads together with their worst lock hotspot."""
+        rows = []
+        for (directory, pid), dumps in self.groups.items():
+            blocked = [sum(1 for thread in dump.threads if thread.state == 'BLOCKED') for dump in dumps]
+            if max(blocked) == 0:
+                continue
+            latest = dumps[-1]
+            top_blockers = LockGraph(latest.threads).top_blockers(1)
+            hotspot = ""
+            if top_blockers:
+                lock, count = top_blockers[0]
+                hotspot = f"<{lock.address}> ({lock.class_name}) held by {latest.threads[lock.owner].name}, {count} blocked"
+            rows.append((max(blocked), self.group_label(directory, pid), blocked, hotspot))
+        if not rows:
+            return
+        rows.sort(key=lambda row: row[0], reverse=True)
+        print("\n=== Pods with Blocked Threads ===")
+        for _, label, blocked, hotspot in rows:
+            print(f"\n{label}")
+            print(f"BLOCKED threads per dump: {', '.join(str(count) for count in blocked)}")
+            if hotspot:
+                print(f"Top blocker: {hotspot}")
+
+class FoldedStackAggregator:
+    """Aggregates stacks into the collapsed "frame;frame;frame count" format read by flame graph tools.
+
+    Counts are kept in a hash table keyed by the root-first tuple of frames, so merging many
+    dumps is linear in the number of threads. Within a dump, threads are first counted by
+    their interned stack ID so each unique stack is converted to frames only once.
+    """
+    FRAME_LOCATION_PATTERN = re.compile(r'\([^()]*\)$')
+
+    def __init__(self, states: Optional[List[str]] = None, thread_name: Optional[str] = None):
+        self.states = set(states) if states else None
+        self.thread_name_pattern = re.compile(thread_name) if thread_name else None
+        self.counts: Dict[Tuple[str, ...], int] = defaultdict(int)
+        self._stack_table: Optional[StackTable] = None
+        self._folded_stacks: Dict[int, Tuple[str, ...]] = {}
+
+    @classmethod
+    def fold_frame(cls, frame: str) -> str:
+        """Drop the source location so that frames of the same method merge, and escape the separator."""
+        return cls.FRAME_LOCATION_PATTERN.sub("", frame).replace(";", ":")
+
+    def add_stack(self, frames: List[str], count: int = 1) -> None:
+        """Add a stack given top frame first, as printed in thread dumps."""
+        if frames:
+            self.counts[tuple(self.fold_frame(frame) for frame in reversed(frames))] += count
+
+    def matches(self, thread: ThreadInfo) -> bool:
+        return self.accepts(thread.name, thread.state)
+
+    def accepts(self, thread_name: str, state: str) -> bool:
+        if self.states is not None and state not in self.states:
+            return False
+        if self.thread_name_pattern is not None and not self.thread_name_pattern.search(thread_name):
+            return False
+        return True
+
+    def add_dump(self, dump: ThreadDumpAnalyzer) -> None:
+        if dump.stack_table is not self._stack_table:
+            self._stack_table = dump.stack_table
+            self._folded_stacks = {}
+        stack_counts: Dict[int, int] = defaultdict(int)
+        for thread in dump.threads:
+            if self.matches(thread):
+                stack_counts[thread.stack_id] += 1
+        for stack_id, count in stack_counts.items():
+            folded = self._folded_stacks.get(stack_id)
+            if folded is None:
+                frames = dump.stack_table.resolve(stack_id)
+                folded = self._folded_stacks[stack_id] = tuple(self.fold_frame(frame) for frame in reversed(frames))
+            if folded:
+                self.counts[folded] += count
+
+    def write(self, out) -> None:
+        for folded, count in sorted(self.counts.items()):
+            out.write(f"{';'.join(folded)} {count}\n")
+
+class JfrProfile:
+    """Per-pool and per-stack aggregation of the events of a `jfr print --json` recording.
+
+    Execution samples count as RUNNABLE, monitor enters as BLOCKED and parks as WAITING or
+    TIMED_WAITING, so that the --state and --thread-name filters of the folded output apply
+    to them as they do to thread dump threads. Events are read one at a time with
+    JsonStreamReader and only the aggregates are kept, stacks interned in a StackTable.
+    """
+    EXECUTION_SAMPLE = "jdk.ExecutionSample"
+    MONITOR_ENTER = "jdk.JavaMonitorEnter"
+    THREAD_PARK = "jdk.ThreadPark"
+    EVENT_TYPES = (EXECUTION_SAMPLE, MONITOR_ENTER, THREAD_PARK)
+    EVENT_STATES = {EXECUTION_SAMPLE: 'RUNNABLE', MONITOR_ENTER: 'BLOCKED', THREAD_PARK: 'WAITING'}
+    DURATION_PATTERN = re.compile(r'^(-)?PT(?:(-?\d+)H)?(?:(-?\d+)M)?(?:(-?[\d.]+)S)?$')
+
+    def __init__(self, normalizer: Optional[ThreadPoolNormalizer] = None,
+                 folded: Optional[FoldedStackAggregator] = None):
+        self.normalizer = normalizer or ThreadPoolNormalizer()
+        self.folded = folded
+        self.stack_table = StackTable()
+        self.event_counts: Dict[str, int] = defaultdict(int)
+        self.event_durations: Dict[str, float] = defaultdict(float)
+        self.pools: Dict[str, PoolStats] = {}
+        self.pool_threads: Dict[str, set] = defaultdict(set)
+        self.pool_durations: Dict[Tuple[str, str], float] = defaultdict(float)
+        # (event type, stack id) -> [count, total ms]
+        self.stacks: Dict[Tuple[str, int], List[float]] = {}
+        # (event type, monitor or parked class) -> [count, total ms, max ms]
+        self.blockers: Dict[Tuple[str, str], List[float]] = {}
+        self.self_frames: Dict[str, int] = defaultdict(int)
+        self._frames: Dict[Tuple[str, str, int], str] = {}
+
+    @classmethod
+    def parse_duration(cls, value) -> float:
+        """Duration in milliseconds of an ISO-8601 duration such as "PT0.012S", or of nanoseconds."""
+        if isinstance(value, (int, float)):
+            return value / 1e6
+        match = cls.DURATION_PATTERN.match(value) if isinstance(value, str) else None
+        if not match or value == "PT":
+            return 0.0
+        sign, hours, minutes, seconds = match.groups()
+        millis = (int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)) * 1000
+        return -millis if sign else millis
+
+    def _frame(self, frame: Dict) -> str:
+        """Format a JFR frame like a thread dump frame, the line number takes the place of the source file."""
+        method = frame.get("method") or {}
+        class_name = (method.get("type") or {}).get("name", "")
+        line = frame.get("lineNumber", -1)
+        key = (class_name, method.get("name", ""), line)
+        text = self._frames.get(key)
+        if text is None:
+            location = f"line: {line}" if line is not None and line >= 0 else "Unknown Source"
+            text = self._frames[key] = f"{class_name}.{key[1]}({location})"
+        return text
+
+    def add_event(self, event: Dict) -> None:
+        event_type = event.get("type")
+        state = self.EVENT_STATES.get(event_type)
+        if state is None:
+            return
+        values = event.get("values") or {}
+        thread = values.get("sampledThread") or values.get("eventThread") or {}
+        name = thread.get("javaName") or thread.get("osName") or f"tid-{thread.get('osThreadId', '?')}"
+        duration = self.parse_duration(values.get("duration"))
+        if event_type == self.THREAD_PARK and self.parse_duration(values.get("timeout")) > 0:
+            state = 'TIMED_WAITING'
+        frames = [self._frame(frame) for frame in (values.get("stackTrace") or {}).get("frames") or []]
+
+        self.event_counts[event_type] += 1
+        self.event_durations[event_type] += duration
+        pool = self.normalizer.pool_of(name)
+        stats = self.pools.get(pool)
+        if stats is None:
+            stats = self.pools[pool] = PoolStats(pool=pool)
+        stats.states[state] += 1
+        self.pool_threads[pool].add(name)
+        self.pool_durations[(pool, event_type)] += duration
+        if event_type == self.EXECUTION_SAMPLE and frames:
+            stats.top_frames[frames[0]] += 1
+            self.self_frames[frames[0]] += 1
+        key = (event_type, self.stack_table.intern_stack(frames))
+        entry = self.stacks.get(key)
+        if entry is None:
+            entry = self.stacks[key] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += duration
+        if event_type != self.EXECUTION_SAMPLE:
+            blocker = values.get("monitorClass") if event_type == self.MONITOR_ENTER else values.get("parkedClass")
+            blocker_name = (blocker or {}).get("name") or "<unknown>"
+            entry = self.blockers.setdefault((event_type, blocker_name), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] = max(entry[2], duration)
+        if self.folded is not None and self.folded.accepts(name, state):
+            self.folded.add_stack(frames)
+
+    def parse_stream(self, f) -> None:
+        """Read the events of `jfr print --json` output, skipping everything but recording.events."""
+        reader = JsonStreamReader(f)
+        for key in reader.iter_object():
+            if key != "recording":
+                reader.skip_value()
+                continue
+            for recording_key in reader.iter_object():
+                if recording_key != "events":
+                    reader.skip_value()
+                    continue
+                for _ in reader.iter_array():
+                    self.add_event(reader.read_value())
+
+    def parse_file(self, filename: str) -> None:
+        """Read `jfr print --json` output, or convert a .jfr recording with the jfr tool of the JDK on the fly."""
+        if not filename.endswith(".jfr"):
+            with open_dump_text(filename) as f:
+                self.parse_stream(f)
+            return
+        if shutil.which("jfr") is None:
+            raise RuntimeError("Reading .jfr recordings requires the jfr tool of a JDK on the PATH")
+        command = ["jfr", "print", "--json", "--events", ",".join(self.EVENT_TYPES), filename]
+        with subprocess.Popen(command, stdout=subprocess.PIPE, text=True, encoding="utf-8",
+                              errors="replace") as process:
+            self.parse_stream(process.stdout)
+        if process.returncode != 0:
+            raise RuntimeError(f"'{' '.join(command)}' failed with exit code {process.returncode}")
+
+    def _print_stacks(self, event_type: str, title: str, full_stack: bool, top: int) -> None:
+        total = self.event_counts[event_type]
+        ranked = sorted(((stack_id, entry) for (stack_type, stack_id), entry in self.stacks.items()
+                         if stack_type == event_type),
+                        key=lambda item: item[1][1] if event_type != self.EXECUTION_SAMPLE else item[1][0],
+                        reverse=True)[:top]
+        if not ranked:
+            return
+        print(f"\n=== {title} ===")
+        for stack_id, (count, duration) in ranked:
+            frames = self.stack_table.resolve(stack_id)
+            timing = f", {duration:.0f}ms total" if event_type != self.EXECUTION_SAMPLE else ""
+            print(f"\n{count} event(s), {100 * count / total:.1f}%{timing}")
+            shown = frames if full_stack else frames[:3]
+            for frame in shown:
+                print(f"    {frame}")
+            if not full_stack and len(frames) > 3:
+                print(f"    ... ({len(frames) - 3} more lines)")
+
+    def print_report(self, full_stack: bool = False, top: int = 10) -> None:
+        samples = self.event_counts[self.EXECUTION_SAMPLE]
+        print("\n=== JFR Events ===")
+        print(f"Execution samples: {samples}")
+        print(f"Monitor enters: {self.event_counts[self.MONITOR_ENTER]} "
+              f"({self.event_durations[self.MONITOR_ENTER]:.0f}ms blocked)")
+        print(f"Thread parks: {self.event_counts[self.THREAD_PARK]} "
+              f"({self.event_durations[self.THREAD_PARK]:.0f}ms parked)")
+        print(f"Threads: {sum(len(threads) for threads in self.pool_threads.values())}")
+
+        print("\n=== Thread Pools ===")
+        print(f"{'Pool':<45} {'Threads':>7} {'CPU samples':>11} {'CPU %':>6} {'Blocked':>8} {'Blocked ms':>10} "
+              f"{'Parked':>8} {'Parked ms':>10}  Top frame")
+        pools = sorted(self.pools.values(), key=lambda stats: (
+            stats.states.get('RUNNABLE', 0), self.pool_durations[(stats.pool, self.MONITOR_ENTER)]), reverse=True)
+        for stats in pools:
+            cpu_samples = stats.states.get('RUNNABLE', 0)
+            parks = stats.states.get('WAITING', 0) + stats.states.get('TIMED_WAITING', 0)
+            frame, count = stats.dominant_top_frame
+            row = (f"{stats.pool[:45]:<45} {len(self.pool_threads[stats.pool]):>7} {cpu_samples:>11} "
+                   f"{100 * cpu_samples / samples if samples else 0:>6.1f} {stats.states.get('BLOCKED', 0):>8} "
+                   f"{self.pool_durations[(stats.pool, self.MONITOR_ENTER)]:>10.0f} {parks:>8} "
+                   f"{self.pool_durations[(stats.pool, self.THREAD_PARK)]:>10.0f}")
+            if frame:
+                row += f"  {frame} ({count}/{sum(stats.top_frames.values())})"
+            print(row)
+
+        if self.self_frames:
+            print("\n=== CPU Hotspots (top frame) ===")
+            for frame, count in sorted(self.self_frames.items(), key=lambda item: item[1], reverse=True)[:top]:
+                print(f"{count:>8} {100 * count / samples:>5.1f}%  {frame}")
+        self._print_stacks(self.EXECUTION_SAMPLE, "Hottest Stacks", full_stack, top)
+
+        for event_type, title in ((self.MONITOR_ENTER, "Lock Contention"), (self.THREAD_PARK, "Thread Parks")):
+            ranked = sorted(((blocker, entry) for (blocker_type, blocker), entry in self.blockers.items()
+                             if blocker_type == event_type), key=lambda item: item[1][1], reverse=True)[:top]
+            if not ranked:
+                continue
+            print(f"\n=== {title} ===")
+            print(f"{'Events':>8} {'Total ms':>10} {'Max ms':>8}  Class")
+            for blocker, (count, duration, longest) in ranked:
+                print(f"{count:>8} {duration:>10.0f} {longest:>8.1f}  {blocker}")
+            self._print_stacks(event_type, f"{title} Stacks", full_stack, top)
+
+def split_dumps(lines: Iterable[str]) -> Iterator[List[str]]:
+    """Split a stream of concatenated thread dumps into the lines of each dump.
+
+    A dump starts at its "Full thread dump" line, or at the timestamp line that jstack
+    prints right before it. Only the lines of one dump are held in memory at a time.
+    """
+    current: List[str] = []
+    has_header = False
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith("Full thread dump"):
+            timestamp = current.pop() if current and ThreadDumpAnalyzer.DUMP_TIMESTAMP_PATTERN.match(current[-1]) else None
+            if has_header:
+                yield current
+            current = [timestamp] if timestamp else []
+            has_header = True
+        current.append(line)
+    if has_header or current:
+        yield current
+
+@dataclass
+class LiveThreadStats:
+    name: str
+    state: str
+    first_cpu_time: float = 0.0
+    first_elapsed_time: float = 0.0
+    last_cpu_time: float = 0.0
+    last_elapsed_time: float = 0.0
+    last_cpu_rate: float = 0.0
+    blocked_streak: int = 0  # consecutive dumps in which the thread was BLOCKED
+    blocker_streak: int = 0  # consecutive dumps in which the thread held a lock others were waiting for
+    blocked_behind: int = 0
+
+    @property
+    def average_cpu_rate(self) -> float:
+        interval = self.last_elapsed_time - self.first_elapsed_time
+        return (self.last_cpu_time - self.first_cpu_time) / interval if interval > 0 else 0.0
+
+class LiveSampler:
+    """Incrementally updated statistics over a continuous series of thread dumps.
+
+    Raw dumps are not retained: per-thread statistics are kept only for the threads of
+    the latest dump and the stack frequency table is pruned to max_stacks entries, so
+    memory stays bounded over hours of sampling.
+    """
+
+    def __init__(self, max_stacks: int = 10000, top: int = 10):
+        self.max_stacks = max_stacks
+        self.top = top
+        self.dump_count = 0
+        self.sample_count = 0
+        self.threads: Dict[Tuple[str, str], LiveThreadStats] = {}
+        self.stack_counts: Dict[Tuple[str, ...], int] = defaultdict(int)
+
+    def add_dump(self, dump: ThreadDumpAnalyzer) -> None:
+        self.dump_count += 1
+        blocked_behind = {}
+        for lock, count in LockGraph(dump.threads).top_blockers(len(dump.threads)):
+            owner_key = (dump.threads[lock.owner].tid, dump.threads[lock.owner].nid)
+            blocked_behind[owner_key] = max(count, blocked_behind.get(owner_key, 0))
+
+        threads: Dict[Tuple[str, str], LiveThreadStats] = {}
+        stack_counts: Dict[int, int] = defaultdict(int)
+        for thread in dump.threads:
+            key = (thread.tid, thread.nid)
+            stats = self.threads.get(key)
+            cpu_time = float(thread.cpu_time) if thread.cpu_time else 0.0
+            elapsed_time = float(thread.elapsed_time) if thread.elapsed_time else 0.0
+            # a lower elapsed time means the tid/nid was reused, e.g. after a JVM restart
+            if stats is None or elapsed_time < stats.last_elapsed_time:
+                stats = LiveThreadStats(name=thread.name, state=thread.state, first_cpu_time=cpu_time,
+                                        first_elapsed_time=elapsed_time)
+            elif elapsed_time > stats.last_elapsed_time:
+                stats.last_cpu_rate = (cpu_time - stats.last_cpu_time) / (elapsed_time - stats.last_elapsed_time)
+            stats.state = thread.state
+            stats.last_cpu_time = cpu_time
+            stats.last_elapsed_time = elapsed_time
+            stats.blocked_streak = stats.blocked_streak + 1 if thread.state == 'BLOCKED' else 0
+            stats.blocked_behind = blocked_behind.get(key, 0)
+            stats.blocker_streak = stats.blocker_streak + 1 if stats.blocked_behind else 0
+            threads[key] = stats
+            stack_counts[thread.stack_id] += 1
+        # threads that have exited are dropped
+        self.threads = threads
+
+        for stack_id, count in stack_counts.items():
+            self.stack_counts[tuple(dump.stack_table.resolve(stack_id))] += count
+            self.sample_count += count
+        if len(self.stack_counts) > self.max_stacks:
+            # keep the most frequent half of the stacks
+            keep = sorted(self.stack_counts.items(), key=lambda item: item[1], reverse=True)[:self.max_stacks // 2]
+            self.stack_counts = defaultdict(int, keep)
+
+    def print_summary(self, final: bool = False, full_stack: bool = False) -> None:
+        print(f"\n=== {'Final' if final else 'Live'} Sampling Summary: {self.dump_count} dump(s), "
+              f"{len(self.threads)} live thread(s) ===")
+
+        ranked = sorted(self.threads.values(), key=lambda stats: stats.last_cpu_rate, reverse=True)[:self.top]
+        if ranked and ranked[0].last_cpu_rate > 0:
+            print(f"\nTop {self.top} CPU rate in the last interval (average since first seen):")
+            for stats in ranked:
+                print(f"  {stats.last_cpu_rate:>8.1f}ms/s ({stats.average_cpu_rate:>8.1f}ms/s)  {stats.name} ({stats.state})")
+
+        if self.stack_counts:
+            print(f"\nMost frequent stacks ({self.sample_count} thread samples):")
+            for frames, count in sorted(self.stack_counts.items(), key=lambda item: item[1], reverse=True)[:self.top]:
+                print(f"\n  {count} sample(s), {100 * count / self.sample_count:.1f}%")
+                shown = frames if full_stack else frames[:3]
+                for frame in shown:
+                    print(f"    {frame}")
+                if not full_stack and len(frames) > 3:
+                    print(f"    ... ({len(frames) - 3} more lines)")
+
+        blockers = sorted((stats for stats in self.threads.values() if stats.blocker_streak > 1),
+                          key=lambda stats: (stats.blocker_streak, stats.blocked_behind), reverse=True)[:self.top]
+        if blockers:
+            print("\nPersistent blockers:")
+            for stats in blockers:
+                print(f"  {stats.name} ({stats.state}): blocking {stats.blocked_behind} thread(s) "
+                      f"for {stats.blocker_streak} consecutive dumps")
+        blocked = sorted((stats for stats in self.threads.values() if stats.blocked_streak > 1),
+                         key=lambda stats: stats.blocked_streak, reverse=True)[:self.top]
+        if blocked:
+            print("\nPersistently blocked threads:")
+            for stats in blocked:
+                print(f"  {stats.name}: BLOCKED for {stats.blocked_streak} consecutive dumps")
+
+def sample_live(sources: Iterable[Iterable[str]], parser: str = "fast", refresh: int = 5,
+                full_stack: bool = False) -> None:
+    """Feed every dump found in the line sources to a LiveSampler and print summaries as it goes."""
+    sampler = LiveSampler()
+    try:
+        for lines in sources:
+            for dump_lines in split_dumps(lines):
+                # a fresh stack table per dump keeps memory bounded, the sampler keys stacks by frames
+                dump = ThreadDumpAnalyzer("<stream>")
+                dump.parse_lines(dump_lines, parser)
+                if not dump.threads:
+                    continue
+                sampler.add_dump(dump)
+                if refresh and sampler.dump_count % refresh == 0:
+                    sampler.print_summary(full_stack=full_stack)
+    except KeyboardInterrupt:
+        pass
+    sampler.print_summary(final=True, full_stack=full_stack)
+
+def run_dump_command(command: str, interval: float, samples: int) -> Iterator[List[str]]:
+    """Run a dump command at a fixed interval and yield the lines of its output."""
+    count = 0
+    while not samples or count < samples:
+        started = time.monotonic()
+        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"Error: dump command failed with exit code {result.returncode}: {result.stderr.strip()}",
+                  file=sys.stderr)
+        yield result.stdout.splitlines()
+        count += 1
+        if not samples or count < samples:
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+def read_dump_files(filenames: List[str]) -> Iterator[Iterable[str]]:
+    """Yield the text stream of each file in turn ('-' for stdin), closing each file once it has been read."""
+    for filename in filenames:
+        if filename == "-":
+            yield sys.stdin
+            continue
+        with open_dump_text(filename) as f:
+            yield f
+
+COMPRESSED_SUFFIXES = ('.gz', '.xz', '.zst')
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz', '.tar.zst', '.tzst', '.zip')
+ARCHIVE_MEMBER_PATTERN = "threaddump_*.txt*"
+
+def _open_zstd(fileobj):
+    try:
+        from compression import zstd
+        return zstd.open(fileobj, 'rb')
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Reading .zst files requires Python 3.14 or the 'zstandard' package") from None
+    return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=True)
+
+def open_compressed(filename: str, fileobj=None):
+    """Open a file as a binary stream, decompressing gzip, xz and zstd on the fly based on the suffix."""
+    if fileobj is None and not filename.endswith(COMPRESSED_SUFFIXES):
+        return open(filename, 'rb')
+    fileobj = fileobj if fileobj is not None else open(filename, 'rb')
+    if filename.endswith('.gz'):
+        return gzip.open(fileobj, 'rb')
+    if filename.endswith('.xz'):
+        return lzma.open(fileobj, 'rb')
+    if filename.endswith('.zst'):
+        return _open_zstd(fileobj)
+    return fileobj
+
+def open_dump_text(filename: str, fileobj=None):
+    """Open a possibly compressed thread dump as a text stream."""
+    if fileobj is None and not filename.endswith(COMPRESSED_SUFFIXES):
+        return open(filename, 'r')
+    if fileobj is not None and not filename.endswith(COMPRESSED_SUFFIXES):
+        return io.TextIOWrapper(fileobj, encoding='utf-8', errors='replace')
+    return io.TextIOWrapper(open_compressed(filename, fileobj), encoding='utf-8', errors='replace')
+
+def is_archive(filename: str) -> bool:
+    return filename.endswith(ARCHIVE_SUFFIXES)
+
+class _StreamedMember(io.RawIOBase):
+    """Member of a tar archive opened in streaming mode.
+
+    tarfile's stream object doesn't implement seekable(), which TextIOWrapper and the
+    decompressors query, so the member is exposed as a plain readable, non-seekable stream.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.fileobj.close()
+        super().close()
+
+def iter_archive_dumps(filename: str) -> Iterator[Tuple[str, io.TextIOBase]]:
+    """Yield (name, text stream) for each threaddump_*.txt member of a tar or zip archive.
+
+    Tar archives are read in streaming mode, so members are decompressed straight from
+    the archive without extracting them. Member names are joined to the archive path so
+    that the archive groups the dumps like a pod directory does.
+    """
+    if filename.endswith('.zip'):
+        with zipfile.ZipFile(filename) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and fnmatch.fnmatch(os.path.basename(info.filename), ARCHIVE_MEMBER_PATTERN):
+                    with open_dump_text(info.filename, archive.open(info)) as f:
+                        yield os.path.join(filename, info.filename), f
+        return
+    if filename.endswith(('.tar.zst', '.tzst')):
+        archive = tarfile.open(fileobj=_open_zstd(open(filename, 'rb')), mode='r|')
+    else:
+        archive = tarfile.open(filename, mode='r|*')
+    with archive:
+        for member in archive:
+            if member.isfile() and fnmatch.fnmatch(os.path.basename(member.name), ARCHIVE_MEMBER_PATTERN):
+                with open_dump_text(member.name, io.BufferedReader(_StreamedMember(archive.extractfile(member)))) as f:
+                    yield os.path.join(filename, os.path.normpath(member.name)), f
+
+LOG_FILE_PATTERNS = ("*.log*", "*.out*")
+# jfr_profile_pod.sh recordings and `jfr print --json` output
+JFR_FILE_PATTERNS = ("*.jfr", "*.json", "*.json.gz", "*.json.xz", "*.json.zst")
+LOG_DUMP_START = b"Full thread dump"
+# "JNI global references: N" on JDK 8, "JNI global refs: N, weak refs: M" on JDK 11+
+LOG_DUMP_END = re.compile(rb'^JNI global ref(?:erence)?s', re.MULTILINE)
+LOG_TIMESTAMP_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})')
+
+class LogDumpTail:
+    """Decides which lines after the JNI refs line of a dump embedded in a log still belong to it.
+
+    HotSpot prints the deadlock report after the JNI refs line. Blank lines and a report
+    starting with "Found one Java-level deadlock:" are kept up to its closing "Found N
+    deadlock(s)." line. Any other line, a log-prefixed line or a new dump ends the dump.
+    """
+    REPORT_START_PATTERN = re.compile(r'^Found (?:one|\d+) Java-level deadlocks?')
+    REPORT_END_PATTERN = re.compile(r'^Found \d+ deadlocks?\.')
+
+    def __init__(self):
+        self.in_report = False
+        self.done = False
+
+    def accept(self, line: str) -> bool:
+        if self.done:
+            return False
+        if self.in_report:
+            if LOG_TIMESTAMP_PATTERN.match(line) or line.startswith("Full thread dump"):
+                return False
+            if self.REPORT_END_PATTERN.match(line):
+                self.done = True
+            return True
+        if not line.strip():
+            return True
+        if self.REPORT_START_PATTERN.match(line):
+            self.in_report = True
+            return True
+        return False
+
+def _log_dump_timestamp(line: str) -> Optional[datetime]:
+    """Timestamp of the line before a dump: the date line of the JVM, or else the prefix of a log line."""
+    match = LOG_TIMESTAMP_PATTERN.match(line.strip())
+    return datetime.strptime(f"{match.group(1)} {match.group(2)}", "%Y-%m-%d %H:%M:%S") if match else None
+
+def _count_newlines(data: mmap.mmap, start: int, end: int, chunk_size: int = 64 * 1024 * 1024) -> int:
+    count = 0
+    for offset in range(start, end, chunk_size):
+        count += data[offset:min(offset + chunk_size, end)].count(b"\n")
+    return count
+
+def iter_log_dumps(filename: str) -> Iterator[Tuple[int, Optional[datetime], List[str]]]:
+    """Yield (line number, timestamp, lines) of every thread dump embedded in a log file.
+
+    A dump starts at a "Full thread dump" line and ends after its JNI refs line and the
+    deadlock report following it (see LogDumpTail), or before the next dump, or at the end
+    of the file. Plain files are memory-mapped and searched for the markers with
+    bytes.find, so only the dumps are decoded. The timestamp comes from the line before
+    the dump, which the JVM prints for kill -3.
+    """
+    if filename.endswith(COMPRESSED_SUFFIXES):
+        yield from _iter_log_dumps_stream(filename)
+        return
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            line_number = 1
+            counted_to = 0
+            start = data.find(LOG_DUMP_START)
+            while start != -1:
+                next_start = data.find(LOG_DUMP_START, start + len(LOG_DUMP_START))
+                if start > 0 and data[start - 1] != ord("\n"):
+                    # the marker text in the middle of a log line isn't a dump
+                    start = next_start
+                    continue
+                while next_start != -1 and data[next_start - 1] != ord("\n"):
+                    next_start = data.find(LOG_DUMP_START, next_start + len(LOG_DUMP_START))
+                limit = next_start if next_start != -1 else size
+                end_match = LOG_DUMP_END.search(data, start, limit)
+                if end_match:
+                    end = data.find(b"\n", end_match.end(), limit)
+                    end = end if end != -1 else limit
+                    tail = LogDumpTail()
+                    while end < limit:
+                        line_end = data.find(b"\n", end + 1, limit)
+                        line_end = line_end if line_end != -1 else limit
+                        if not tail.accept(data[end + 1:line_end].decode('utf-8', errors='replace').rstrip("\r")):
+                            break
+                        end = line_end
+                else:
+                    end = limit
+                previous_line_start = data.rfind(b"\n", 0, max(start - 1, 0)) + 1 if start > 0 else start
+                previous_line = data[previous_line_start:start].decode('utf-8', errors='replace')
+                line_number += _count_newlines(data, counted_to, start)
+                counted_to = start
+                lines = data[start:end].decode('utf-8', errors='replace').split("\n")
+                if ThreadDumpAnalyzer.DUMP_TIMESTAMP_PATTERN.match(previous_line.strip()):
+                    lines.insert(0, previous_line.strip())
+                yield line_number, _log_dump_timestamp(previous_line), lines
+                start = next_start
+
+def _iter_log_dumps_stream(filename: str) -> Iterator[Tuple[int, Optional[datetime], List[str]]]:
+    """Line by line variant of iter_log_dumps for compressed logs, which can't be memory-mapped."""
+    current: Optional[List[str]] = None
+    tail: Optional[LogDumpTail] = None
+    previous_line = ""
+    start_line = 0
+    timestamp = None
+    with open_dump_text(filename) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if tail is not None:
+                if tail.accept(line):
+                    current.append(line)
+                    previous_line = line
+                    continue
+                yield start_line, timestamp, current
+                current = tail = None
+            if line.startswith("Full thread dump"):
+                if current:
+                    yield start_line, timestamp, current
+                start_line = line_number
+                timestamp = _log_dump_timestamp(previous_line)
+                current = [previous_line.strip()] if ThreadDumpAnalyzer.DUMP_TIMESTAMP_PATTERN.match(
+                    previous_line.strip()) else []
+            if current is not None:
+                current.append(line)
+                if line.startswith("JNI global ref"):
+                    tail = LogDumpTail()
+            previous_line = line
+    if current:
+        yield start_line, timestamp, current
+
+def _parse_jfr(filename: str, profile: JfrProfile) -> None:
+    try:
+        profile.parse_file(filename)
+    except FileNotFoundError:
+        print(f"Error: Could not find file {filename}")
+        sys.exit(1)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Error reading JFR events from {filename}: {str(e)}")
+        sys.exit(1)
+
+def _parse_log(filename: str, parser: str) -> List[ThreadDumpAnalyzer]:
+    dumps = []
+    try:
+        for line_number, timestamp, lines in iter_log_dumps(filename):
+            # dumps are named after the log file, so the dumps of one log are grouped like the dumps of a pod
+            analyzer = ThreadDumpAnalyzer(os.path.join(filename, f"line_{line_number}"))
+            analyzer.parse_lines(lines, parser)
+            if analyzer.timestamp is None:
+                analyzer.timestamp = timestamp
+            dumps.append(analyzer)
+    except FileNotFoundError:
+        print(f"Error: Could not find file {filename}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error scanning log file {filename}: {str(e)}")
+        sys.exit(1)
+    return dumps
+
+def expand_dump_paths(paths: List[str], logs: bool = False, jfr: bool = False) -> List[str]:
+    """Expand directories and glob patterns into thread dump files and archives, log files or JFR files."""
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            if jfr:
+                patterns = list(JFR_FILE_PATTERNS)
+            elif logs:
+                patterns = list(LOG_FILE_PATTERNS)
+            else:
+                patterns = [ARCHIVE_MEMBER_PATTERN] + [f"*{suffix}" for suffix in ARCHIVE_SUFFIXES]
+            found = set()
+            for pattern in patterns:
+                found.update(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+            filenames.extend(sorted(os.path.normpath(filename) for filename in found))
+        elif glob.has_magic(path):
+            filenames.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            filenames.append(path)
+    return filenames
+
+class ParsedDumpCache:
+    """On-disk cache of parsed dumps in an SQLite database.
+
+    Entries are keyed by file size, mtime and a SHA-256 of the content, and hold the
+    zlib-compressed pickle of the dumps parsed from the file. When the total size exceeds
+    the cap, the least recently used entries are evicted. A connection is opened per call
+    so that the cache object can be passed to worker processes.
+    """
+    FORMAT_VERSION = 3
+    DEFAULT_DIRECTORY = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                                     "pulsar-contributor-toolbox")
+    DEFAULT_MAX_SIZE_MB = 512
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_size: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.path = os.path.join(directory, "threaddump_analyzer_cache.sqlite")
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS parsed_dumps ("
+                               "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+                               "last_access REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def cache_key(self, filename: str, parser: str) -> str:
+        stat = os.stat(filename)
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(ThreadDumpAnalyzer.READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return f"{self.FORMAT_VERSION}:{parser}:{stat.st_size}:{stat.st_mtime_ns}:{digest.hexdigest()}"
+
+    def get(self, key: str) -> Optional[List[ThreadDumpAnalyzer]]:
+        with contextlib.closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT data FROM parsed_dumps WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE parsed_dumps SET last_access = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, dumps: List[ThreadDumpAnalyzer]) -> None:
+        data = zlib.compress(pickle.dumps(dumps, protocol=pickle.HIGHEST_PROTOCOL))
+        if len(data) > self.max_size:
+            return
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO parsed_dumps (key, data, size, last_access) VALUES (?, ?, ?, ?)",
+                               (key, data, len(data), time.time()))
+            total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM parsed_dumps").fetchone()[0]
+            if total_size > self.max_size:
+                evicted_size = 0
+                for evict_key, size in connection.execute(
+                        "SELECT key, size FROM parsed_dumps WHERE key != ? ORDER BY last_access", (key,)).fetchall():
+                    if total_size - evicted_size <= self.max_size:
+                        break
+                    connection.execute("DELETE FROM parsed_dumps WHERE key = ?", (evict_key,))
+                    evicted_size += size
+
+def _parse_archive(filename: str, parser: str) -> List[ThreadDumpAnalyzer]:
+    dumps = []
+    try:
+        for name, f in iter_archive_dumps(filename):
+            analyzer = ThreadDumpAnalyzer(name)
+            analyzer.parse_stream(f, parser)
+            dumps.append(analyzer)
+    except FileNotFoundError:
+        print(f"Error: Could not find file {filename}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading thread dump archive {filename}: {str(e)}")
+        sys.exit(1)
+    return dumps
+
+def _parse_dump_file(filename: str, parser: str, cache: Optional[ParsedDumpCache] = None,
+                     logs: bool = False) -> List[ThreadDumpAnalyzer]:
+    """Parse a dump file, every dump in an archive or with logs=True every dump embedded in a log file."""
+    key = None
+    if cache is not None:
+        key = cache.cache_key(filename, f"{parser}:log" if logs else parser)
+        dumps = cache.get(key)
+        if dumps is not None:
+            if not is_archive(filename) and not logs:
+                dumps[0].filename = filename
+            return dumps
+    if logs:
+        dumps = _parse_log(filename, parser)
+    elif is_archive(filename):
+        dumps = _parse_archive(filename, parser)
+    else:
+        analyzer = ThreadDumpAnalyzer(filename)
+        analyzer.parse_thread_dump(parser)
+        dumps = [analyzer]
+    if cache is not None:
+        cache.put(key, dumps)
+    return dumps
+
+def parse_dump_files(filenames: List[str], parser: str = "fast", jobs: Optional[int] = None,
+                     stack_table: Optional[StackTable] = None,
+                     cache: Optional[ParsedDumpCache] = None, logs: bool = False) -> List[ThreadDumpAnalyzer]:
+    """Parse dump files in a process pool and move the results into one shared stack table."""
+    stack_table = stack_table if stack_table is not None else StackTable()
+    jobs = min(jobs or os.cpu_count() or 1, len(filenames))
+    if jobs <= 1:
+        results = [_parse_dump_file(filename, parser, cache, logs) for filename in filenames]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_parse_dump_file, filenames, [parser] * len(filenames),
+                                        [cache] * len(filenames), [logs] * len(filenames)))
+    dumps = [dump for result in results for dump in result]
+    for dump in dumps:
+        dump.move_to_stack_table(stack_table)
+    return dumps
+
+def diff_main(argv: List[str]) -> None:
+    parser = ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} diff",
+                            description="Compare thread dumps of the same JVM to find leaking pools and changed threads")
+    parser.add_argument("filenames", nargs="+", metavar="filename",
+                       help="Thread dump files, directories, glob patterns or archives, dumps are grouped by PID")
+    parser.add_argument("--full-stack", "-f", action="store_true",
+                       help="Show full stack traces of changed threads")
+    parser.add_argument("--top", type=int, default=20,
+                       help="Maximum number of pools and changed threads listed per diff (default: 20)")
+    parser.add_argument("--pool-rules", metavar="FILE",
+                       help="File with \"pool-name regex\" rules for grouping threads into pools")
+    parser.add_argument("--parser", choices=ThreadDumpAnalyzer.PARSERS, default="fast",
+                       help="Thread dump parser backend (default: fast)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                       help="Number of worker processes used for parsing multiple dumps (default: number of CPUs)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Don't read or write the on-disk cache of parsed dumps")
+    parser.add_argument("--cache-dir", default=ParsedDumpCache.DEFAULT_DIRECTORY,
+                       help=f"Directory of the parsed dump cache (default: {ParsedDumpCache.DEFAULT_DIRECTORY})")
+    parser.add_argument("--cache-size", type=int, default=ParsedDumpCache.DEFAULT_MAX_SIZE_MB, metavar="MB",
+                       help=f"Size cap of the parsed dump cache (default: {ParsedDumpCache.DEFAULT_MAX_SIZE_MB} MB)")
+    parser.add_argument("--filter", metavar="EXPRESSION",
+                       help="Only compare threads matching the expression, see the --filter option of the main command")
+    parser.add_argument("--logs", action="store_true",
+                       help="Compare the thread dumps embedded in log files")
+    args = parser.parse_args(argv)
+    thread_filter = None
+    if args.filter:
+        try:
+            thread_filter = ThreadFilter(args.filter)
+        except ValueError as e:
+            parser.error(str(e))
+
+    pool_normalizer = ThreadPoolNormalizer.from_file(args.pool_rules) if args.pool_rules else ThreadPoolNormalizer()
+    filenames = expand_dump_paths(args.filenames, args.logs)
+    if not filenames:
+        print("Error: No thread dump files found")
+        sys.exit(1)
+    cache = None
+    if not args.no_cache:
+        cache = ParsedDumpCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    dumps = parse_dump_files(filenames, args.parser, args.jobs, cache=cache, logs=args.logs)
+    if thread_filter:
+        dumps = [dump.filtered(thread_filter, pool_normalizer) for dump in dumps]
+    dumps_by_filename = {dump.filename: dump for dump in dumps}
+    for (directory, pid), group in CpuDeltaAnalyzer.group_by_pid(list(dumps_by_filename)).items():
+        if pid:
+            print(f"\n##### PID {pid}{' in ' + directory if directory else ''} #####")
+        ThreadDumpDiff([dumps_by_filename[filename] for filename in group], pool_normalizer).print_report(
+            full_stack=args.full_stack, top=args.top)
+
 def main():
-    parser = ArgumentParser(description="Analyze Java thread dumps")
-    parser.add_argument("filename", help="Path to the thread dump file")
+    if len(sys.argv) > 1 and sys.argv[1] == "diff":
+        diff_main(sys.argv[2:])
+        return
+    parser = ArgumentParser(description="Analyze Java thread dumps",
+                            epilog=f"Run '{os.path.basename(sys.argv[0])} diff --help' for comparing dumps of the same JVM.")
+    parser.add_argument("filenames", nargs="*", metavar="filename",
+                       help="Path to the thread dump file(s), directories, glob patterns or archives (.gz, .xz, .zst, .tar.*, .zip)")
     parser.add_argument("--verbose", "-v", action="store_true", 
                        help="Show detailed information for all threads")
     parser.add_argument("--runnable", "-r", action="store_true",
                        help="Show only RUNNABLE threads")
     parser.add_argument("--full-stack", "-f", action="store_true",
                        help="Show full stack traces instead of truncated ones")
+    parser.add_argument("--cpu-delta", "-d", action="store_true",
+                       help="Rank threads by CPU time consumed per second between multiple dumps of the same PID")
+    parser.add_argument("--parser", choices=ThreadDumpAnalyzer.PARSERS, default="fast",
+                       help="Thread dump parser backend (default: fast)")
+    parser.add_argument("--compare-parsers", action="store_true",
+                       help="Compare throughput and output equality of the parser backends and exit")
+    parser.add_argument("--aggregate", "-a", action="store_true",
+                       help="Print one aggregated report over all dumps (default when a directory is given)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                       help="Number of worker processes used for parsing multiple dumps (default: number of CPUs)")
+    parser.add_argument("--folded", metavar="FILE",
+                       help="Write stacks of all dumps in collapsed flame graph format to FILE ('-' for stdout)")
+    parser.add_argument("--state", action="append",
+                       help="Only include threads in this state in the --folded output (can be repeated)")
+    parser.add_argument("--thread-name",
+                       help="Only include threads whose name matches this regex in the --folded output")
+    parser.add_argument("--pool-rules", metavar="FILE",
+                       help="File with \"pool-name regex\" rules for grouping threads into pools")
+    parser.add_argument("--classifier-rules", metavar="FILE",
+                       help="File with extra \"tag frame-regex [thread=regex] [state=regex]\" thread classifier rules")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Don't read or write the on-disk cache of parsed dumps")
+    parser.add_argument("--cache-dir", default=ParsedDumpCache.DEFAULT_DIRECTORY,
+                       help=f"Directory of the parsed dump cache (default: {ParsedDumpCache.DEFAULT_DIRECTORY})")
+    parser.add_argument("--cache-size", type=int, default=ParsedDumpCache.DEFAULT_MAX_SIZE_MB, metavar="MB",
+                       help=f"Size cap of the parsed dump cache (default: {ParsedDumpCache.DEFAULT_MAX_SIZE_MB} MB)")
+    parser.add_argument("--live", action="store_true",
+                       help="Sample continuously from files of concatenated dumps ('-' for stdin) or --live-command")
+    parser.add_argument("--live-command", metavar="COMMAND",
+                       help="Command that prints a thread dump, run every --interval seconds in --live mode")
+    parser.add_argument("--interval", type=float, default=10.0,
+                       help="Seconds between runs of --live-command (default: 10)")
+    parser.add_argument("--samples", type=int, default=0,
+                       help="Number of --live-command runs, 0 runs until interrupted (default: 0)")
+    parser.add_argument("--refresh", type=int, default=5,
+                       help="Print a live summary every N dumps, 0 prints only the final report (default: 5)")
+    parser.add_argument("--filter", metavar="EXPRESSION",
+                       help="Only report threads matching the expression, e.g. "
+                            "'state=BLOCKED and frame~ManagedLedgerImpl and pool=pulsar-io' "
+                            "(fields: state, name, pool, lock, frame; operators: =, !=, ~ for regex; and, or, not)")
+    parser.add_argument("--logs", action="store_true",
+                       help="Scan the files for thread dumps embedded in logs, e.g. from kill -3 in broker stdout "
+                            "(directories are searched for *.log* and *.out* files)")
+    parser.add_argument("--jfr", action="store_true",
+                       help="Aggregate the jdk.ExecutionSample, jdk.JavaMonitorEnter and jdk.ThreadPark events of "
+                            "'jfr print --json' output or .jfr recordings (converted with the jfr tool) by thread pool "
+                            "and stack, --folded writes their stacks instead")
+    parser.add_argument("--format", choices=("text", "json", "ndjson"), default="text",
+                       help="Output format of the per-dump report: json writes one document, ndjson one record per "
+                            "line streamed per thread (default: text)")
+    parser.add_argument("--os-cpu", action="store_true",
+                       help="Join the taskstat_<pid>_*.txt and topthreads_<pid>_*.txt snapshots next to each dump "
+                            "by nid and report per-thread CPU%% including threads without a Java stack")
+    parser.add_argument("--os-snapshot", action="append", metavar="FILE",
+                       help="OS thread CPU snapshot (/proc/uptime followed by /proc/<pid>/task/*/stat lines, "
+                            "or top -H -b output) to join instead of the discovered ones, implies --os-cpu")
     args = parser.parse_args()
+    thread_filter = None
+    if args.filter:
+        try:
+            thread_filter = ThreadFilter(args.filter)
+        except ValueError as e:
+            parser.error(str(e))
+    if not args.filenames and not args.live_command:
+        parser.error("at least one filename or --live-command is required")
+    if args.format != "text" and (args.aggregate or args.cpu_delta or args.folded or args.jfr or args.live
+                                  or args.live_command or args.os_cpu or args.os_snapshot):
+        parser.error(f"--format {args.format} writes the per-dump report, it can't be combined with "
+                     "--aggregate, --cpu-delta, --folded, --jfr, --live or --os-cpu")
+
+    if args.live or args.live_command:
+        if args.live_command:
+            sources = run_dump_command(args.live_command, args.interval, args.samples)
+        else:
+            sources = read_dump_files(args.filenames)
+        # closing the generator also closes the file being read when sampling is interrupted
+        with contextlib.closing(sources):
+            sample_live(sources, args.parser, args.refresh, args.full_stack)
+        return
+
+    classifier = ThreadClassifier.from_file(args.classifier_rules) if args.classifier_rules else ThreadClassifier()
+    pool_normalizer = ThreadPoolNormalizer.from_file(args.pool_rules) if args.pool_rules else ThreadPoolNormalizer()
+    if args.jfr:
+        if thread_filter:
+            parser.error("--filter can't be combined with --jfr, use --state and --thread-name with --folded")
+        filenames = expand_dump_paths(args.filenames, jfr=True)
+        if not filenames:
+            print("Error: No JFR files found")
+            sys.exit(1)
+        aggregator = FoldedStackAggregator(args.state, args.thread_name) if args.folded else None
+        profile = JfrProfile(pool_normalizer, aggregator)
+        for filename in filenames:
+            _parse_jfr(filename, profile)
+        if aggregator is None:
+            profile.print_report(full_stack=args.full_stack)
+        elif args.folded == "-":
+            aggregator.write(sys.stdout)
+        else:
+            with open(args.folded, "w") as out:
+                aggregator.write(out)
+        return
+    filenames = expand_dump_paths(args.filenames, args.logs)
+    if not filenames:
+        print("Error: No thread dump files found")
+        sys.exit(1)
+
+    if args.compare_parsers:
+        results = [ThreadDumpAnalyzer.compare_parsers(filename) for filename in filenames if not is_archive(filename)]
+        sys.exit(0 if all(results) else 1)
+
+    cache = None
+    if not args.no_cache:
+        cache = ParsedDumpCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    dumps = parse_dump_files(filenames, args.parser, args.jobs, cache=cache, logs=args.logs)
+    if args.logs and not dumps:
+        print("Error: No thread dumps found in the log files")
+        sys.exit(1)
+    if thread_filter:
+        dumps = [dump.filtered(thread_filter, pool_normalizer) for dump in dumps]
+
+    if args.format != "text":
+        write_records(dumps, args.format, sys.stdout, pool_normalizer)
+        return
+
+    if args.folded:
+        aggregator = FoldedStackAggregator(args.state, args.thread_name)
+        for dump in dumps:
+            aggregator.add_dump(dump)
+        if args.folded == "-":
+            aggregator.write(sys.stdout)
+        else:
+            with open(args.folded, "w") as out:
+                aggregator.write(out)
+        return
+
+    os_cpu = args.os_cpu or bool(args.os_snapshot)
+    if args.aggregate or any(os.path.isdir(path) or is_archive(path) for path in args.filenames):
+        collection = CollectionAnalyzer(dumps)
+        collection.print_report(full_stack=args.full_stack)
+        if os_cpu:
+            for (directory, pid), group in collection.groups.items():
+                print(f"\n##### {collection.group_label(directory, pid)} #####")
+                print_os_cpu_report(group[-1], args.os_snapshot, args.full_stack)
+        return
+
+    if args.cpu_delta:
+        dumps_by_filename = {dump.filename: dump for dump in dumps}
+        for (directory, pid), group in CpuDeltaAnalyzer.group_by_pid(list(dumps_by_filename)).items():
+            if pid:
+                print(f"\n##### PID {pid}{' in ' + directory if directory else ''} #####")
+            cpu_delta_analyzer = CpuDeltaAnalyzer([dumps_by_filename[filename] for filename in group])
+            cpu_delta_analyzer.print_report(full_stack=args.full_stack)
+            if len(cpu_delta_analyzer.dumps) > 1:
+                ThreadPoolSummary(cpu_delta_analyzer.dumps[-1].threads, pool_normalizer,
+                                  cpu_delta_analyzer.compute()).print_report()
+            if os_cpu:
+                print_os_cpu_report(cpu_delta_analyzer.dumps[-1], args.os_snapshot, args.full_stack)
+        return
 
-    analyzer = ThreadDumpAnalyzer(args.filename)
-    analyzer.parse_thread_dump()
-    analyzer.analyze(runnable_only=args.runnable, full_stack=args.full_stack)
+    for analyzer in dumps:
+        if len(dumps) > 1:
+            print(f"\n##### {analyzer.filename} #####")
+        analyzer.analyze(runnable_only=args.runnable, full_stack=args.full_stack, pool_normalizer=pool_normalizer,
+                         classifier=classifier)
+        if os_cpu:
+            print_os_cpu_report(analyzer, args.os_snapshot, args.full_stack)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
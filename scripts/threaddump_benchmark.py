@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""Benchmark threaddump_analyzer.py on synthetic Pulsar-like thread dumps.
+
+Generates dumps of the given sizes, measures the parse throughput and peak memory of each
+parser backend and the time spent in each report, and writes the results as JSON so that
+runs on different commits can be compared with --compare.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from threaddump_analyzer import ThreadDumpAnalyzer, ThreadPoolSummary, ThreadClassifier, ThreadFilter, ThreadIndex
+
+@dataclass
+class DumpSpec:
+    threads: int = 1000
+    depth: int = 30  # average number of frames per stack
+    lock_density: float = 0.05  # fraction of threads holding a monitor, about as many are blocked on one
+    deadlocks: int = 0
+    jdk: int = 17  # 8 omits cpu= and elapsed= from the thread headers
+    seed: int = 42
+
+class DumpGenerator:
+    """Writes a jstack -l style dump with Pulsar-like thread pools and stacks."""
+    # (pool name template, state, top frames)
+    THREAD_KINDS = [
+        ("pulsar-io-{pool}-{index}", "RUNNABLE", [
+            "sun.nio.ch.EPoll.wait(Native Method)",
+            "sun.nio.ch.EPollSelectorImpl.doSelect(EPollSelectorImpl.java:120)",
+            "sun.nio.ch.SelectorImpl.lockAndDoSelect(SelectorImpl.java:129)",
+            "io.netty.channel.nio.NioEventLoop.select(NioEventLoop.java:813)",
+            "io.netty.channel.nio.NioEventLoop.run(NioEventLoop.java:460)"]),
+        ("BookKeeperClientWorker-OrderedExecutor-{pool}-{index}", "WAITING", [
+            "jdk.internal.misc.Unsafe.park(Native Method)",
+            "java.util.concurrent.locks.LockSupport.park(LockSupport.java:341)",
+            "java.util.concurrent.LinkedBlockingQueue.take(LinkedBlockingQueue.java:435)",
+            "org.apache.bookkeeper.common.util.SingleThreadExecutor.run(SingleThreadExecutor.java:113)"]),
+        ("bookkeeper-ml-scheduler-OrderedScheduler-{pool}-{index}", "TIMED_WAITING", [
+            "jdk.internal.misc.Unsafe.park(Native Method)",
+            "java.util.concurrent.locks.LockSupport.parkNanos(LockSupport.java:252)",
+            "java.util.concurrent.ScheduledThreadPoolExecutor$DelayedWorkQueue.take(ScheduledThreadPoolExecutor.java:1182)"]),
+        ("pulsar-web-{pool}-{index}", "TIMED_WAITING", [
+            "jdk.internal.misc.Unsafe.park(Native Method)",
+            "java.util.concurrent.locks.LockSupport.parkNanos(LockSupport.java:252)",
+            "org.eclipse.jetty.util.BlockingArrayQueue.poll(BlockingArrayQueue.java:382)",
+            "org.eclipse.jetty.util.thread.QueuedThreadPool.idleJobPoll(QueuedThreadPool.java:974)"]),
+        ("metadata-store-{pool}-{index}", "WAITING", [
+            "jdk.internal.misc.Unsafe.park(Native Method)",
+            "java.util.concurrent.locks.LockSupport.park(LockSupport.java:341)",
+            "java.util.concurrent.CompletableFuture$Signaller.block(CompletableFuture.java:1864)",
+            "java.util.concurrent.CompletableFuture.get(CompletableFuture.java:2095)",
+            "org.apache.pulsar.metadata.impl.ZKMetadataStore.get(ZKMetadataStore.java:218)"]),
+        ("ForkJoinPool.commonPool-worker-{index}", "WAITING", [
+            "jdk.internal.misc.Unsafe.park(Native Method)",
+            "java.util.concurrent.ForkJoinPool.awaitWork(ForkJoinPool.java:1724)",
+            "java.util.concurrent.ForkJoinPool.runWorker(ForkJoinPool.java:1623)"]),
+    ]
+    FILLER_FRAMES = [
+        "org.apache.pulsar.broker.service.persistent.PersistentTopic.publishMessage(PersistentTopic.java:{line})",
+        "org.apache.pulsar.broker.service.ServerCnx.handleSend(ServerCnx.java:{line})",
+        "org.apache.bookkeeper.mledger.impl.ManagedLedgerImpl.asyncAddEntry(ManagedLedgerImpl.java:{line})",
+        "org.apache.bookkeeper.mledger.impl.ManagedCursorImpl.asyncReadEntries(ManagedCursorImpl.java:{line})",
+        "org.apache.pulsar.broker.service.persistent.PersistentDispatcherMultipleConsumers.readMoreEntries(PersistentDispatcherMultipleConsumers.java:{line})",
+        "io.netty.channel.AbstractChannelHandlerContext.invokeChannelRead(AbstractChannelHandlerContext.java:{line})",
+        "io.netty.handler.codec.ByteToMessageDecoder.channelRead(ByteToMessageDecoder.java:{line})",
+        "org.apache.pulsar.common.protocol.PulsarDecoder.channelRead(PulsarDecoder.java:{line})",
+        "java.util.concurrent.CompletableFuture.uniApply(CompletableFuture.java:{line})",
+        "java.util.concurrent.ThreadPoolExecutor.runWorker(ThreadPoolExecutor.java:{line})",
+    ]
+    BOTTOM_FRAMES = [
+        "io.netty.util.concurrent.FastThreadLocalRunnable.run(FastThreadLocalRunnable.java:30)",
+        "java.lang.Thread.run(Thread.java:840)"]
+    VM_THREAD_NID = 0x99
+    FIRST_NID = VM_THREAD_NID + 1  # generated threads get the nids after the VM Thread
+
+    def __init__(self, spec: DumpSpec):
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+        self.thread_number = 10
+
+    def _header(self, name: str, state: str, index: int) -> str:
+        suffix = {"RUNNABLE": "runnable", "BLOCKED": "waiting for monitor entry",
+                  "TIMED_WAITING": "waiting on condition", "WAITING": "waiting on condition"}[state]
+        self.thread_number += 1
+        cpu = ""
+        if self.spec.jdk >= 11:
+            cpu = f"cpu={self.random.uniform(0, 100000):.2f}ms elapsed={self.random.uniform(100, 100000):.2f}s "
+        return (f'"{name}" #{self.thread_number} daemon prio=5 os_prio=0 {cpu}tid=0x00007f{index:010x} '
+                f'nid=0x{index + self.FIRST_NID:x} {suffix}  [0x00007e{index:010x}]')
+
+    def _state_line(self, state: str) -> str:
+        detail = {"RUNNABLE": "", "BLOCKED": " (on object monitor)", "WAITING": " (parking)",
+                  "TIMED_WAITING": " (parking)"}[state]
+        return f"   java.lang.Thread.State: {state}{detail}"
+
+    def _frames(self, top: List[str]) -> List[str]:
+        filler_count = max(0, int(self.random.gauss(self.spec.depth, self.spec.depth / 4)) - len(top) - 2)
+        # a limited number of distinct filler sequences, like the few code paths of a real broker
+        seed = self.random.randrange(50)
+        filler = [self.FILLER_FRAMES[(seed + i) % len(self.FILLER_FRAMES)].format(line=100 + (seed * 7 + i) % 900)
+                  for i in range(filler_count)]
+        return top + filler + self.BOTTOM_FRAMES
+
+    def generate(self, out) -> None:
+        spec = self.spec
+        vm = "17.0.9+9" if spec.jdk >= 11 else "25.392-b08"
+        out.write("2024-05-01 10:00:00\n")
+        out.write(f"Full thread dump OpenJDK 64-Bit Server VM ({vm} mixed mode, sharing):\n\n")
+        if spec.jdk >= 11:
+            out.write(f"Threads class SMR info:\n_java_thread_list=0x00007f0000000000, length={spec.threads}, "
+                      "elements={\n}\n\n")
+        monitors = max(1, int(spec.threads * spec.lock_density))
+        deadlocked = spec.deadlocks * 2
+        for index in range(spec.threads - deadlocked):
+            name_template, state, top = self.THREAD_KINDS[index % len(self.THREAD_KINDS)]
+            name = name_template.format(pool=index % 7, index=index // len(self.THREAD_KINDS))
+            lines = []
+            frames = self._frames(list(top))
+            holds = index < monitors
+            blocked = not holds and index < 2 * monitors
+            if blocked:
+                state = "BLOCKED"
+                frames = self._frames(["org.apache.bookkeeper.mledger.impl.ManagedLedgerImpl.updateLedgersIdsComplete"
+                                       "(ManagedLedgerImpl.java:1520)"])
+            out.write(self._header(name, state, index) + "\n")
+            out.write(self._state_line(state) + "\n")
+            for position, frame in enumerate(frames):
+                lines.append(f"\tat {frame}")
+                if position == 0 and blocked:
+                    lines.append(f"\t- waiting to lock <0x00000000d{self.random.randrange(monitors):07x}> "
+                                 "(a org.apache.bookkeeper.mledger.impl.ManagedLedgerImpl)")
+                elif position == 0 and state in ("WAITING", "TIMED_WAITING") and "Unsafe.park" in frame:
+                    lines.append(f"\t- parking to wait for  <0x00000000c{index:07x}> "
+                                 "(a java.util.concurrent.locks.AbstractQueuedSynchronizer$ConditionObject)")
+                elif position == 2 and holds:
+                    lines.append(f"\t- locked <0x00000000d{index:07x}> (a org.apache.bookkeeper.mledger.impl.ManagedLedgerImpl)")
+            out.write("\n".join(lines))
+            out.write("\n\n   Locked ownable synchronizers:\n\t- None\n\n")
+        sections = self._write_deadlocked_threads(out, spec.threads - deadlocked)
+        out.write(f'"VM Thread" os_prio=0 tid=0x00007f0000ffff nid=0x{self.VM_THREAD_NID:x} runnable\n\n')
+        if spec.jdk >= 11:
+            out.write("JNI global refs: 1234, weak refs: 0\n\n")
+        else:
+            out.write("JNI global references: 1234\n\n")
+        # like HotSpot, the deadlock report follows the JNI refs line
+        self._write_deadlock_reports(out, sections)
+
+    def _write_deadlocked_threads(self, out, first_index: int) -> List[List[Tuple[str, str, str]]]:
+        sections = []
+        for deadlock in range(self.spec.deadlocks):
+            pair = []
+            for side in range(2):
+                index = first_index + deadlock * 2 + side
+                name = f"pulsar-deadlock-{deadlock}-{side}"
+                own, other = f"0x00000000e{index:07x}", f"0x00000000e{index + (1 if side == 0 else -1):07x}"
+                out.write(self._header(name, "BLOCKED", index) + "\n")
+                out.write(self._state_line("BLOCKED") + "\n")
+                out.write(f"\tat org.example.Deadlock.side{side}(Deadlock.java:{10 + side})\n")
+                out.write(f"\t- waiting to lock <{other}> (a java.lang.Object)\n")
+                out.write(f"\t- locked <{own}> (a java.lang.Object)\n")
+                out.write("\tat java.lang.Thread.run(Thread.java:840)\n\n   Locked ownable synchronizers:\n\t- None\n\n")
+                pair.append((name, own, other))
+            sections.append(pair)
+        return sections
+
+    def _write_deadlock_reports(self, out, sections: List[List[Tuple[str, str, str]]]) -> None:
+        for pair in sections:
+            out.write("\nFound one Java-level deadlock:\n=============================\n")
+            for side, (name, own, other) in enumerate(pair):
+                out.write(f'"{name}":\n  waiting to lock monitor 0x00007f000000000{side} (object {other}, a java.lang.Object),\n')
+                out.write(f'  which is held by "{pair[1 - side][0]}"\n')
+            out.write("\nJava stack information for the threads listed above:\n"
+                      "===================================================\n")
+            for side, (name, own, other) in enumerate(pair):
+                out.write(f'"{name}":\n\tat org.example.Deadlock.side{side}(Deadlock.java:{10 + side})\n')
+                out.write(f"\t- waiting to lock <{other}> (a java.lang.Object)\n\t- locked <{own}> (a java.lang.Object)\n")
+            out.write("\n")
+        if sections:
+            out.write(f"Found {len(sections)} deadlock{'s' if len(sections) > 1 else ''}.\n\n")
+
+def _time(function: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _silenced(function: Callable[[], object]) -> Callable[[], object]:
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+    return run
+
+def benchmark_parse(filename: str, parser: str, repeat: int) -> Tuple[Dict[str, float], ThreadDumpAnalyzer]:
+    size_mb = os.path.getsize(filename) / (1024 * 1024)
+    analyzers = []
+
+    def parse():
+        analyzer = ThreadDumpAnalyzer(filename)
+        analyzer.parse_thread_dump(parser)
+        analyzers.append(analyzer)
+    seconds = _time(parse, repeat)
+    analyzer = analyzers[-1]
+    analyzers.clear()
+    # tracemalloc slows down allocation heavy code, so peak memory is measured in a separate run
+    tracemalloc.start()
+    parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    analyzers.clear()
+    return {
+        "seconds": seconds,
+        "mb_per_s": size_mb / seconds if seconds else 0.0,
+        "threads_per_s": len(analyzer.threads) / seconds if seconds else 0.0,
+        "peak_mb": peak / (1024 * 1024),
+    }, analyzer
+
+def benchmark_reports(analyzer: ThreadDumpAnalyzer, repeat: int) -> Dict[str, float]:
+    reports: List[Tuple[str, Callable[[], object]]] = [
+        ("state_summary", analyzer._print_thread_state_summary),
+        ("pool_summary", lambda: ThreadPoolSummary(analyzer.threads).print_report()),
+        ("deadlocks", analyzer._print_deadlock_analysis),
+        ("lock_graph", analyzer._print_lock_analysis),
+        ("classifier", lambda: ThreadClassifier().print_report(analyzer.threads)),
+        ("cpu", analyzer._print_cpu_analysis),
+        ("stack_groups", analyzer._print_stack_groups),
+        ("blocked", analyzer._print_blocked_threads),
+        ("waiting", analyzer._print_waiting_threads),
+        ("index_build", lambda: ThreadIndex(analyzer.threads, analyzer.stack_table)),
+        ("filter_query", lambda: ThreadFilter("state=BLOCKED and frame~ManagedLedgerImpl").evaluate(analyzer.index())),
+        ("full_analyze", analyzer.analyze),
+    ]
+    return {name: _time(_silenced(report), repeat) for name, report in reports}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes: List[int], spec: DumpSpec, repeat: int, parsers: List[str]) -> Dict:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in sizes:
+            size_spec = DumpSpec(**{**asdict(spec), "threads": threads})
+            filename = os.path.join(directory, f"threaddump_{threads}.txt")
+            with open(filename, "w") as out:
+                DumpGenerator(size_spec).generate(out)
+            entry = {"spec": asdict(size_spec), "size_mb": os.path.getsize(filename) / (1024 * 1024), "parse": {}}
+            analyzer = None
+            for parser in parsers:
+                entry["parse"][parser], analyzer = benchmark_parse(filename, parser, repeat)
+                print(f"{threads:>7} threads, {entry['size_mb']:6.1f} MB, {parser:>5}: "
+                      f"{entry['parse'][parser]['seconds']:.3f}s, {entry['parse'][parser]['mb_per_s']:.1f} MB/s, "
+                      f"{entry['parse'][parser]['threads_per_s']:.0f} threads/s, "
+                      f"peak {entry['parse'][parser]['peak_mb']:.1f} MB", file=sys.stderr)
+            entry["reports"] = benchmark_reports(analyzer, repeat)
+            print(f"{threads:>7} threads, reports: " + ", ".join(f"{name} {seconds * 1000:.1f}ms"
+                                                                 for name, seconds in entry["reports"].items()),
+                  file=sys.stderr)
+            results.append(entry)
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+def _result_key(entry: Dict) -> Tuple:
+    spec = entry["spec"]
+    return (spec["threads"], spec["depth"], spec["lock_density"], spec["deadlocks"], spec["jdk"])
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> bool:
+    """Print the change of every timing against the baseline, returns False when something regressed."""
+    print(f"\n=== Comparison with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}) ===")
+    baseline_results = {_result_key(entry): entry for entry in baseline["results"]}
+    ok = True
+    for entry in current["results"]:
+        previous = baseline_results.get(_result_key(entry))
+        if previous is None:
+            continue
+        timings = [(f"parse {parser}", result["seconds"], previous["parse"].get(parser, {}).get("seconds"))
+                   for parser, result in entry["parse"].items()]
+        timings += [(name, seconds, previous["reports"].get(name)) for name, seconds in entry["reports"].items()]
+        print(f"\n{entry['spec']['threads']} threads:")
+        for name, seconds, previous_seconds in timings:
+            if not previous_seconds:
+                continue
+            change = seconds / previous_seconds - 1
+            regressed = change > threshold
+            ok = ok and not regressed
+            print(f"  {name:<16} {previous_seconds * 1000:>10.1f}ms -> {seconds * 1000:>10.1f}ms "
+                  f"{change * 100:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return ok
+
+def main():
+    parser = ArgumentParser(description="Benchmark threaddump_analyzer.py on synthetic thread dumps")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                       help="Comma separated thread counts of the generated dumps (default: 1000,10000,100000)")
+    parser.add_argument("--depth", type=int, default=DumpSpec.depth,
+                       help=f"Average stack depth (default: {DumpSpec.depth})")
+    parser.add_argument("--lock-density", type=float, default=DumpSpec.lock_density,
+                       help=f"Fraction of threads holding a contended monitor (default: {DumpSpec.lock_density})")
+    parser.add_argument("--deadlocks", type=int, default=DumpSpec.deadlocks,
+                       help="Number of deadlock sections (default: 0)")
+    parser.add_argument("--jdk", type=int, choices=(8, 17), default=DumpSpec.jdk,
+                       help="Header format, 8 has no cpu= and elapsed= (default: 17)")
+    parser.add_argument("--parser", action="append", choices=ThreadDumpAnalyzer.PARSERS,
+                       help="Parser backend to benchmark (can be repeated, default: all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                       help="Runs per measurement, the fastest one is reported (default: 3)")
+    parser.add_argument("--output", "-o", metavar="FILE",
+                       help="Write the results as JSON to FILE ('-' for stdout)")
+    parser.add_argument("--compare", metavar="FILE",
+                       help="Compare with the JSON results of an earlier run, exits with 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                       help="Slowdown counted as a regression by --compare (default: 0.1 = 10%%)")
+    parser.add_argument("--write-dump", metavar="FILE",
+                       help="Only write a generated dump with the first size to FILE and exit")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    spec = DumpSpec(threads=sizes[0], depth=args.depth, lock_density=args.lock_density,
+                    deadlocks=args.deadlocks, jdk=args.jdk)
+    if args.write_dump:
+        with open(args.write_dump, "w") as out:
+            DumpGenerator(spec).generate(out)
+        return
+
+    results = run_benchmarks(sizes, spec, args.repeat, args.parser or list(ThreadDumpAnalyzer.PARSERS))
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
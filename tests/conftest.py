@@ -0,0 +1,6 @@
+import os
+import sys
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+sys.path.insert(0, SCRIPTS_DIR)
@@ -0,0 +1,31 @@
+import gzip
+import io
+import os
+import tarfile
+
+import pytest
+
+from conftest import DATA_DIR
+from threaddump_analyzer import iter_archive_dumps
+
+LOG = os.path.join(DATA_DIR, "broker_jdk8_deadlock.log")
+
+
+@pytest.mark.parametrize("suffix", [".tar", ".tar.gz", ".tar.xz"])
+def test_tar_members_streamed(tmp_path, suffix):
+    with open(LOG, "rb") as f:
+        dump = f.read()
+    filename = str(tmp_path / f"pod{suffix}")
+    with tarfile.open(filename, "w:" + suffix[5:]) as archive:
+        for name, data in [("pod/threaddump_1.txt", dump), ("pod/broker.log", b"x" * 5000),
+                           ("pod/threaddump_2.txt.gz", gzip.compress(dump))]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    expected = dump.decode("utf-8", errors="replace")
+    assert [(name, f.read()) for name, f in iter_archive_dumps(filename)] == [
+        (os.path.join(filename, "pod/threaddump_1.txt"), expected),
+        (os.path.join(filename, "pod/threaddump_2.txt.gz"), expected),
+    ]
+    # members that are only partly read are skipped over
+    assert len([f.readline() for _, f in iter_archive_dumps(filename)]) == 2
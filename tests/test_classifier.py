@@ -0,0 +1,14 @@
+import os
+
+from conftest import DATA_DIR
+from threaddump_analyzer import ThreadClassifier, ThreadDumpAnalyzer
+
+
+def test_rules_match_module_prefixed_json_frames():
+    analyzer = ThreadDumpAnalyzer(os.path.join(DATA_DIR, "jdk21_event_loop.json"))
+    analyzer.parse_thread_dump()
+    classifier = ThreadClassifier()
+    tags = {thread.name: classifier.classify(thread) for thread in analyzer.threads}
+    assert sorted(tags["pulsar-io-3-1"]) == ["future-join-on-event-loop", "lock-wait-on-event-loop"]
+    assert tags["pulsar-io-3-2"] == ["sync-io-on-event-loop"]
+    assert tags["metadata-store-5-1"] == ["metadata-store-wait"]
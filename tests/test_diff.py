@@ -0,0 +1,33 @@
+import os
+import sqlite3
+
+import pytest
+
+from conftest import DATA_DIR
+from threaddump_analyzer import ParsedDumpCache, _parse_log, diff_main
+
+
+def test_diff_uses_cache_dir(tmp_path, capsys):
+    log = os.path.join(DATA_DIR, "broker_jdk8_deadlock.log")
+    cache_dir = tmp_path / "cache"
+    diff_main(["--logs", "--jobs", "1", "--cache-dir", str(cache_dir), "--cache-size", "1", log])
+    assert "Thread-0" in capsys.readouterr().out
+    assert os.listdir(cache_dir)
+
+
+def test_cache_closes_connections(tmp_path):
+    connections = []
+
+    class TrackingCache(ParsedDumpCache):
+        def _connect(self):
+            connections.append(super()._connect())
+            return connections[-1]
+    cache = TrackingCache(str(tmp_path))
+    dumps = _parse_log(os.path.join(DATA_DIR, "broker_jdk8_deadlock.log"), "fast")
+    cache.put("a", dumps)
+    assert len(cache.get("a")) == len(dumps)
+    assert cache.get("b") is None
+    assert len(connections) == 4
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
@@ -0,0 +1,28 @@
+import os
+
+from conftest import DATA_DIR
+from gc_log_analyzer import GcLogParser, percentile
+
+
+def test_generational_zgc_phase_pauses():
+    filename = os.path.join(DATA_DIR, "zgc_generational.log")
+    with open(filename) as f:
+        segment = GcLogParser(filename).parse(f)
+    assert segment.collector == "ZGC"
+    major, minor = segment.records
+    assert major.pauses == [("Mark Start", 0.021), ("Mark End", 0.032), ("Relocate Start", 0.011),
+                            ("Mark End", 0.025), ("Relocate Start", 0.009)]
+    assert not major.young and major.heap_after == 50
+    assert minor.pauses == [("Mark Start", 0.015), ("Mark End", 0.018), ("Relocate Start", 0.007)]
+    assert minor.young
+
+
+def test_percentile_nearest_rank():
+    values = [float(value) for value in range(1, 11)]
+    assert percentile(values, 0.1) == 1
+    assert percentile(values, 0.5) == 5
+    assert percentile(values, 0.9) == 9
+    assert percentile(values, 0.99) == 10
+    assert percentile(values, 1.0) == 10
+    assert percentile(values, 0.0) == 1
+    assert percentile([], 0.5) == 0.0
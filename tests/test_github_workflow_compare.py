@@ -0,0 +1,168 @@
+import importlib.util
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+from conftest import SCRIPTS_DIR
+
+np = pytest.importorskip("numpy")
+for module in ("requests", "tabulate", "matplotlib"):
+    pytest.importorskip(module)
+
+
+@pytest.fixture(scope="module")
+def compare():
+    spec = importlib.util.spec_from_file_location("github_workflow_compare",
+                                                  os.path.join(SCRIPTS_DIR, "github-workflow-compare.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_mann_whitney_u_exact_for_small_samples(compare):
+    # 5 vs 5 runs without overlap: 2 of the 252 orderings are as extreme
+    u, p_value = compare.mann_whitney_u(np.array([1.0, 2, 3, 4, 5]), np.array([11.0, 12, 13, 14, 15]))
+    assert u == 0
+    assert p_value == pytest.approx(2 / 252)
+    assert compare.mann_whitney_u(np.array([1.0, 3, 5]), np.array([2.0, 4, 6]))[1] == pytest.approx(0.7)
+
+
+def test_mann_whitney_u_normal_approximation_with_ties(compare):
+    u, p_value = compare.mann_whitney_u(np.array([1.0, 1, 2, 2, 3]), np.array([2.0, 3, 3, 4, 4]))
+    assert u == 3
+    assert p_value == pytest.approx(0.0524116, abs=1e-6)
+
+
+def test_mann_whitney_u_matches_scipy(compare):
+    stats = pytest.importorskip("scipy.stats")
+    rng = np.random.default_rng(42)
+    for n1, n2 in ((3, 4), (5, 5), (8, 30), (30, 8), (12, 15)):
+        for sample1, sample2 in ((rng.normal(size=n1), rng.normal(0.5, size=n2)),
+                                 (rng.integers(0, 5, n1).astype(float), rng.integers(0, 5, n2).astype(float))):
+            expected = stats.mannwhitneyu(sample1, sample2, alternative="two-sided")
+            u, p_value = compare.mann_whitney_u(sample1, sample2)
+            assert u == expected.statistic
+            assert p_value == pytest.approx(expected.pvalue, abs=1e-12)
+
+
+def test_min_samples_can_reach_alpha(compare):
+    n = compare.GitHubWorkflowComparer.MIN_SAMPLES
+    _, p_value = compare.mann_whitney_u(np.arange(n, dtype=float), np.arange(n, dtype=float) + n)
+    assert p_value < 0.01
+
+
+def test_benjamini_hochberg(compare):
+    adjusted = compare.benjamini_hochberg(np.array([0.01, 0.04, 0.03, 0.005]))
+    assert adjusted == pytest.approx([0.02, 0.04, 0.04, 0.02])
+    assert compare.benjamini_hochberg(np.array([0.5, 0.9])) == pytest.approx([0.9, 0.9])
+    assert len(compare.benjamini_hochberg(np.array([]))) == 0
+
+
+def test_empty_branch_run_set(compare, monkeypatch, capsys):
+    monkeypatch.setattr(compare.GitHubWorkflowComparer, "list_successful_runs",
+                        lambda self, branch, count, workflow: [1, 2, 3, 4, 5] if branch == "master" else [])
+    monkeypatch.setattr(sys, "argv", ["github-workflow-compare.py", "--owner", "apache", "--repo", "pulsar",
+                                      "--workflow", "ci.yaml", "--branch1", "master", "--branch2", "typo",
+                                      "--token", "token", "--no-cache"])
+    assert compare.main() == 1
+    assert "No successful runs of workflow ci.yaml found on branch typo" in capsys.readouterr().err
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, etag=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = {"ETag": etag} if etag else {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeGitHub:
+    """Serves one workflow run whose attempts can be re-run, counting the requests"""
+
+    def __init__(self, created_at):
+        self.run = {"id": 7, "status": "completed", "run_attempt": 1, "created_at": created_at}
+        self.durations = [60, 120]
+        self.requests = []
+
+    def rerun(self, durations):
+        self.run = {**self.run, "run_attempt": self.run["run_attempt"] + 1}
+        self.durations = durations
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append(url)
+        if url.endswith("/jobs"):
+            data = {"total_count": len(self.durations), "jobs": [
+                {"name": f"job {index}", "status": "completed", "conclusion": "success",
+                 "started_at": "2024-05-01T10:00:00Z", "completed_at": f"2024-05-01T10:{duration // 60:02d}:00Z"}
+                for index, duration in enumerate(self.durations)]}
+        else:
+            data = self.run
+        etag = f'"{hash(repr(data))}"'
+        if headers and headers.get("If-None-Match") == etag:
+            return FakeResponse(304, etag=etag)
+        return FakeResponse(200, data, etag)
+
+
+def fetch_durations(compare, github, cache):
+    comparer = compare.GitHubWorkflowComparer("apache", "pulsar", "token", workers=2, cache=cache)
+    comparer.session = github
+    _, jobs = comparer.fetch_runs([7])[7]
+    return [comparer.parse_job_duration(job) for job in jobs]
+
+
+def test_cache_invalidated_by_rerun(compare, tmp_path):
+    cache = compare.ResponseCache(str(tmp_path))
+    github = FakeGitHub(created_at="2099-01-01T00:00:00Z")
+    assert fetch_durations(compare, github, cache) == [60, 120]
+    github.requests.clear()
+    # the run is revalidated, the jobs of the completed attempt come from the cache
+    assert fetch_durations(compare, github, cache) == [60, 120]
+    assert len(github.requests) == 1 and not github.requests[0].endswith("/jobs")
+    github.rerun([180, 240])
+    assert fetch_durations(compare, github, cache) == [180, 240]
+
+
+def test_cache_of_runs_past_rerun_window(compare, tmp_path):
+    cache = compare.ResponseCache(str(tmp_path))
+    github = FakeGitHub(created_at="2020-01-01T00:00:00Z")
+    fetch_durations(compare, github, cache)
+    github.requests.clear()
+    assert fetch_durations(compare, github, cache) == [60, 120]
+    assert github.requests == []
+
+
+def test_cache_evicts_least_recently_used(compare, tmp_path):
+    # about 1100 bytes compressed per entry, so only two of them fit
+    cache = compare.ResponseCache(str(tmp_path), max_size=2500)
+    for key in ("a", "b", "c"):
+        cache.put(key, None, True, {"payload": random.Random(key).randbytes(1000).hex()})
+        cache.get("a")
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_cache_closes_connections(compare, tmp_path):
+    connections = []
+    
+    class TrackingCache(compare.ResponseCache):
+        def _connect(self):
+            connections.append(super()._connect())
+            return connections[-1]
+    cache = TrackingCache(str(tmp_path))
+    cache.put("a", '"etag"', False, [1, 2])
+    cache.mark_immutable("a")
+    assert cache.get("a") == ('"etag"', True, [1, 2])
+    assert cache.get("b") is None
+    assert len(connections) == 5
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
@@ -0,0 +1,83 @@
+import re
+import struct
+
+import pytest
+
+from hprof_histogram import TAG_HEAP_DUMP_SEGMENT, HprofHistogram, print_diff, write_sample
+
+# class name -> (instances, shallow size) of write_sample with scale 1, by identifier size
+EXPECTED = {
+    4: {
+        "java.lang.String": (100, 100 * 16),
+        "byte[]": (100, 100 * 32),
+        "io.netty.buffer.PooledUnsafeDirectByteBuf": (50, 50 * 24),
+        "java.lang.Object[]": (1, 216),
+        "org.apache.bookkeeper.mledger.impl.ManagedLedgerImpl": (3, 3 * 16),
+        "org.apache.pulsar.broker.service.PendingAcksMap": (3, 3 * 16),
+        "long[]": (1, 8016),
+    },
+    8: {
+        "java.lang.String": (100, 100 * 32),
+        "byte[]": (100, 100 * 40),
+        "io.netty.buffer.PooledUnsafeDirectByteBuf": (50, 50 * 32),
+        "java.lang.Object[]": (1, 424),
+        "org.apache.bookkeeper.mledger.impl.ManagedLedgerImpl": (3, 3 * 32),
+        "org.apache.pulsar.broker.service.PendingAcksMap": (3, 3 * 24),
+        "long[]": (1, 8024),
+    },
+}
+
+
+def sample(tmp_path, id_size, scale=1):
+    filename = str(tmp_path / f"heapdump_{id_size}_{scale}.hprof")
+    write_sample(filename, id_size, scale)
+    return filename
+
+
+@pytest.mark.parametrize("id_size", [4, 8])
+def test_histogram(tmp_path, id_size):
+    histogram = HprofHistogram(sample(tmp_path, id_size)).parse()
+    assert histogram.id_size == id_size
+    entries = histogram.histogram()
+    assert {name: (entry.instances, entry.shallow_size) for name, entry in entries.items()} == EXPECTED[id_size]
+
+
+@pytest.mark.parametrize("id_size", [4, 8])
+def test_pulsar_counts_match_subclasses(tmp_path, id_size):
+    counts = {label: (instances, size)
+              for label, instances, size in HprofHistogram(sample(tmp_path, id_size)).parse().pulsar_counts()}
+    # only PooledUnsafeDirectByteBuf has instances, it extends ByteBuf through AbstractByteBuf
+    assert counts["ByteBuf subclasses"] == EXPECTED[id_size]["io.netty.buffer.PooledUnsafeDirectByteBuf"]
+    assert counts["ManagedLedgerImpl"] == EXPECTED[id_size]["org.apache.bookkeeper.mledger.impl.ManagedLedgerImpl"]
+    assert counts["PendingAcksMap"] == EXPECTED[id_size]["org.apache.pulsar.broker.service.PendingAcksMap"]
+    assert counts["ServerCnx"] == (0, 0)
+
+
+@pytest.mark.parametrize("id_size", [4, 8])
+def test_heap_dump_split_into_segments(tmp_path, id_size):
+    with open(sample(tmp_path, id_size), "rb") as f:
+        data = f.read()
+    position = data.index(b"\0") + 1 + 12
+    segments = []
+    while position < len(data):
+        tag, _, length = struct.unpack_from(">BII", data, position)
+        if tag == TAG_HEAP_DUMP_SEGMENT:
+            segments.append(length)
+        position += 9 + length
+    assert len(segments) == 2 and all(segments)
+
+
+def test_diff(tmp_path, capsys):
+    before = HprofHistogram(sample(tmp_path, 8)).parse()
+    after = HprofHistogram(sample(tmp_path, 8, scale=2)).parse()
+    print_diff(before, after, top=30)
+    output = capsys.readouterr().out
+    rows = {match.group(4): (int(match.group(1)), match.group(2), int(match.group(3)))
+            for match in re.finditer(r'^ *([+-]\d+) +([+-][\d.]+[KMG]?B) +(\d+)  (.+)$', output, re.MULTILINE)}
+    assert rows["java.lang.String"] == (100, "+3.1KB", 200)
+    assert rows["io.netty.buffer.PooledUnsafeDirectByteBuf"] == (50, "+1.6KB", 100)
+    assert rows["ByteBuf subclasses"] == (50, "+1.6KB", 100)
+    assert rows["ManagedLedgerImpl"] == (3, "+96B", 6)
+    assert rows["ServerCnx"] == (0, "+0B", 0)
+    # the single long[] of each dump doesn't change
+    assert "long[]" not in rows
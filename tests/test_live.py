@@ -0,0 +1,27 @@
+import contextlib
+import os
+
+from conftest import DATA_DIR
+from threaddump_analyzer import read_dump_files, sample_live
+
+LOG = os.path.join(DATA_DIR, "broker_jdk8_deadlock.log")
+
+
+def test_files_closed_once_read(capsys):
+    opened = []
+
+    def sources():
+        for f in read_dump_files([LOG, LOG]):
+            opened.append(f)
+            yield f
+    sample_live(sources(), refresh=0)
+    assert len(opened) == 2 and all(f.closed for f in opened)
+    assert "Final Sampling Summary: 4 dump(s)" in capsys.readouterr().out
+
+
+def test_file_closed_when_interrupted():
+    sources = read_dump_files([LOG, LOG])
+    with contextlib.closing(sources):
+        first = next(sources)
+        assert not first.closed
+    assert first.closed
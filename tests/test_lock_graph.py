@@ -0,0 +1,44 @@
+import pytest
+
+from threaddump_analyzer import LockGraph, ThreadDumpAnalyzer
+
+# pulsar-io-1 was notified and waits to re-lock the monitor, which still shows as "- locked" in its frame,
+# pulsar-io-2 is back in Object.wait(), pulsar-io-3 owns the monitor and pulsar-io-4 is blocked on it
+DUMP = """\
+"pulsar-io-1" #21 prio=5 os_prio=0 tid=0x0000000000000021 nid=0x21 in Object.wait()  [0x0000000000000021]
+   java.lang.Thread.State: BLOCKED (on object monitor)
+\tat java.lang.Object.wait(java.base@17.0.10/Native Method)
+\t- waiting to re-lock in wait() <0x00000000a0000001> (a java.lang.Object)
+\tat org.apache.pulsar.Queue.take(Queue.java:10)
+\t- locked <0x00000000a0000001> (a java.lang.Object)
+
+"pulsar-io-2" #22 prio=5 os_prio=0 tid=0x0000000000000022 nid=0x22 in Object.wait()  [0x0000000000000022]
+   java.lang.Thread.State: WAITING (on object monitor)
+\tat java.lang.Object.wait(java.base@17.0.10/Native Method)
+\t- waiting on <0x00000000a0000001> (a java.lang.Object)
+\tat org.apache.pulsar.Queue.take(Queue.java:10)
+\t- locked <0x00000000a0000001> (a java.lang.Object)
+
+"pulsar-io-3" #23 prio=5 os_prio=0 tid=0x0000000000000023 nid=0x23 runnable  [0x0000000000000023]
+   java.lang.Thread.State: RUNNABLE
+\tat org.apache.pulsar.Queue.put(Queue.java:20)
+\t- locked <0x00000000a0000001> (a java.lang.Object)
+
+"pulsar-io-4" #24 prio=5 os_prio=0 tid=0x0000000000000024 nid=0x24 waiting for monitor entry  [0x0000000000000024]
+   java.lang.Thread.State: BLOCKED (on object monitor)
+\tat org.apache.pulsar.Queue.put(Queue.java:20)
+\t- waiting to lock <0x00000000a0000001> (a java.lang.Object)
+"""
+
+
+@pytest.mark.parametrize("parser", ["fast", "regex"])
+def test_owner_excludes_waiting_frames(parser):
+    analyzer = ThreadDumpAnalyzer("dump.txt")
+    analyzer.parse_lines(DUMP.splitlines(), parser)
+    names = [thread.name for thread in analyzer.threads]
+    graph = LockGraph(analyzer.threads)
+    lock = graph.locks["0x00000000a0000001"]
+    assert names[lock.owner] == "pulsar-io-3"
+    assert sorted(names[waiter] for waiter in lock.waiters) == ["pulsar-io-1", "pulsar-io-4"]
+    assert graph.edges[names.index("pulsar-io-1")] == [names.index("pulsar-io-3")]
+    assert not graph.find_cycles()
@@ -0,0 +1,40 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from conftest import DATA_DIR
+from threaddump_analyzer import _parse_log, iter_log_dumps
+
+LOG = os.path.join(DATA_DIR, "broker_jdk8_deadlock.log")
+
+
+@pytest.fixture(params=["plain", "gzip"])
+def log_file(request, tmp_path):
+    if request.param == "plain":
+        return LOG
+    compressed = str(tmp_path / "broker.log.gz")
+    with open(LOG, "rb") as source, gzip.open(compressed, "wb") as target:
+        shutil.copyfileobj(source, target)
+    return compressed
+
+
+def test_dump_ends_after_deadlock_report(log_file):
+    dumps = list(iter_log_dumps(log_file))
+    assert [line_number for line_number, _, _ in dumps] == [4, 52]
+    jdk8_lines = dumps[0][2]
+    assert "JNI global references: 312" in jdk8_lines
+    assert jdk8_lines[-1] == "Found 1 deadlock."
+    jdk17_lines = "\n".join(dumps[1][2]).rstrip().splitlines()
+    assert jdk17_lines[-1] == "JNI global refs: 20, weak refs: 0"
+
+
+@pytest.mark.parametrize("parser", ["fast", "regex"])
+def test_deadlock_in_log_dump(log_file, parser):
+    jdk8, jdk17 = _parse_log(log_file, parser)
+    assert len(jdk8.deadlocks) == 1
+    assert sorted(jdk8.deadlocks[0].threads) == ["Thread-0", "Thread-1"]
+    assert sorted(thread.name for thread in jdk8.threads) == ["Thread-0", "Thread-1"]
+    assert [thread.name for thread in jdk17.threads] == ["pulsar-io-4-1"]
+    assert not jdk17.deadlocks
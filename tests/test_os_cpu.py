@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from threaddump_analyzer import OsCpuAnalyzer, OsThreadSnapshot, ThreadDumpAnalyzer
+
+DUMP = """\
+"pulsar-io-1-1" #21 prio=5 os_prio=0 tid=0x0000000000000021 nid=0x64 runnable  [0x0000000000000021]
+   java.lang.Thread.State: RUNNABLE
+\tat sun.nio.ch.EPoll.wait(java.base@17.0.10/Native Method)
+"""
+
+
+def write_taskstat(path, uptime, ticks):
+    path.write_text(f"{uptime} 0.00\n100 (pulsar-io-1-1) S 1 1 1 0 -1 0 0 0 0 0 {ticks} 0 0 0\n")
+
+
+@pytest.fixture
+def collection(tmp_path):
+    for stamp, uptime, ticks in (("2024-05-01-100000", 100.0, 0), ("2024-05-01-100010", 110.0, 1000)):
+        (tmp_path / f"threaddump_42_{stamp}.txt").write_text(DUMP)
+        write_taskstat(tmp_path / f"taskstat_42_{stamp}_1.txt", uptime, ticks)
+        write_taskstat(tmp_path / f"taskstat_42_{stamp}_2.txt", uptime + 1, ticks + 50)
+    return tmp_path
+
+
+def test_snapshots_of_the_same_round(collection, monkeypatch):
+    monkeypatch.setattr(OsCpuAnalyzer, "clock_ticks", staticmethod(lambda: 100))
+    dump_filename = str(collection / "threaddump_42_2024-05-01-100000.txt")
+    snapshots = OsCpuAnalyzer.find_snapshots(dump_filename)
+    assert [os.path.basename(filename) for filename in snapshots] == [
+        "taskstat_42_2024-05-01-100000_1.txt", "taskstat_42_2024-05-01-100000_2.txt"]
+    dump = ThreadDumpAnalyzer(dump_filename)
+    dump.parse_thread_dump()
+    analyzer = OsCpuAnalyzer([OsThreadSnapshot.parse(filename) for filename in snapshots], dump)
+    percent, sample = analyzer.cpu_percent()[100]
+    assert percent == pytest.approx(50.0)
+    assert analyzer.threads_by_nid[100].name == "pulsar-io-1-1"
+
+
+def test_fallback_to_all_snapshots_of_pid(tmp_path):
+    (tmp_path / "threaddump_42_2024-05-01-100000.txt").write_text(DUMP)
+    write_taskstat(tmp_path / "taskstat_42_2024-05-01-100001.txt", 100.0, 0)
+    write_taskstat(tmp_path / "taskstat_42_2024-05-01-100012.txt", 111.0, 50)
+    snapshots = OsCpuAnalyzer.find_snapshots(str(tmp_path / "threaddump_42_2024-05-01-100000.txt"))
+    assert len(snapshots) == 2
@@ -0,0 +1,28 @@
+import time
+
+from threaddump_analyzer import ThreadCpuDelta, ThreadInfo, ThreadPoolNormalizer, ThreadPoolSummary
+
+
+def test_pool_names():
+    normalizer = ThreadPoolNormalizer()
+    assert normalizer.pool_of("pulsar-io-4-12") == "pulsar-io"
+    assert normalizer.pool_of("ForkJoinPool.commonPool-worker-3") == "ForkJoinPool.commonPool-worker"
+    assert normalizer.pool_of("BookKeeperClientWorker-OrderedExecutor-0-0") == "BookKeeperClientWorker-OrderedExecutor"
+    assert normalizer.pool_of("Thread-17") == "Thread"
+    assert normalizer.pool_of("main") == "main"
+
+
+def test_long_digit_run_normalized_in_linear_time():
+    name = "worker-" + "1" * 2000 + "x"
+    started = time.perf_counter()
+    assert ThreadPoolNormalizer().pool_of(name) == name
+    assert ThreadPoolNormalizer().pool_of("worker-" + "1" * 2000) == "worker"
+    assert time.perf_counter() - started < 1
+
+
+def test_cpu_delta_of_pool_missing_from_last_dump():
+    last_dump = [ThreadInfo(name="pulsar-io-1-1", state="RUNNABLE", cpu_time="2000")]
+    deltas = [ThreadCpuDelta(last_dump[0], 1000, 2000, 10),
+              ThreadCpuDelta(ThreadInfo(name="temp-worker-1", state="RUNNABLE", cpu_time="500"), 0, 500, 5)]
+    summary = ThreadPoolSummary(last_dump, cpu_deltas=deltas)
+    assert [(stats.pool, stats.cpu_rate) for stats in summary.pools] == [("pulsar-io", 100.0)]
@@ -0,0 +1,44 @@
+import io
+import re
+
+import pytest
+
+from threaddump_analyzer import ThreadDumpAnalyzer, iter_log_dumps
+from threaddump_benchmark import DumpGenerator, DumpSpec
+
+JNI_LINES = {8: "JNI global references: 1234", 17: "JNI global refs: 1234, weak refs: 0"}
+
+
+def generate(spec: DumpSpec) -> str:
+    out = io.StringIO()
+    DumpGenerator(spec).generate(out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("jdk", [8, 17])
+def test_deadlock_reports_follow_jni_line(jdk):
+    text = generate(DumpSpec(threads=300, depth=8, deadlocks=2, jdk=jdk))
+    lines = text.splitlines()
+    jni_index = lines.index(JNI_LINES[jdk])
+    reports = [index for index, line in enumerate(lines) if line == "Found one Java-level deadlock:"]
+    assert len(reports) == 2 and all(index > jni_index for index in reports)
+
+
+@pytest.mark.parametrize("jdk", [8, 17])
+def test_unique_nids(jdk):
+    text = generate(DumpSpec(threads=300, depth=8, deadlocks=2, jdk=jdk))
+    nids = re.findall(r' nid=(0x[0-9a-f]+) ', text)
+    assert len(nids) == 301 and len(set(nids)) == len(nids)
+
+
+@pytest.mark.parametrize("jdk", [8, 17])
+def test_deadlocks_of_dump_in_log(tmp_path, jdk):
+    log = tmp_path / "broker.log"
+    dump = generate(DumpSpec(threads=100, depth=8, deadlocks=2, jdk=jdk))
+    log.write_text("2024-05-01T09:59:59,000+0000 [main] INFO  org.apache.pulsar.Broker - started\n" + dump +
+                   "2024-05-01T10:00:01,000+0000 [main] INFO  org.apache.pulsar.Broker - still running\n")
+    (_, _, lines), = iter_log_dumps(str(log))
+    analyzer = ThreadDumpAnalyzer(str(log))
+    analyzer.parse_lines(lines)
+    assert len(analyzer.deadlocks) == 2
+    assert len(analyzer.threads) == 100